@@ -0,0 +1,197 @@
+import os
+import glob
+import argparse
+import numpy as np
+
+from AuditTrailTimeseries import CATEGORIES, loadTimeseries, parseTimeseries
+from AuditTrailBundle import OutputBundle
+
+"""
+Time binned activity profiles of analyzed audit trails.
+
+activityHistogram turns the spans of a time series (see AuditTrailTimeseries, the _timeseries.bin output of the
+analysis) into a (bins x categories) matrix: entry [b, c] is how many seconds of bin b (binSeconds long) went to
+category c (readDrawingTime, sketchCreateTime, featureEditTime, ...). The bins are counted from the start of the
+trail's first timed action (span) and end with the bin holding the end of its last one, NOT from "Open document" to
+"Close document": the time series doesn't have the session's start and end, so bin 0 of every trail is its first timed
+action (usually the part studio being opened, a few seconds after "Open document"). A span that crosses bin edges is
+split across the bins it covers, so every row adds up to at most binSeconds per category and the whole matrix adds up
+to the category totals of the database row (partstudioTime overlaps with the create/edit/cancel categories, like it
+does there). The binning is done for all the spans at once: the partial first and last bins of every span and the full
+bins in between (as a difference array) go through one np.bincount each.
+
+cohortTensor stacks the matrices of many audit trails into one (trails x bins x categories) array, aligned on their
+first timed action and padded with zeros after the end of the shorter sessions (nBins says where each one ends), so
+cohort profiles and stats are plain numpy reductions over axis 0 (see cohortMean).
+
+Usage:
+    python AuditTrailActivity.py [--bin 60] [--bundle Analysis_output/run.sqlite] [--plot] [names ...]
+builds the histograms of every analyzed audit trail in Analysis_output (or the bundle) and saves the cohort tensor to
+Analysis_output/Activity_<bin>s.npz (tensor, nBins, names, categories, binSeconds)
+"""
+
+
+def activityHistogram(start, duration, category, nCategories=len(CATEGORIES), binSeconds=60, origin=None,
+                      nBins=None):
+    """
+    Seconds of every category in every time bin
+    Args:
+        start: span start times (seconds since 1970-01-01)
+        duration: span durations in seconds
+        category: span category codes
+        nCategories: number of categories (columns)
+        binSeconds: length of a bin
+        origin: time the first bin starts at, defaults to the earliest span start
+        nBins: number of bins (rows), defaults to enough to hold every span. Time after the last bin is dropped
+    Returns:
+        (nBins x nCategories) float64 array of seconds
+    """
+    start = np.asarray(start, dtype=np.int64)
+    end = start + np.asarray(duration, dtype=np.int64)
+    category = np.asarray(category, dtype=np.int64)
+    if origin is None:
+        origin = int(start.min()) if len(start) else 0
+    start = start - origin
+    end = end - origin
+    if nBins is None:
+        nBins = int(-(-end.max() // binSeconds)) if len(end) else 0
+        nBins = max(nBins, 1)
+    # anything outside of [origin, origin + nBins * binSeconds) is cut off
+    limit = nBins * binSeconds
+    start = np.clip(start, 0, limit)
+    end = np.clip(end, 0, limit)
+    keep = end > start
+    start, end, category = start[keep], end[keep], category[keep]
+
+    firstBin = start // binSeconds
+    # bin holding the span's last second
+    lastBin = (end - 1) // binSeconds
+    sameBin = firstBin == lastBin
+    size = (nBins + 1) * nCategories
+
+    # spans inside one bin, and the partial first/last bins of the others
+    seconds = np.bincount(firstBin * nCategories + category,
+                          weights=np.where(sameBin, end - start, (firstBin + 1) * binSeconds - start), minlength=size)
+    seconds += np.bincount((lastBin * nCategories + category)[~sameBin],
+                           weights=(end - lastBin * binSeconds)[~sameBin], minlength=size)
+    # the full bins in between: +1 from the bin after the first, -1 from the last bin, summed up over the bins
+    spanning = ~sameBin
+    fullBins = np.bincount(((firstBin + 1) * nCategories + category)[spanning], minlength=size) - \
+        np.bincount((lastBin * nCategories + category)[spanning], minlength=size)
+    fullBins = np.cumsum(fullBins.reshape(nBins + 1, nCategories), axis=0)
+    return seconds.reshape(nBins + 1, nCategories)[:nBins] + fullBins[:nBins] * binSeconds
+
+
+def trailActivity(timeseries, binSeconds=60, categories=CATEGORIES, origin=None, nBins=None):
+    """
+    Activity histogram of one time series (AuditTrailTimeseries.Timeseries), with the columns in the order of
+    categories (categories the time series doesn't have are all zeros, ones categories doesn't have are left out)
+    The bins start at origin, which defaults to the start of the first span (not the session start, see module
+    docstring), pass the session start as origin (seconds since 1970-01-01) to count from "Open document" instead
+    """
+    columns = {name: code for code, name in enumerate(categories)}
+    # the time series' own category codes -> columns
+    remap = np.array([columns.get(name, -1) for name in timeseries.categories] or [-1], dtype=np.int64)
+    category = remap[timeseries.category]
+    known = category >= 0
+    return activityHistogram(timeseries.start[known], timeseries.duration[known], category[known], len(categories),
+                             binSeconds, origin if origin is not None else (int(timeseries.start.min())
+                                                                            if len(timeseries) else 0), nBins)
+
+
+def cohortTensor(histograms):
+    """
+    Stacks activity histograms (same bin length and columns) into one array
+    Returns:
+        (tensor, nBins): (trails x bins x categories) float64 array, zero padded at the end, and the number of bins of
+        each trail
+    """
+    nBins = np.array([len(histogram) for histogram in histograms], dtype=np.int64)
+    nCategories = histograms[0].shape[1] if histograms else len(CATEGORIES)
+    tensor = np.zeros((len(histograms), int(nBins.max()) if len(nBins) else 0, nCategories), dtype=np.float64)
+    for trail, histogram in enumerate(histograms):
+        tensor[trail, :len(histogram)] = histogram
+    return tensor, nBins
+
+
+def cohortMean(tensor, nBins):
+    """
+    Mean seconds per category in every bin over the trails whose sessions are still going at that bin
+    Returns (bins x categories) array (and the number of trails behind every bin)
+    """
+    active = np.arange(tensor.shape[1])[None, :] < nBins[:, None]
+    counts = active.sum(axis=0)
+    return tensor.sum(axis=0) / np.maximum(counts, 1)[:, None], counts
+
+
+def loadHistograms(names=None, binSeconds=60, bundle=None, directory="Analysis_output"):
+    """
+    Activity histograms of analyzed audit trails, from their _timeseries.bin files in directory or from an output
+    bundle (see AuditTrailBundle)
+    Args:
+        names: trail names (raw audit trail file name without its extension, e.g. "ID01_BT_Task1"), defaults to all
+    Returns:
+        (names, histograms)
+    """
+    histograms = []
+    if bundle is not None:
+        with OutputBundle(bundle) as outputBundle:
+            names = names or outputBundle.trails()
+            for name in names:
+                histograms.append(trailActivity(parseTimeseries(outputBundle.get(name, "_timeseries.bin")),
+                                                binSeconds))
+        return names, histograms
+    if not names:
+        suffix = "_cleaned_timeseries.bin"
+        names = sorted(os.path.basename(path)[:-len(suffix)] for path in glob.glob(os.path.join(directory,
+                                                                                              "*" + suffix)))
+    for name in names:
+        histograms.append(trailActivity(loadTimeseries(os.path.join(directory, name + "_cleaned_timeseries.bin")),
+                                        binSeconds))
+    return names, histograms
+
+
+def plotActivity(histogram, binSeconds, title, saveFigLocation, categories=CATEGORIES,
+                 skip=("partstudioTime",)):
+    """
+    Stacked area plot of an activity histogram (one trail's or a cohort mean), minutes on the x axis. partstudioTime
+    is left out by default since it overlaps with the create/edit categories
+    """
+    # matplotlib is slow to import, so it's only loaded once a plot is actually needed
+    import matplotlib.pyplot as plt
+
+    columns = [code for code, name in enumerate(categories) if name not in skip and histogram[:, code].any()]
+    minutes = np.arange(len(histogram)) * binSeconds / 60
+    fig, ax = plt.subplots(figsize=(10, 5))
+    ax.stackplot(minutes, (histogram[:, columns] / binSeconds).T, labels=[categories[code] for code in columns],
+                 step="post")
+    ax.set_xlabel("Minutes from the first timed action")
+    ax.set_ylabel("Share of each " + str(binSeconds) + " s bin")
+    ax.set_title(title)
+    ax.legend(loc="upper left", bbox_to_anchor=(1, 1), fontsize="small")
+    fig.tight_layout()
+    fig.savefig(saveFigLocation)
+    plt.close(fig)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time binned activity histograms of the analyzed audit trails")
+    parser.add_argument("names", nargs="*", help="only these trails (raw audit trail file names without extension)")
+    parser.add_argument("--bin", type=int, default=60, help="bin length in seconds")
+    parser.add_argument("--bundle", default=None, help="read the time series from this output bundle")
+    parser.add_argument("--plot", action="store_true", help="also plot the cohort mean profile")
+    args = parser.parse_args()
+
+    names, histograms = loadHistograms(args.names or None, args.bin, args.bundle)
+    if not histograms:
+        raise SystemExit("No analyzed audit trails found")
+    tensor, nBins = cohortTensor(histograms)
+    outFileName = os.path.join("Analysis_output", "Activity_" + str(args.bin) + "s.npz")
+    np.savez_compressed(outFileName, tensor=tensor, nBins=nBins, names=np.array(names), categories=np.array(CATEGORIES),
+                        binSeconds=args.bin)
+    print("Saved the activity of " + str(len(names)) + " audit trails (" + str(tensor.shape[1]) + " bins of " +
+          str(args.bin) + " s) to " + outFileName)
+    if args.plot:
+        mean, counts = cohortMean(tensor, nBins)
+        plotActivity(mean, args.bin, "Cohort mean activity (" + str(len(names)) + " audit trails)",
+                     os.path.join("Analysis_output", "Activity_" + str(args.bin) + "s.png"))
@@ -2,10 +2,21 @@ import csv
 import os
 import sys
 import datetime
-import matplotlib.pyplot as plt
 import numpy as np
 import json
 import copy
+from AuditTrailTable import AuditTrail, AuditTrailIntegrityError, parseEventTimeChars
+from AuditTrailReader import iterAuditTrailRowsReversed, MappedCsv, iterXlsxRows
+from AuditTrailPairing import pairSpans
+from AuditTrailClassifier import EventType, Marker, MarkerWindow, defaultClassifier
+from AuditTrailDatabase import MetricsStore
+from AuditTrailManifest import Manifest, fileHash
+from AuditTrailTimeseries import CATEGORIES, EPOCH, writeTimeseries, categoryTotals
+from AuditTrailBundle import openOutput
+from AuditTrailTiming import stage, count
+import AuditTrailTiming
+from AuditTrailCache import isCacheFile, baseName, cacheFileName, withoutCacheCopies, saveTrail, loadTrail, \
+    loadCachedTrail
 
 sys.path.append("API_Related_Files")
 #import API_Related_Files.API_Call_Methods
@@ -16,15 +27,18 @@ The default data format for audit trails is:
 
 Process to download audit trails from Onshape
 Tip: 
-- Download as an excel file from Onshape, make any necessary edits to the audit trail (cleaning up, deleting/fixing entries, etc) then save as csv file before running analysis on it. Excel sometimes defaults to stripping the seconds off of the event time entries when saving as csv depending on your system time format settings.
+- Download as an excel file from Onshape and put it in Participant_audit_trails as is, .xlsx files are read directly (needs openpyxl, see AuditTrailReader.iterXlsxRows) with the event times taken from the cells' own dates.
+- If the audit trail needs any edits (cleaning up, deleting/fixing entries, etc) they can be made in the .xlsx file, or save it as a csv file. Excel sometimes defaults to stripping the seconds off of the event time entries when saving as csv depending on your system time format settings.
 
-We can use datetime to convert the "event time" column strings to datetime objects: 
+The "event time" column strings are converted to epoch seconds (all at once) with AuditTrailTable.parseEventTimes, 
+which is equivalent to but much faster than calling on every row: 
 datetime.datetime.strptime(row[1], "%Y-%m-%d %H:%M:%S")
 
 Current limitations:
 - currently searching only one entry forward and backwards of "insert feature" and "Edit : XXX" entries for 
     "add of modify a sketch" to determine whether the feature inserted/edited was a sketch. This looks like it may catch
     vast majority of cases but still not fool proof. Searching 2 forward/back might introduce other unwanted problems though
+    (the window can be changed with SKETCH_WINDOW/SKETCH_SAME_TAB below, see AuditTrailClassifier.MarkerWindow)
 - currently lumping time spent on edits with no changes (clicked into edit something then clicked green checkmark without having made any actual changes) together with cancelledEditTime  
 
 Key assumptions: 
@@ -33,115 +47,285 @@ Key assumptions:
 (Currently this requires manually editing the csv file once downloaded from Onshape) 
 """
 
+# version of the analysis recorded in the manifest (see AuditTrailManifest), bump this whenever a change would change
+# the outputs so that every audit trail gets analyzed again on the next run
+ANALYZER_VERSION = "3"
 
+# entries with any of these in their description are removed while cleaning (see cleanRows)
+REMOVED_DESCRIPTIONS = ["Commit add or edit", "Update Part Metadata", "Delete part studio feature"]
 
-def read_file(fileName) -> None:
-    """
-    This function reads audit trails data and performs basic audit trail integrity checks.
-    Currently, it checks the indices for being in order and date and time matches the expected format,
-    then creates a cleaned version and outputs that as a separate file
-    """
+# Global variable for controlling how long actions without start & end times should be recorded as (how many seconds)
+noTimeDeltaFeatures = 1 #seconds
+# these features are: operationsCancelled, movedRollbackBar, movedFeature, undoRedo, createFolder, renameFeature, showHide
 
-    # To store all data in the audit trail csv file
-    orig_data = []
+# an inserted/edited feature is a sketch if there's an "Add or modify a sketch" entry within SKETCH_WINDOW entries of
+# its "Insert feature"/"Edit : XXX" entry (only counting entries in the same tab with SKETCH_SAME_TAB)
+# changing these changes the outputs, bump ANALYZER_VERSION (or run with --force) after changing them
+SKETCH_WINDOW = 1
+SKETCH_SAME_TAB = False
 
-    # Builds the filepath by appending the file name to the current work directory
-    # The raw participant audit trails should be stored in a subfolder called "Participant_audit_trails"
-    filePathName = os.path.join(os.getcwd(), "Participant_audit_trails", fileName)
-    # print("Opening file: " + filePathName)
 
-    # Open csv file and copy all rows into "orig_data"
+def iterAuditTrailRows(filePathName):
+    """
+    Generator that yields the rows of an audit trail csv file one at a time (header row first), so the file never has
+    to be held in memory as raw text on top of the parsed rows
+    """
     with open(filePathName, 'r') as csv_file:
         data_reader = csv.reader(csv_file)
         for row in data_reader:
-            orig_data.append(row)
+            yield row
 
-    # Check that index column starts at 1 and doesn't skip any numbers
-    if str(orig_data[1][0]) != "1":
-        print("Index does not start with 1!")
-        return -1
-    # Next, check if index is in order starting from 1
-    totalEntries = len(orig_data) - 1
-    # Note: we're doing 1 less than len(orig_data) to not count the top row as an entry since that's the column header
 
-    for index in range(1, totalEntries):
-        # print("Checking index: " + str(index) + "  dataset index: " + str(orig_data[index][0]))
-        if str(orig_data[index][0]) != str(index):
+def checkIndices(rows):
+    """
+    Generator that passes the audit trail rows straight through while checking that the index column starts at 1 and
+    doesn't skip any numbers. Raises AuditTrailIntegrityError at the first row that fails the check
+    """
+    for index, row in enumerate(rows):
+        # first row is the column header, nothing to check
+        if index == 0:
+            yield row
+            continue
+        if index == 1 and str(row[0]) != "1":
+            print("Index does not start with 1!")
+            raise AuditTrailIntegrityError("Index does not start with 1")
+        if str(row[0]) != str(index):
             print("Index not in order!")
-            print("Expected index " + str(index) + " Dataset index " + str(orig_data[index][0]))
-            return -1
-        else:
-            pass
+            print("Expected index " + str(index) + " Dataset index " + str(row[0]))
+            raise AuditTrailIntegrityError("Index not in order at " + str(index))
+        yield row
+
+
+def checkIndicesDescending(rows):
+    """
+    Same checks as checkIndices, for rows that come oldest first (see AuditTrailReader), i.e. the index column should
+    count down by one on every row and end at 1. Raises AuditTrailIntegrityError at the first row that fails the check
+    """
+    expectedIndex = None
+    for position, row in enumerate(rows):
+        # first row is the column header, nothing to check
+        if position == 0:
+            yield row
+            continue
+        # the oldest entry has the largest index, everything else counts down from there
+        if expectedIndex is None and str(row[0]).isdigit():
+            expectedIndex = int(row[0])
+        if str(row[0]) != str(expectedIndex):
+            print("Index not in order!")
+            print("Expected index " + str(expectedIndex) + " Dataset index " + str(row[0]))
+            raise AuditTrailIntegrityError("Index not in order at " + str(expectedIndex))
+        expectedIndex -= 1
+        yield row
+    # the newest entry (last one read) should have had index 1
+    if expectedIndex is not None and expectedIndex != 0:
+        print("Index does not start with 1!")
+        raise AuditTrailIntegrityError("Index does not start with 1")
+
+
+def checkMappedIndices(mapped):
+    """
+    Same checks as checkIndices for a memory mapped audit trail (see AuditTrailReader.MappedCsv), done on the whole
+    index column at once. Raises AuditTrailIntegrityError at the first row that fails the check
+    """
+    index, valid = mapped.integers(0)
+    bad = np.flatnonzero(~valid | (index != np.arange(1, len(mapped) + 1)))
+    if len(bad) == 0:
+        return
+    if bad[0] == 0:
+        print("Index does not start with 1!")
+        raise AuditTrailIntegrityError("Index does not start with 1")
+    print("Index not in order!")
+    print("Expected index " + str(bad[0] + 1) + " Dataset index " + mapped.field(bad[0], 0))
+    raise AuditTrailIntegrityError("Index not in order at " + str(bad[0] + 1))
+
+
+def read_file(fileName, writeCleaned=True, saveToDatabase=True, plots=True, digest=None, useCache=True, outputs=None):
+    """
+    This function reads audit trails data and performs basic audit trail integrity checks.
+    Currently, it checks the indices for being in order and date and time matches the expected format.
+    The rows are streamed through the checks, cleaning and analysis in one pass without any intermediate files,
+    the cleaned (and annotated) version of the audit trail is only written out at the end if writeCleaned is True.
+    The file is memory mapped and only the columns the analysis needs are pulled out of it (see
+    AuditTrailReader.MappedCsv). If the file can't be read that way (rows with a different number of fields than the
+    header), it's read backwards instead (oldest event first, see AuditTrailReader) so the rows go straight into the
+    chronological event table without the whole export having to be held in memory
+    Excel exports (.xlsx) are streamed row by row from the workbook instead (see AuditTrailReader.iterXlsxRows)
+    The cleaned event table is cached next to the audit trail (see AuditTrailCache), if the audit trail hasn't changed
+    since it was cached it's loaded from there and none of the above is needed. Cache files (.trail.npz) can also be
+    given as the audit trail to analyze
+    digest is the content hash of the audit trail if it's already known (see AuditTrailManifest.fileHash), useCache
+    False always reads the audit trail itself (the cache still gets written)
+    outputs: dict to collect the output files in instead of writing them (see analyzeAuditTrail)
+    Returns the audit trail's database row (see analyzeAuditTrail), or -1 if the audit trail fails the integrity checks
+    """
 
-    # Optional:
-    # print("INFO: Original input file indices check out")
-    # print("INFO: Number of entries in dataset: " + str(totalEntries))
+    try:
+        trail, cache = readCleanedTrail(fileName, digest, useCache)
+    except AuditTrailIntegrityError:
+        return -1
+    # call function to analyze the cleaned audit trail
+    return cleanCsv(fileName, trail, writeCleaned, saveToDatabase, plots, cache=cache, outputs=outputs)
 
-    # call function to clean the csv
-    cleanCsv(fileName, orig_data)
+def readCleanedTrail(fileName, digest=None, useCache=True):
+    """
+    Reads an audit trail from Participant_audit_trails and cleans it without analyzing it (see read_file for how the
+    different formats are read). Raises AuditTrailIntegrityError if it fails the index checks
+    Returns:
+        (trail, cache): the cleaned AuditTrail table, and where it should be cached once analyzed (cache file path,
+        content hash of the audit trail, analyzer version of the current cache or None if there isn't one, see
+        cleanCsv), None if the audit trail is a cache file itself
+    """
 
-    return None
+    # Builds the filepath by appending the file name to the current work directory
+    # The raw participant audit trails should be stored in a subfolder called "Participant_audit_trails"
+    filePathName = os.path.join(os.getcwd(), "Participant_audit_trails", fileName)
+    # print("Opening file: " + filePathName)
 
-def cleanCsv(fileName, orig_data):
+    if isCacheFile(fileName):
+        # already cleaned, see AuditTrailCache
+        trail, metadata = loadTrail(filePathName, annotations=False)
+        return trail, None
+
+    if digest is None:
+        with stage("hash"):
+            digest = fileHash(filePathName)
+    cache = (cacheFileName(filePathName), digest, None)
+    if useCache:
+        with stage("cacheLoad"):
+            cached = loadCachedTrail(filePathName, digest, REMOVED_DESCRIPTIONS)
+        if cached is not None:
+            trail, analyzerVersion = cached
+            return trail, cache[:2] + (analyzerVersion,)
+
+    # parsing and cleaning happen together (the rows are streamed through both), the cleaning (and building the event
+    # table) is timed on its own inside of it (clean), and the event time parsing inside of that (parseTimes)
+    with stage("parse"):
+        if os.path.splitext(fileName)[1].lower() == ".xlsx":
+            return cleanTrail(checkIndices(iterXlsxRows(filePathName))), cache
+
+        with MappedCsv(filePathName) as mapped:
+            if mapped.regular:
+                count("rawRows", len(mapped))
+                checkMappedIndices(mapped)
+                return cleanTrail(mapped), cache
+
+        # rows are pulled through the index check -> cleaning -> event table chain lazily, nothing is read until the
+        # table starts consuming the rows
+        rows = checkIndicesDescending(iterAuditTrailRowsReversed(filePathName))
+        return cleanTrail(rows, oldestFirst=True), cache
+
+def cleanRows(orig_data, reindex=True):
     """
-    Clean CSV file to get rid of useless entries
+    Generator that cleans the audit trail rows to get rid of useless entries
     Entries that get deleted:
         - "Update Part Metadata"
         - "Commit add or edit of part studio feature"
+        - "Delete part studio feature"
     Purposefully NOT removing "Add or modify a sketch" entries since we'll be using those to identify if an inserted/edited
     feature was a sketch or not during analysis (hopefully this will not be necessary in the future if Onshape updates the
     audit trails)
+    With reindex=False the kept rows keep their original index (for rows coming oldest first, where the new index
+    isn't known until the end, see AuditTrail.fromRows renumber)
     """
 
-    # First, create the "filename_cleaned" string, the [:-4] gets rid of the ".csv" part,
-    # slotting "_cleaned" before the .csv part. We will save a separate "cleaned" audit trail as output
-    cleanedFileName = fileName[:-4] + "_cleaned" + fileName[-4:]
-    #print("Output file name= " + cleanedFileName)
-
-    #parentDirectory = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
-    #outFilePath = os.path.join(parentDirectory, "Participant_audit_trails", cleanedFileName)
-    outFilePath = os.path.join(os.getcwd(), "Participant_audit_trails", cleanedFileName)
-    #print("Output file path: ", outFilePath)
+    # if lines don't contain "commit add" or "metadata" then pass the row on
+    # (the event time format is checked once for the whole column with parseEventTimes during analysis)
+    goodEntries = 0
 
-    # if lines don't contain "commit add" or "metadata" then write the row into the output csv
-    # at the same time checks each row to make sure time format is as expected
-    with open(outFilePath, "w", newline="") as out_file:
-        writer = csv.writer(out_file)
-
-        goodEntries = 0
-        # for loop iteration index to be able to display which entry failed the time format check
-
-        for index, row in enumerate(orig_data):
-            if "Commit add or edit" in row[5] or "Update Part Metadata" in row[5] or "Delete part studio feature" in row[5]:
-                pass
-            else:
-                # if not those above, then make a copy of this row, re-index, then write to output
-                # also re-index while writing the rows, top row (row 0) should say "Index"
-                rowCopy = copy.copy(row)
-                rowCopy[0]=goodEntries
-                if goodEntries == 0:
-                    rowCopy[0] = "Index"
-                writer.writerow(rowCopy)
-                goodEntries += 1
-
-
-            if index == 0:
-                # first row is the text "Index" so don't check for this row
-                pass
-            else:
-                try:
-                    row[1] = datetime.datetime.strptime(row[1], "%Y-%m-%d %H:%M:%S")
-                except ValueError:
-                    print("Issue with with date time entry at index: " + str(index))
-                    pass
-                #print(row[1], " type: ", type(row[1]))
+    for row in orig_data:
+        if any(removed in row[5] for removed in REMOVED_DESCRIPTIONS):
+            pass
+        else:
+            # if not those above, then make a copy of this row and re-index it
+            # top row (row 0) should say "Index"
+            rowCopy = copy.copy(row)
+            if reindex:
+                rowCopy[0] = str(goodEntries)
+            if goodEntries == 0:
+                rowCopy[0] = "Index"
+            yield rowCopy
+            goodEntries += 1
+
+def cleanMappedCsv(mapped):
+    """
+    Cleaning (same entries removed as cleanRows) for a memory mapped audit trail (see AuditTrailReader.MappedCsv),
+    builds the cleaned event table straight from the mapped columns: the removed entries are found from the distinct
+    descriptions only, and only the columns the table needs are materialized
+    """
+    descriptionCodes, descriptions = mapped.categories(5)
+    removed = np.array([any(text in description for text in REMOVED_DESCRIPTIONS) for description in descriptions],
+                       dtype=bool)
+    keep = ~removed[descriptionCodes] if len(descriptions) else np.zeros(len(mapped), dtype=bool)
+
+    # all columns in chronological order (the file is newest event first)
+    columns = []
+    for codes, categories in [mapped.categories(2), mapped.categories(3), mapped.categories(4),
+                              (descriptionCodes, descriptions)]:
+        codes = codes[keep][::-1]
+        # drop the categories only the removed entries used
+        used, codes = np.unique(codes, return_inverse=True)
+        columns.append((codes.astype(np.int32).ravel(), [categories[code] for code in used.tolist()]))
+
+    with stage("parseTimes"):
+        chars, lengths = mapped.fixedWidth(1, 19)
+        epochSeconds, valid = parseEventTimeChars(chars[keep][::-1], lengths[keep][::-1] == 19)
+
+    header = list(mapped.header)
+    header[0] = "Index"
+    goodEntries = int(np.count_nonzero(keep))
+    trail = AuditTrail(header, np.arange(goodEntries, 0, -1), epochSeconds, *columns)
+    trail.malformedRows = [int(trail.index[position]) for position in np.flatnonzero(~valid)]
+    return trail
+
+def cleanTrail(orig_data, oldestFirst=False):
+    """
+    The cleaned event table of an audit trail (see cleanRows), orig_data and oldestFirst are as for cleanCsv
+    Timed as the "clean" stage. The rows of the streamed readers are only read while they're being cleaned, so for
+    those the reading happens inside of this stage too
+    """
+    if isinstance(orig_data, AuditTrail):
+        return orig_data
+    with stage("clean"):
+        if isinstance(orig_data, MappedCsv):
+            return cleanMappedCsv(orig_data)
+        if oldestFirst:
+            return AuditTrail.fromRows(cleanRows(orig_data, reindex=False), oldestFirst=True, renumber=True)
+        return AuditTrail.fromRows(cleanRows(orig_data))
+
+def cleanCsv(fileName, orig_data, writeCleaned=True, saveToDatabase=True, plots=True, oldestFirst=False, cache=None,
+             outputs=None):
+    """
+    Clean the audit trail rows (see cleanRows) and pass them directly to the analysis
+    The cleaned audit trail is no longer written to disk here, analyzeAuditTrail writes it once at the end (together
+    with the identified features) if writeCleaned is True
+    If oldestFirst is True the rows come oldest event first (see AuditTrailReader), they're built into the event table
+    here and renumbered like a cleaned audit trail.
+    orig_data can also be a memory mapped audit trail (AuditTrailReader.MappedCsv), see cleanMappedCsv, or an
+    already cleaned AuditTrail table (e.g. from the cache)
+    cache: (cache file path, content hash of the raw audit trail, analyzer version of the current cache there or None),
+           the cleaned table is saved there after the analysis (see AuditTrailCache), unless the current cache already
+           has the same annotations (e.g. it's what the table was just loaded from)
+    outputs: dict to collect the output files in instead of writing them (see analyzeAuditTrail)
+    """
 
-    #print("INFO: Number of entries after scrubbing: " + str(goodEntries-1))
+    # First, create the "filename_cleaned" string, baseName gets rid of the ".csv" (or ".xlsx", ".trail.npz") part,
+    # slotting "_cleaned" before the .csv part. We will save a separate "cleaned" audit trail as output
+    # (always a csv, whatever the raw audit trail was)
+    cleanedFileName = baseName(fileName) + "_cleaned.csv"
+    #print("Output file name= " + cleanedFileName)
 
-    # now run the analyze function on the cleaned csv that's just been saved
-    analyzeAuditTrail(cleanedFileName)
+    cleanedTrail = cleanTrail(orig_data, oldestFirst)
 
-    return None
+    # now run the analyze function on the cleaned table
+    count("events", len(cleanedTrail))
+    with stage("analysis"):
+        rowEntry = analyzeAuditTrail(cleanedFileName, cleanedTrail, writeCleaned, saveToDatabase, plots, outputs)
+    # the annotation columns are only worth anything if the analysis got through
+    analyzerVersion = ANALYZER_VERSION if rowEntry != -1 else ""
+    if cache is not None and cache[2] != analyzerVersion:
+        with stage("cacheWrite"):
+            saveTrail(cleanedTrail, cache[0], cache[1], REMOVED_DESCRIPTIONS, analyzerVersion)
+    return rowEntry
 
 def timeConverter(totalTime):
     ### This function takes in a datetime object, converts it into number of seconds,
@@ -153,546 +337,452 @@ def timeConverter(totalTime):
     seconds = str(int(minSec[1]))
     return [minutes,seconds]
 
-def analyzeAuditTrail(fileName):
+def openDatabase():
     """
-    Function to identify the relevant feature for each audit trail entry based on the description
-    Args:
-        fileName:
-
-    Returns:
+    Opens the metrics database in Analysis_output (see AuditTrailDatabase), the first time it's created any rows
+    already in Audit_Trail_Database.csv are imported
     """
+    return MetricsStore(os.path.join(os.getcwd(), "Analysis_output", "Audit_Trail_Database.sqlite"),
+                        os.path.join(os.getcwd(), "Analysis_output", "Audit_Trail_Database.csv"))
 
-    #fileName += ".csv"
-    # current directory is "API_Rel._Files", need to step one directory up first
-    # os.pardir adds the ".." to the end of the current wd, then abspath fines the actual path of the parent dir
-    #parentDirectory = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
-    # stepping into the participant audit trails folder, tacking on file name, with .csv tacked on already
-    #filePathName = os.path.join(parentDirectory, "Participant_audit_trails", fileName)
-    # updated file path with main python file at the root of the project folder
-    filePathName = os.path.join(os.getcwd(), "Participant_audit_trails", fileName)
-    #print("fileName: " + fileName)
-    #print("filePathName: " + filePathName)
-    #print("Opening file: " + filePathName)
-
-    data = []  # to store cleaned audit trail data
-
-    # load in data (should be the cleaned .csv)
-    with open(filePathName, 'r') as csv_file:
-        data_reader = csv.reader(csv_file)
-        for row in data_reader:
-            data.append(row)
-
-    fileName = fileName.removesuffix(".csv")  # fileName = XX_IDXX_cleaned.csv
-
-    insertFeatureIndices = []
-    editFeatureIndices = []
-    skippedFeatures = []
-    sketchesCreatedNames = []
-
-    # intialize counters (counts instances)
-    sketchesCreated = featuresCreated = sketchesEdited = featuresEdited = switchedToDrawing = 0
-
-    # need to initialize the time counters to 0 seconds first
-    sketchCreateTime = featureCreateTime = sketchEditTime = featureEditTime = \
-        readDrawingTime = partstudioTime = datetime.timedelta(seconds=0)
-    cancelledCreateTime = cancelledEditTime = datetime.timedelta(seconds=0)
+def updateDatabase(rowEntries):
+    """
+    Adds the rows (as returned by analyzeAuditTrail) to the metrics database, writing over any existing entry for the
+    same file name. Call exportDatabase afterwards to update Audit_Trail_Database.csv
+    """
+    with openDatabase() as store:
+        store.upsert(rowEntries)
 
-    # the following counters are operations with no start/end times (noTimeDelta features)
-    movedFeature = movedRollbackBar = operationsCancelled = undoRedo = createFolder = \
-        renameFeature = showHide = deletedFeature = 0
+def exportDatabase():
+    """
+    Writes the metrics database out to Analysis_output/Audit_Trail_Database.csv (same layout as always), only needs
+    to be done once after all the audit trails are analyzed
+    """
+    with openDatabase() as store:
+        store.exportCsv(os.path.join(os.getcwd(), "Analysis_output", "Audit_Trail_Database.csv"))
 
-    # Global variable for controlling how long actions without start & end times should be recorded as (how many seconds)
-    noTimeDeltaFeatures = 1 #seconds
-    # these features are: operationsCancelled, movedRollbackBar, movedFeature, undoRedo, createFolder, renameFeature, showHide
+def outputFiles(fileName):
+    """
+    Paths (relative to the current directory) of the files analyzing a raw audit trail produces, the skipped entries
+    json is only there if some entries were skipped
+    """
+    cleanedName = baseName(fileName) + "_cleaned"
+    return [os.path.join("Participant_audit_trails", cleanedName + ".csv"),
+            os.path.join("Analysis_output", cleanedName + "_timeseries.json"),
+            os.path.join("Analysis_output", cleanedName + "_timeseries.bin"),
+            os.path.join("Analysis_output", cleanedName + "_HMM_List.json"),
+            os.path.join("Analysis_output", cleanedName + "_HMM_StartEnd.json"),
+            os.path.join("Analysis_output", cleanedName + "_skipped.json"),
+            os.path.join("Analysis_output", cleanedName + ".png")]
+
+def findChangedTrails(names, manifest, force=False, plots=True):
+    """
+    Splits the raw audit trails into the ones that need analyzing and the ones whose contents haven't changed since
+    they were last analyzed (same hash and analyzer version, outputs and database row still there)
+    Args:
+        names: raw audit trail file names in Participant_audit_trails
+        manifest: AuditTrailManifest.Manifest
+        force: analyze everything regardless
+        plots: whether plots are wanted, audit trails that were last analyzed without plots aren't skipped if they are
+    Returns:
+        (changed, unchanged): list of (name, content hash) to analyze, list of names to skip
+    """
+    changed = []
+    unchanged = []
+    with openDatabase() as store:
+        for name in names:
+            digest = fileHash(os.path.join(os.getcwd(), "Participant_audit_trails", name))
+            if not force and manifest.isCurrent(name, digest, plots) and store.get(baseName(name) + "_cleaned") is not None:
+                unchanged.append(name)
+            else:
+                changed.append((name, digest))
+    return changed, unchanged
 
-    # list for hidden markov model building
-    HMMList = []
+def startEndSequence(hmmSequence):
+    """
+    The HMM list with start and ends (written to XX_IDXX_cleaned_HMM_StartEnd.json) from the HMM sequence annotation
+    column of an analyzed audit trail, in chronological order
+    """
     HMMList_StartEnd = []
+    entriesToSkip = [""] #, "Close Drawing"] # can potentially exclude close drawing as well
 
-    ########################
-    # time_series array will be used to build the sequential list of actions
-    time_series = []
-
-    """
-    Each element in the time_series array has the format: 
-    (action type, start time of the action, time duration) 
+    for sequenceEntry in hmmSequence:
+        #if sequenceEntry:
+        if sequenceEntry not in entriesToSkip:
+            HMMList_StartEnd.append(sequenceEntry)
 
-    E.g.    ("sketch", datetime(00:05:15), datetime(00:00:20)) 
-            = did sketching starting at 5 min 15 sec for 20 seconds
+    # sometimes we will end up with "open" "open" "closed" "closed", should swap things around to be 2x "open" "closed"
+    for i in range(len(HMMList_StartEnd)-1):
+        current = HMMList_StartEnd[i]
+        next = HMMList_StartEnd[i+1]
+        #print(last)
+        if current == "Open Drawing" and next == "Open Drawing":
+            HMMList_StartEnd[i+1], HMMList_StartEnd[i+2] = HMMList_StartEnd[i+2], HMMList_StartEnd[i+1]
+            #print("Doubled up!")
+    return HMMList_StartEnd
 
-    All action_type: 
-    -- TO BE DOCUMENTED -- 
+class TrailAnalysis(object):
     """
-    ########################
-
-    # Convert every entry in the event time column from a string into a datetime object
-    # Also clear feature reference column (6) in case the file being read already has some existing data
-    for row in data[1:]: # skip top row since it's just labels
-        #print(str(len(row)))
-        row[1] = datetime.datetime.strptime(row[1], "%Y-%m-%d %H:%M:%S")
-        # the 7th and 8th column might be empty, if so, append a blank entry
-        try:
-            row[6] = ""
-            #print("old row len =" + str(len(row)))
-        except IndexError:
-            row.append("")
-        try:
-            row[7] = ""
-        except IndexError:
-            row.append("")
-            #print("new row len =" + str(len(row)))
-
-    # Dealing with the top header row
-    # Sometimes the header row will be missing entries, so checking for the proper length, if not, then append as needed
-    #print(data[0])
-    if len(data[0]) == 6:
-        #print("Len is 6")
-        data[0].append("")
-        data[0].append("")
-    elif len(row[0]) == 7:
-        #print("Len is 7")
-        data[0].append("")
-
-    # then rename row 7 and 8 with proper names
-    data[0][6] = "Feature Reference"
-    data[0][7] = "HMM Sequence"
-    #print(data[0])
-
-
-    # start range() at 1 to skip the top row, then reverse it to start from the bottom of the csv file
-    for i in reversed(range(1,len(data))):
-        #print("Currently on index: " + str(i))
-
+    The per entry part of analyzeAuditTrail: works out what every entry of an audit trail was (feature created/edited,
+    drawing read, ...), fills in its feature reference and HMM sequence annotations and records the timed actions
+    (spans) and HMM list entries it starts.
+    Every entry only looks at its own span (see AuditTrailPairing) and the entries right next to that span's end, so the
+    entries don't have to be analyzed in order: analyzeAuditTrail goes through them all in one go, the live mode (see
+    AuditTrailLive) analyzes each one as soon as the entries it depends on have come in.
+    Attributes:
+        spans: position -> (category code, duration in seconds, feature name or None) of the timed actions, see
+               addSpan, categoryCodes/categoryNames map the category codes to their names
+        hmm: position -> HMM list entry ("Create", "Revise", ...)
+        skippedFeatures: the entries that aren't accounted for by any of the checks
+    """
+    def __init__(self, eventTime, description, tab, index, eventTypes, markers, spanEnds, featureReference,
+                 hmmSequence, row=None, sketchWindow=None):
+        """
+        Args:
+            eventTime, description, tab, index: the columns of the audit trail in chronological order (lists, they can
+                                                grow while the analysis is under way)
+            eventTypes, markers: classification of every entry (see AuditTrailClassifier)
+            spanEnds: end position of the span every entry starts, -1 if none (see AuditTrailPairing)
+            featureReference, hmmSequence: the annotation columns, filled in here
+            row: function returning the row at a position, for error messages
+            sketchWindow: MarkerWindow of the "Add or modify a sketch" entries, built from markers and tab (with
+                          SKETCH_WINDOW/SKETCH_SAME_TAB) if not given. It has to keep up with the columns if they grow
+        """
+        self.eventTime = eventTime
+        self.description = description
+        self.tab = tab
+        self.index = index
+        self.eventTypes = eventTypes
+        self.markers = markers
+        self.spanEnds = spanEnds
+        self.featureReference = featureReference
+        self.hmmSequence = hmmSequence
+        self.row = row
+        if sketchWindow is None:
+            sketchWindow = MarkerWindow(Marker.SKETCH, SKETCH_WINDOW, SKETCH_SAME_TAB)
+            sketchWindow.extend(markers, tab)
+        self.sketchWindow = sketchWindow
+        self.skippedFeatures = []
+        self.sketchesCreatedNames = []
+        self.hmm = {}
+        # every timed action (span) is recorded once as: its category (see AuditTrailTimeseries.CATEGORIES, anything
+        # else gets a new code), its duration in seconds and the name of its feature (None if there isn't one), under
+        # the position it starts at. The time_series array is built from these, and all the time totals and counters
+        # for the database row are summed up from them in one go (see AuditTrailTimeseries.categoryTotals), so a new
+        # category doesn't need any new variables
+        self.categoryCodes = {name: code for code, name in enumerate(CATEGORIES)}
+        self.spans = {}
+
+    @property
+    def categoryNames(self):
+        return list(self.categoryCodes)
+
+    def addSpan(self, category, position, seconds, featureName=None):
+        self.spans[position] = (self.categoryCodes.setdefault(category, len(self.categoryCodes)), seconds, featureName)
+
+    def timeSeries(self, positions=None):
+        """
+        The time_series list of (action label, start time, duration) for the spans (all of them by default, in the
+        order they were added), the label is "category - feature name" (or just the category)
+        """
+        categoryNames = self.categoryNames
+        time_series = []
+        for position in (self.spans if positions is None else positions):
+            category, seconds, featureName = self.spans[position]
+            time_series.append((categoryNames[category] if featureName is None else
+                                categoryNames[category] + " - " + featureName,
+                                EPOCH + datetime.timedelta(seconds=self.eventTime[position]),
+                                datetime.timedelta(seconds=seconds)))
+        return time_series
+
+    def totals(self):
+        """(totalSeconds, counts) of every category code over all the spans (see categoryTotals)"""
+        spans = list(self.spans.values())
+        return categoryTotals([span[0] for span in spans], [span[1] for span in spans], len(self.categoryCodes))
+
+    def analyzeEntry(self, i, lastPosition):
+        """
+        Analyzes the entry at position i, lastPosition is the position of the last entry of the audit trail
+        Returns False if the audit trail turns out to be unusable (close document that isn't the last entry)
+        """
         # for adding part studio features (sketches/all other feature)
-        if data[i][5] == "Add part studio feature":
+        eventType = self.eventTypes[i]
+        if eventType == EventType.ADD_FEATURE:
             #print("Found add part studio feature at: " + str(i))
-            featureStartIndex = i
-            while True:
-                featureStartIndex -= 1
-                #print(featureStartIndex)
-                if "Insert feature" in data[featureStartIndex][5]:
-                    #print("found Insert feature at index " + str(featureStartIndex))
-                    if featureStartIndex in insertFeatureIndices:
-                        # check to see if this insert feature has already been matched to another "add ps feature"
-                        # if yes, then skip to find the next available
-                        pass
-                    else:
-                        # if "add of modify a sketch" is before or after insert feature, that means the
-                        # inserted feature was likely a sketch
-                        if "Add or modify a sketch" in data[featureStartIndex + 1][5] or \
-                                "Add or modify a sketch" in data[featureStartIndex - 1][5]:
-                            #print("Added sketch at: " + str(featureStartIndex))
-                            featureName = data[featureStartIndex][5].split(" : ")[1] + " (Sketch)"
-                            data[featureStartIndex][6] = featureName
-                            data[i][6] = featureName
-                            data[featureStartIndex][7] = "End Create"
-                            data[i][7] = "Start Create"
-                            # add this to the running list of discovered insert feature indices
-                            insertFeatureIndices.append(featureStartIndex)
-                            # calculate time spent creating a new sketch
-                            sketchCreateTime += data[featureStartIndex][1] - data[i][1]
-                            timeSeriesEntry = "sketchCreateTime - " + featureName
-                            time_series.append((timeSeriesEntry, data[i][1] , (data[featureStartIndex][1] - data[i][1])))
-                            sketchesCreated += 1
-                            sketchesCreatedNames.append(featureName)
-                            HMMList.append("Create")
-                            break
-                        else:
-                            #print("Regular feature added at: " + str(featureStartIndex))
-                            featureName = data[featureStartIndex][5].split(" : ")[1]
-                            data[featureStartIndex][6] = featureName
-                            data[i][6] = featureName
-                            data[featureStartIndex][7] = "End Create"
-                            data[i][7] = "Start Create"
-                            # add this to the running list of discovered insert feature indices
-                            insertFeatureIndices.append(featureStartIndex)
-                            # calculate time spent creating a new feature
-                            featureCreateTime += data[featureStartIndex][1] - data[i][1]
-                            timeSeriesEntry = "featureCreateTime - " + featureName
-                            time_series.append((timeSeriesEntry, data[i][1], (data[featureStartIndex][1] - data[i][1])))
-                            featuresCreated += 1
-                            HMMList.append("Create")
-                            break
-
-                if "Cancel Operation" in data[featureStartIndex][5]:
-                    #print("Operation cancelled at: " + str(featureStartIndex))
-                    featureName = "Cancelled add feature"
-                    data[featureStartIndex][6] = featureName
-                    data[i][6] = featureName
-                    #data[featureStartIndex][7] = "End Create"
-                    #data[i][7] = "Start Create"
-                    # calculate time spent on a cancelled new feature creation
-                    cancelledCreateTime += data[featureStartIndex][1] - data[i][1]
-                    time_series.append(("cancelCreateTime", data[i][1], (data[featureStartIndex][1] - data[i][1])))
-                    operationsCancelled += 1
-                    #HMMList.append("Create")
-                    break
+            # the matching "Insert feature" (or "Cancel Operation") was already found by pairSpans
+            featureEndIndex = self.spanEnds[i]
+            if featureEndIndex == -1:
+                # never inserted or cancelled before the end of the audit trail
+                pass
+            elif self.markers[featureEndIndex] & Marker.INSERT_FEATURE:
+                #print("found Insert feature at index " + str(featureEndIndex))
+                # if "add of modify a sketch" is before or after insert feature, that means the
+                # inserted feature was likely a sketch (within SKETCH_WINDOW entries of it)
+                if self.sketchWindow.near(featureEndIndex):
+                    #print("Added sketch at: " + str(featureEndIndex))
+                    featureName = self.description[featureEndIndex].split(" : ")[1] + " (Sketch)"
+                    self.featureReference[featureEndIndex] = featureName
+                    self.featureReference[i] = featureName
+                    self.hmmSequence[featureEndIndex] = "End Create"
+                    self.hmmSequence[i] = "Start Create"
+                    # time spent creating a new sketch
+                    self.addSpan("sketchCreateTime", i, self.eventTime[featureEndIndex] - self.eventTime[i], featureName)
+                    self.sketchesCreatedNames.append(featureName)
+                    self.hmm[i] = "Create"
+                else:
+                    #print("Regular feature added at: " + str(featureEndIndex))
+                    featureName = self.description[featureEndIndex].split(" : ")[1]
+                    self.featureReference[featureEndIndex] = featureName
+                    self.featureReference[i] = featureName
+                    self.hmmSequence[featureEndIndex] = "End Create"
+                    self.hmmSequence[i] = "Start Create"
+                    # time spent creating a new feature
+                    self.addSpan("featureCreateTime", i, self.eventTime[featureEndIndex] - self.eventTime[i], featureName)
+                    self.hmm[i] = "Create"
+            else:
+                # otherwise it's paired with a "Cancel Operation"
+                #print("Operation cancelled at: " + str(featureEndIndex))
+                featureName = "Cancelled add feature"
+                self.featureReference[featureEndIndex] = featureName
+                self.featureReference[i] = featureName
+                #self.hmmSequence[featureEndIndex] = "End Create"
+                #self.hmmSequence[i] = "Start Create"
+                # time spent on a cancelled new feature creation
+                self.addSpan("cancelCreateTime", i, self.eventTime[featureEndIndex] - self.eventTime[i])
+                #self.hmm[i] = "Create"
 
         # for editing of part studio features (sketches/all other feature)
-        elif data[i][5] == "Start edit of part studio feature":
+        elif eventType == EventType.START_EDIT:
             #print("Found edit of part studio feature at: " + str(i))
-            featureStartIndex = i
-            HMMList.append("Revise")
-            while True:
-                featureStartIndex -= 1
-                if "Edit :" in data[featureStartIndex][5]:
-                    #print("found Edit at index " + str(featureStartIndex))
-                    if featureStartIndex in editFeatureIndices:
-                        # check to see if this insert feature has already been matched to another "edit ps feature"
-                        # if yes, then skip to find the next available
-                        pass
-                    else:
-                        if "Add or modify a sketch" in data[featureStartIndex + 1][5] or \
-                                "Add or modify a sketch" in data[featureStartIndex - 1][5]:
-                            #print("Edited (Add or modify) sketch at: " + str(featureStartIndex))
-                            featureName = data[featureStartIndex][5].split(" : ")[1] + " (Sketch)"
-                            data[featureStartIndex][6] = featureName
-                            data[i][6] = featureName
-                            data[featureStartIndex][7] = "End Edit"
-                            data[i][7] = "Start Edit"
-                            # add this to the running list of discovered edit feature indices
-                            editFeatureIndices.append(featureStartIndex)
-                            # calculate time spent editing a sketch
-                            sketchEditTime += data[featureStartIndex][1] - data[i][1]
-                            timeSeriesEntry = "sketchEditTime - " + featureName
-                            time_series.append((timeSeriesEntry, data[i][1] , (data[featureStartIndex][1] - data[i][1])))
-                            sketchesEdited += 1
-                            break
-                        else:
-                            #print("Regular feature edit at: " + str(featureStartIndex))
-                            featureName = data[featureStartIndex][5].split(" : ")[1]
-                            data[featureStartIndex][6] = featureName
-                            data[i][6] = featureName
-                            data[featureStartIndex][7] = "End Edit"
-                            data[i][7] = "Start Edit"
-                            # add this to the running list of discovered edit feature indices
-                            editFeatureIndices.append(featureStartIndex)
-                            # calculate time spent editing a feature
-                            featureEditTime += data[featureStartIndex][1] - data[i][1]
-                            timeSeriesEntry = "featureEditTime - " + featureName
-                            time_series.append((timeSeriesEntry, data[i][1] , (data[featureStartIndex][1] - data[i][1])))
-                            featuresEdited += 1
-                            break
-                # if the next thing following "start edit" is "add or modify a sketch" without an "Edit : ", then
-                # that means the user clicked the green checkmark without making any actual changes to a sketch
-                elif "Add or modify a sketch" in data[featureStartIndex][5]:
-                    # sometimes the "edit" entry can come after the "add or modify a sketch" entry, so we still need to
-                    # check to make sure the entry above isn't an feature edit commit
-                    # if it is, then this there were in fact modifications done to a sketch feature
-                    if "Edit" in data[featureStartIndex - 1][5]:
-                        featureName = data[featureStartIndex-1][5].split(" : ")[1] + " (Sketch)"
-                        data[featureStartIndex-1][6] = featureName
-                        data[i][6] = featureName
-                        data[featureStartIndex-1][7] = "End Edit"
-                        data[i][7] = "Start Edit"
-                        # add this to the running list of discovered edit feature indices
-                        editFeatureIndices.append(featureStartIndex)
-                        # calculate time spent editing a sketch
-                        sketchEditTime += data[featureStartIndex-1][1] - data[i][1]
-                        timeSeriesEntry = "sketchEditTime - " + featureName
-                        time_series.append((timeSeriesEntry, data[i][1], (data[featureStartIndex-1][1] - data[i][1])))
-                        sketchesEdited += 1
-                        break
-                    else:
-                        # if "edit" wasn't found in the entry above, then this was likely a edit with no real changes
-                        featureName = "No change edit to a sketch feature"
-                        data[featureStartIndex][6] = featureName
-                        data[i][6] = featureName
-                        data[featureStartIndex][7] = "End Edit"
-                        data[i][7] = "Start Edit"
-                        # add this to the running list of discovered edit feature indices
-                        editFeatureIndices.append(featureStartIndex)
-                        # counting this time as same as cancelledEditTime, lumping them together
-                        cancelledEditTime += data[featureStartIndex][1] - data[i][1]
-                        time_series.append(("cancelledEditTime", data[i][1], (data[featureStartIndex][1] - data[i][1])))
-                        operationsCancelled += 1
-                        break
-                # if another "start edit" or "add part studio feature" is encountered before finding an "edit :", then
-                # the user likely started editing a feature, but didn't actually make a change before clicking the green checkmark
-                # essentially leaving two "start edit part studio feature" entries back to back
-                # similar situation to the no-change edit sitaution for sketches, but in this case there's no entry at all
-                elif "Start edit of part studio feature" in data[featureStartIndex][5] or \
-                    "Add part studio feature" in data[featureStartIndex][5]:
-                    #print("NO CHANGE FEATURE EDIT AT INDEX: " + str(featureStartIndex))
-                    featureName = "No change edit to a feature"
-                    # only mark the i-th (start) entry with featureName, since there's no ending entry in audit trail
-                    data[i][6] = featureName
-                    # add this to the running list of discovered edit feature indices
-                    editFeatureIndices.append(featureStartIndex)
-                    # counting these as zeroDelta times since there's no way to determine for sure how long they spent on these
-                    cancelledEditTime += datetime.timedelta(seconds=noTimeDeltaFeatures)
-                    time_series.append(("cancelledEditTime", data[i][1], datetime.timedelta(seconds=noTimeDeltaFeatures)))
-                    operationsCancelled += 1
-                    break
-                elif "Cancel Operation" in data[featureStartIndex][5]:
-                    #print("Edit operation cancelled at: " + str(featureStartIndex))
-                    featureName = "Cancelled edit feature"
-                    data[featureStartIndex][6] = featureName
-                    data[i][6] = featureName
-                    data[featureStartIndex][7] = "End Edit"
-                    data[i][7] = "Start Edit"
-                    # calculate time spent on a cancelled new feature creation
-                    cancelledEditTime += data[featureStartIndex][1] - data[i][1]
-                    time_series.append(("cancelledEditTime", data[i][1], (data[featureStartIndex][1] - data[i][1])))
-                    operationsCancelled += 1
-                    break
+            self.hmm[i] = "Revise"
+            featureEndIndex = self.spanEnds[i]
+            if featureEndIndex == -1:
+                # edit still open at the end of the audit trail
+                pass
+            elif self.markers[featureEndIndex] & Marker.FEATURE_EDIT:
+                #print("found Edit at index " + str(featureEndIndex))
+                if self.sketchWindow.near(featureEndIndex):
+                    #print("Edited (Add or modify) sketch at: " + str(featureEndIndex))
+                    featureName = self.description[featureEndIndex].split(" : ")[1] + " (Sketch)"
+                    self.featureReference[featureEndIndex] = featureName
+                    self.featureReference[i] = featureName
+                    self.hmmSequence[featureEndIndex] = "End Edit"
+                    self.hmmSequence[i] = "Start Edit"
+                    # time spent editing a sketch
+                    self.addSpan("sketchEditTime", i, self.eventTime[featureEndIndex] - self.eventTime[i], featureName)
+                else:
+                    #print("Regular feature edit at: " + str(featureEndIndex))
+                    featureName = self.description[featureEndIndex].split(" : ")[1]
+                    self.featureReference[featureEndIndex] = featureName
+                    self.featureReference[i] = featureName
+                    self.hmmSequence[featureEndIndex] = "End Edit"
+                    self.hmmSequence[i] = "Start Edit"
+                    # time spent editing a feature
+                    self.addSpan("featureEditTime", i, self.eventTime[featureEndIndex] - self.eventTime[i], featureName)
+            # if the next thing following "start edit" is "add or modify a sketch" without an "Edit : ", then
+            # that means the user clicked the green checkmark without making any actual changes to a sketch
+            elif self.markers[featureEndIndex] & Marker.SKETCH:
+                # sometimes the "edit" entry can come after the "add or modify a sketch" entry, so we still need to
+                # check to make sure the entry after isn't an feature edit commit
+                # if it is, then this there were in fact modifications done to a sketch feature
+                if featureEndIndex < lastPosition and self.markers[featureEndIndex + 1] & Marker.EDIT:
+                    featureName = self.description[featureEndIndex + 1].split(" : ")[1] + " (Sketch)"
+                    self.featureReference[featureEndIndex + 1] = featureName
+                    self.featureReference[i] = featureName
+                    self.hmmSequence[featureEndIndex + 1] = "End Edit"
+                    self.hmmSequence[i] = "Start Edit"
+                    # time spent editing a sketch
+                    self.addSpan("sketchEditTime", i, self.eventTime[featureEndIndex + 1] - self.eventTime[i], featureName)
+                else:
+                    # if "edit" wasn't found in the entry after, then this was likely a edit with no real changes
+                    featureName = "No change edit to a sketch feature"
+                    self.featureReference[featureEndIndex] = featureName
+                    self.featureReference[i] = featureName
+                    self.hmmSequence[featureEndIndex] = "End Edit"
+                    self.hmmSequence[i] = "Start Edit"
+                    # counting this time as same as cancelledEditTime, lumping them together
+                    self.addSpan("cancelledEditTime", i, self.eventTime[featureEndIndex] - self.eventTime[i])
+            # if another "start edit" or "add part studio feature" is encountered before finding an "edit :", then
+            # the user likely started editing a feature, but didn't actually make a change before clicking the green checkmark
+            # essentially leaving two "start edit part studio feature" entries back to back
+            # similar situation to the no-change edit sitaution for sketches, but in this case there's no entry at all
+            elif self.markers[featureEndIndex] & (Marker.START_EDIT | Marker.ADD_FEATURE):
+                #print("NO CHANGE FEATURE EDIT AT INDEX: " + str(featureEndIndex))
+                featureName = "No change edit to a feature"
+                # only mark the i-th (start) entry with featureName, since there's no ending entry in audit trail
+                self.featureReference[i] = featureName
+                # counting these as zeroDelta times since there's no way to determine for sure how long they spent on these
+                self.addSpan("cancelledEditTime", i, noTimeDeltaFeatures)
+            else:
+                # otherwise it's paired with a "Cancel Operation"
+                #print("Edit operation cancelled at: " + str(featureEndIndex))
+                featureName = "Cancelled edit feature"
+                self.featureReference[featureEndIndex] = featureName
+                self.featureReference[i] = featureName
+                self.hmmSequence[featureEndIndex] = "End Edit"
+                self.hmmSequence[i] = "Start Edit"
+                # time spent on a cancelled feature edit
+                self.addSpan("cancelledEditTime", i, self.eventTime[featureEndIndex] - self.eventTime[i])
 
         # tracking opening and closing drawings
-        elif "BLOB opened" in data[i][5]:
-            currentDrawing = data[i][3]
-            # search ahead for when this drawing was closed
-            featureStartIndex = i
-            HMMList.append("Drawing")
-            while True:
-                featureStartIndex -= 1
-                # finds the next "BLOB closed"
-                if "BLOB closed" in data[featureStartIndex][5]:
-                    # check and see if this "BLOB closed" matches the current drawing
-                    if data[featureStartIndex][3] == currentDrawing:
-                        data[featureStartIndex][6] = currentDrawing + "(closed)"
-                        data[i][6] = currentDrawing + "(opened)"
-                        #data[featureStartIndex][7] = "Close Drawing"
-                        data[i][7] = "Refer to Drawing"
-                        # calculate time spent reading a drawing
-                        readDrawingTime += data[featureStartIndex][1] - data[i][1]
-                        timeSeriesEntry = "readDrawingTime - " + currentDrawing
-                        time_series.append((timeSeriesEntry, data[i][1], (data[featureStartIndex][1] - data[i][1])))
-                        switchedToDrawing += 1
-                        break
-                    else:
-                        pass
-                else:
-                    pass
+        elif eventType == EventType.DRAWING_OPENED:
+            currentDrawing = self.tab[i]
+            self.hmm[i] = "Drawing"
+            # the next "BLOB closed" of this same drawing tab
+            featureEndIndex = self.spanEnds[i]
+            if featureEndIndex != -1:
+                self.featureReference[featureEndIndex] = currentDrawing + "(closed)"
+                self.featureReference[i] = currentDrawing + "(opened)"
+                #self.hmmSequence[featureEndIndex] = "Close Drawing"
+                self.hmmSequence[i] = "Refer to Drawing"
+                # time spent reading a drawing
+                self.addSpan("readDrawingTime", i, self.eventTime[featureEndIndex] - self.eventTime[i], currentDrawing)
 
         # tracking opening and closing partstudios
-        elif "PARTSTUDIO opened" in data[i][5]:
-            currentPS = data[i][3]
-            # search ahead for when this partstudio was closed
-            featureStartIndex = i
+        elif eventType == EventType.PARTSTUDIO_OPENED:
+            currentPS = self.tab[i]
             #print("partstudio open, index: " + str(i))
-            while True:
-                featureStartIndex -= 1
-                # finds the next "BLOB closed"
-                if "PARTSTUDIO closed" in data[featureStartIndex][5]:
-                    # check and see if this part studio matches the current part studio
-                    # not actually necessary in my dataset since there's only one partstudio
-                    #if data[featureStartIndex][3] == currentPS:
-                    data[featureStartIndex][6] = currentPS + "(closed)"
-                    data[i][6] = currentPS + "(opened)"
-                    # calculate time spent inside partstudios (this will overlap with feature creation and edit times)
-                    partstudioTime += data[featureStartIndex][1] - data[i][1]
-                    time_series.append(("partstudioTime", data[i][1], (data[featureStartIndex][1] - data[i][1])))
-                    # no need to track times switched to partstudio since it should be the same as times switched to drawing
-                    #print("closed: " + str(featureStartIndex))
-                    break
-                if featureStartIndex == 1:
-                    print("ERROR: Partstudio closed not found! Start index: " + str(i))
-                    break
+            # the next "PARTSTUDIO closed"
+            # (not checking that the tab matches, not actually necessary in my dataset since there's only one partstudio)
+            featureEndIndex = self.spanEnds[i]
+            if featureEndIndex != -1:
+                self.featureReference[featureEndIndex] = currentPS + "(closed)"
+                self.featureReference[i] = currentPS + "(opened)"
+                # time spent inside partstudios (this will overlap with feature creation and edit times)
+                self.addSpan("partstudioTime", i, self.eventTime[featureEndIndex] - self.eventTime[i])
+                # no need to track times switched to partstudio since it should be the same as times switched to drawing
+                #print("closed: " + str(featureEndIndex))
+            else:
+                print("ERROR: Partstudio closed not found! Start index: " + str(self.index[i]))
 
         # tracking moving features or rollback bar
-        elif "Move" in data[i][5]:
-            if "Rollback bar" in data[i][5]:
-                data[i][6] = "-- move rollbackbar +1 --"
-                time_series.append(("moveRollbackBar", data[i][1], datetime.timedelta(seconds=noTimeDeltaFeatures)))
-                movedRollbackBar += 1
-                #HMMList.append("Revise")
-                #data[i][7] = "Revise"
-            elif "tab" in data[i][5]:
-                # moved a tab, not a feature
-                data[i][6] = "-- moved tab, ignore --"
-            else:
-                data[i][6] = "-- move feature +1 --"
-                time_series.append(("moveFeature", data[i][1], datetime.timedelta(seconds=noTimeDeltaFeatures)))
-                movedFeature += 1
-                HMMList.append("Organize")
-                data[i][7] = "Organize"
+        elif eventType == EventType.MOVE_ROLLBACK_BAR:
+            self.featureReference[i] = "-- move rollbackbar +1 --"
+            self.addSpan("moveRollbackBar", i, noTimeDeltaFeatures)
+            #self.hmm[i] = "Revise"
+            #self.hmmSequence[i] = "Revise"
+        elif eventType == EventType.MOVE_TAB:
+            # moved a tab, not a feature
+            self.featureReference[i] = "-- moved tab, ignore --"
+        elif eventType == EventType.MOVE_FEATURE:
+            self.featureReference[i] = "-- move feature +1 --"
+            self.addSpan("moveFeature", i, noTimeDeltaFeatures)
+            self.hmm[i] = "Organize"
+            self.hmmSequence[i] = "Organize"
 
         # tracking undo/redo
-        elif "Undo Redo" in data[i][5]:
+        elif eventType == EventType.UNDO_REDO:
             # if the undo/redo was done during sketching, the only etry will be "Undo Redo Operation"
             # if the undo/redo is done in partstudio, then there will be one more entry "Undo : 1 step"
             # need to check for this
-            #print("Checking undo (or redo) steps, this one's description is : " + data[i][5])
+            #print("Checking undo (or redo) steps, this one's description is : " + self.description[i])
             # the "Undo : " entry can come before or after "Undo Redo Operation"
-            if "Undo : " in data[i-1][5]:
-                data[i-1][6] = "-- Feature undoRedo +1 --"
-                data[i][6] = "-- Feature undoRedo --"
-            elif "Undo : " in data[i+1][5]:
-                data[i+1][6] = "-- Feature undoRedo +1 --"
-                data[i][6] = "-- Feature undoRedo --"
-            elif "Redo : " in data[i-1][5]:
-                data[i + 1][6] = "-- Feature undoRedo +1 --"
-                data[i][6] = "-- Feature undoRedo --"
-            elif "Redo : " in data[i+1][5]:
-                data[i + 1][6] = "-- Feature undoRedo +1 --"
-                data[i][6] = "-- Feature undoRedo --"
+            nextMarkers = self.markers[i + 1] if i < lastPosition else Marker.NONE
+            previousMarkers = self.markers[i - 1] if i > 0 else Marker.NONE
+            if nextMarkers & Marker.UNDO:
+                self.featureReference[i + 1] = "-- Feature undoRedo +1 --"
+                self.featureReference[i] = "-- Feature undoRedo --"
+            elif previousMarkers & Marker.UNDO:
+                self.featureReference[i - 1] = "-- Feature undoRedo +1 --"
+                self.featureReference[i] = "-- Feature undoRedo --"
+            elif nextMarkers & Marker.REDO:
+                self.featureReference[i - 1] = "-- Feature undoRedo +1 --"
+                self.featureReference[i] = "-- Feature undoRedo --"
+            elif previousMarkers & Marker.REDO:
+                self.featureReference[i - 1] = "-- Feature undoRedo +1 --"
+                self.featureReference[i] = "-- Feature undoRedo --"
             else:
-                data[i][6] = "-- Sketch undoRedo +1 --"
-            time_series.append(("undoRedo", data[i][1], datetime.timedelta(seconds=noTimeDeltaFeatures)))
-            HMMList.append("Revise")
-            #data[i][7] = "Revise"
+                self.featureReference[i] = "-- Sketch undoRedo +1 --"
             # currently grouping all undoRedo together, not separately tracking them
-            undoRedo += 1
+            self.addSpan("undoRedo", i, noTimeDeltaFeatures)
+            self.hmm[i] = "Revise"
+            #self.hmmSequence[i] = "Revise"
 
         # create folder
-        elif "Create folder" in data[i][5]:
-            data[i][6] = "New folder: " + data[i][5].split(" : ")[1]
-            time_series.append(("createFolder", data[i][1], datetime.timedelta(seconds=noTimeDeltaFeatures)))
-            createFolder += 1
-            HMMList.append("Organize")
-            data[i][7] = "Organize"
-            #featureName = data[featureStartIndex-1][5].split(" : ")[1] + " (Sketch)"
-
-        elif "Rename" in data[i][5]:
-            data[i][6] = "-- renameFeature +1 --"
-            time_series.append(("renameFeature", data[i][1], datetime.timedelta(seconds=noTimeDeltaFeatures)))
-            renameFeature += 1
-            HMMList.append("Organize")
-            data[i][7] = "Organize"
-
-        elif "Show" in data[i][5] or "Hide" in data[i][5]:
-            data[i][6] = "-- showHide +1 --"
-            time_series.append(("showHide", data[i][1], datetime.timedelta(seconds=noTimeDeltaFeatures)))
-            showHide += 1
-
-        elif "Add or modify a sketch" in data[i][5]:
+        elif eventType == EventType.CREATE_FOLDER:
+            self.featureReference[i] = "New folder: " + self.description[i].split(" : ")[1]
+            self.addSpan("createFolder", i, noTimeDeltaFeatures)
+            self.hmm[i] = "Organize"
+            self.hmmSequence[i] = "Organize"
+            #featureName = self.description[featureStartIndex+1].split(" : ")[1] + " (Sketch)"
+
+        elif eventType == EventType.RENAME:
+            self.featureReference[i] = "-- renameFeature +1 --"
+            self.addSpan("renameFeature", i, noTimeDeltaFeatures)
+            self.hmm[i] = "Organize"
+            self.hmmSequence[i] = "Organize"
+
+        elif eventType == EventType.SHOW_HIDE:
+            self.featureReference[i] = "-- showHide +1 --"
+            self.addSpan("showHide", i, noTimeDeltaFeatures)
+
+        elif eventType == EventType.SKETCH:
             # these entries are already accounted for above, just marking them so they're not blank in the output
-            #data[i][6] = "-- add/mod. sketch (accounted for) --"
-            data[i][6] = "---"
-
-        elif "Delete" in data[i][5]:
-            featureName = data[i][5].split(" : ")[1]
-            data[i][6] = "deleted " + featureName
-            time_series.append(("deletedFeature", data[i][1], datetime.timedelta(seconds=noTimeDeltaFeatures)))
-            deletedFeature += 1
-            HMMList.append("Delete")
-            data[i][7] = "Delete"
-
-        elif "Close document" in data[i][5]:
-            if data[i][0] != str(1):
-                print(data[i])
+            #self.featureReference[i] = "-- add/mod. sketch (accounted for) --"
+            self.featureReference[i] = "---"
+
+        elif eventType == EventType.DELETE:
+            featureName = self.description[i].split(" : ")[1]
+            self.featureReference[i] = "deleted " + featureName
+            self.addSpan("deletedFeature", i, noTimeDeltaFeatures)
+            self.hmm[i] = "Delete"
+            self.hmmSequence[i] = "Delete"
+
+        elif eventType == EventType.CLOSE_DOCUMENT:
+            if i != lastPosition:
+                print(self.row(i))
                 print("Error! Close document is not the last entry!")
-                return -1
+                return False
             else:
                 pass
-                #endTime = datetime.datetime.strptime(data[i][1])
 
-        elif "Open document" in data[i][5]:
-            #startTime = datetime.datetime.strptime(data[i][1])
-            if data[i][0] != str(len(data)-1): # -1 to account for top row not being a valid entry
+        elif eventType == EventType.OPEN_DOCUMENT:
+            if i != 0:
                 print("Error! Open document is not the first entry!")
 
-        # a list of things that I don't want to be accidentally marked as skipped, they're all accounted for in sub-routines of
-        # other higher level elif checks
-        elif "Edit" in data[i][5] or \
-                "Insert feature" in data[i][5] or \
-                "Cancel Operation" in data[i][5] or \
-                "Create Version" in data[i][5] or \
-                "Change size" in data[i][5] or \
-                "Change part appearance" in data[i][5] or \
-                "Branch Workspace" in data[i][5] or \
-                "Suppress" in data[i][5] or \
-                "Unsuppress" in data[i][5] or \
-                "Unpack" in data[i][5] or \
-                "Create variable" in data[i][5] or \
-                "Insert tab" in data[i][5] or \
-                "BLOB closed" in data[i][5] or \
-                "PARTSTUDIO closed" in data[i][5] or \
-                "Update version" in data[i][5] or \
-                "Create version" in data[i][5] or \
-                "Undo : " in data[i][5] or \
-                "Redo : " in data[i][5] or \
-                "Tab Part Studio 1 Copy 1 of type PARTSTUDIO created by CAD_Study" in data[i][5]:
-                #
-            #data[i][6] = "-"
+        # things that are accounted for in sub-routines of other higher level checks
+        # (see the ACCOUNTED_FOR rules in AuditTrailClassifier), don't want them to be accidentally marked as skipped
+        elif eventType == EventType.ACCOUNTED_FOR:
+            #self.featureReference[i] = "-"
             pass
 
         else:
-            print("WARNING: Not yet accounted for entry at index: " + str(i) + "\n\tDescription: " + data[i][5])
-            skippedFeatures.append(("Index: " + str(i) + " - Description: " + data[i][5])) # keep track of all skipped features in a list
+            print("WARNING: Not yet accounted for entry at index: " + str(self.index[i]) + "\n\tDescription: " + self.description[i])
+            self.skippedFeatures.append(("Index: " + str(self.index[i]) + " - Description: " + self.description[i])) # keep track of all skipped features in a list
             #pass
 
-    # print the list of entries that are skipped, to catch anything new that's not currently being checked for
-    if skippedFeatures: # if the skippedFeatures list is empty, then it is FALSE, then the if statement won't print
-        #print("WARNING: Skipped these entries (indices): " + str(skippedFeatures))
-        print("WARNING, skipped some entries, check the 'skipped' JSON file")
-        skippedFeatures.insert(0, "Skipped features indices: ")
-        fileName = fileName.removesuffix(".csv")  # fileName = XX_IDXX_cleaned.csv
-        jsonFileName = os.path.join(os.getcwd(), "Analysis_output", fileName)
-        jsonFileName = jsonFileName + "_skipped.json"
-        with open(jsonFileName, 'w') as outfile:
-            json.dump(skippedFeatures, outfile, indent=0, default=str)
-
-    # write cleaned audit trail to a new file
-    # (if needed) first, create the "filename_cleaned" string
-    #cleanedFileName = fileName[:-4] + "_cleaned" + fileName[-4:]
-    # if the function is fed the cleaned filename already then no need to add "_cleaned" to the name
-    #print("Output file name= " + cleanedFileName)
-    #parentDirectory = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
+        return True
 
-    # fileName already includes "_cleaned"
-    outFilePath = os.path.join(os.getcwd(), "Participant_audit_trails", fileName + ".csv")
-    #print("Output file path: ", outFilePath)
-
-    with open(outFilePath, "w", newline="") as out_file:
-        writer = csv.writer(out_file)
-        for row in data:
-            writer.writerow(row)
-    #print("INFO: Output csv file now includes identified relevant features: " + outFilePath)
-
-
-    ############################################################################
-    #### writing timeseries to json output file for easier manual error checking ####
-    #print(time_series)
-    jsonFileName = os.path.join(os.getcwd(), "Analysis_output", fileName)
-    jsonFileName = jsonFileName + "_timeseries.json"
-    #print(jsonFileName)
-    with open(jsonFileName, 'w') as outfile:
-        # indent=0 prints each list item as a new line, makes it easier to visually read
-        json.dump(time_series, outfile, indent=0, default=str)
-        #json.dump(time_series, outfile, default=str)
-
-    ############################################################################
-    ##################### Write HMM list to json output file ###################
-    HMMFileName = os.path.join(os.getcwd(), "Analysis_output", fileName)
-    HMMFileName = HMMFileName + "_HMM_List.json"
-    #print(HMMFileName)
-    with open(HMMFileName, 'w') as outfile:
-        # indent=0 prints each list item as a new line, makes it easier to visually read
-        json.dump(HMMList, outfile, indent=0, default=str)
-        #json.dump(HMMList, outfile, default=str)
-
-
-    ###########################################################################
-    ######### Write a separate HMM list with start and ends to output #########
-    entriesToSkip = [""] #, "Close Drawing"] # can potentially exclude close drawing as well
-
-    for row in reversed(data[1:]):
-        #if row[7]:
-        if row[7] not in entriesToSkip:
-            HMMList_StartEnd.append(row[7])
-
-    # sometimes we will end up with "open" "open" "closed" "closed", should swap things around to be 2x "open" "closed"
-    for i in range(len(HMMList_StartEnd)-1):
-        current = HMMList_StartEnd[i]
-        next = HMMList_StartEnd[i+1]
-        #print(last)
-        if current == "Open Drawing" and next == "Open Drawing":
-            HMMList_StartEnd[i+1], HMMList_StartEnd[i+2] = HMMList_StartEnd[i+2], HMMList_StartEnd[i+1]
-            #print("Doubled up!")
-
-    HMMFileName = os.path.join(os.getcwd(), "Analysis_output", fileName)
-    HMMFileName = HMMFileName + "_HMM_StartEnd.json"
-    with open(HMMFileName, 'w') as outfile:
-        json.dump(HMMList_StartEnd, outfile, indent=0, default=str)
-        #json.dump(HMMList_StartEnd, outfile, default=str)
-
-    #############################################
-    #### Now deal with creating the eventplot ###
+def databaseRow(fileName, startTime, endTime, analysis):
+    """
+    The audit trail's row for the database (see AuditTrailDatabase)
+    Args:
+        fileName: name of the cleaned audit trail without extension (XX_IDXX_cleaned)
+        startTime, endTime: times of the first and last entries
+        analysis: TrailAnalysis of all the entries
+    """
+    # every total and counter in one grouped reduction over the spans
+    totalSeconds, spanCounts = analysis.totals()
+
+    def categoryTime(name):
+        return datetime.timedelta(seconds=int(totalSeconds[analysis.categoryCodes[name]]))
+
+    def categoryCount(name):
+        return int(spanCounts[analysis.categoryCodes[name]])
+
+    sketchCreateTime, featureCreateTime, sketchEditTime, featureEditTime, readDrawingTime, partstudioTime, \
+        cancelledCreateTime, cancelledEditTime = (categoryTime(name) for name in [
+            "sketchCreateTime", "featureCreateTime", "sketchEditTime", "featureEditTime", "readDrawingTime",
+            "partstudioTime", "cancelCreateTime", "cancelledEditTime"])
+    sketchesCreated, featuresCreated, sketchesEdited, featuresEdited, switchedToDrawing, movedFeature, \
+        movedRollbackBar, undoRedo, createFolder, renameFeature, showHide, deletedFeature = (
+            categoryCount(name) for name in [
+                "sketchCreateTime", "featureCreateTime", "sketchEditTime", "featureEditTime", "readDrawingTime",
+                "moveFeature", "moveRollbackBar", "undoRedo", "createFolder", "renameFeature", "showHide",
+                "deletedFeature"])
+    # cancelled creates and edits (including the edits without any changes)
+    operationsCancelled = categoryCount("cancelCreateTime") + categoryCount("cancelledEditTime")
 
-    # first, calculate a few derived time values
-    startTime = data[-1][1]
-    endTime = data[1][1]
     totalTime = endTime - startTime
 
     partstudioTimeAccountedFor = \
@@ -700,7 +790,12 @@ def analyzeAuditTrail(fileName):
 
     unaccountedTime = partstudioTime - partstudioTimeAccountedFor
     #print("Unaccounted time: " + str(unaccountedTime))
-    unaccountedRatio = unaccountedTime / partstudioTime
+    if partstudioTime:
+        unaccountedRatio = unaccountedTime / partstudioTime
+    else:
+        # no time in a part studio at all (e.g. drawing only sessions of a partitioned export, see
+        # AuditTrailPartition), there's no ratio, same sentinel as below (NULL in the database)
+        unaccountedRatio = 999
     #print("unaccountedRatio (raw): " + str(unaccountedRatio))
     if partstudioTime < partstudioTimeAccountedFor:
         print("partstudioTime < partstudioTimeAcocuntedFor! ")
@@ -708,18 +803,6 @@ def analyzeAuditTrail(fileName):
         unaccountedRatio = 999
 
     ##### Append data to existing database #####
-    database = []
-    databaseFileName = os.path.join(os.getcwd(), "Analysis_output", "Audit_Trail_Database.csv")
-    #print(databaseFileName)
-    with open(databaseFileName, 'r') as csv_file:
-        data_reader = csv.reader(csv_file)
-        for row in data_reader:
-            database.append(row)
-    # parentDirectory = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
-    # outFilePath = os.path.join(parentDirectory, "Participant_audit_trails", databaseFileName)
-    # print("Output file path: ", outFilePath)
-
-
     rowEntry = [fileName,
                 totalTime,
                 partstudioTime,
@@ -750,29 +833,6 @@ def analyzeAuditTrail(fileName):
                 deletedFeature
     ]
 
-    # write over existing entry if a row with the same filename already exists
-    newEntryFlag = True
-
-    # iterate through database's first column, if there's an existing entry with the same file name, set flag to False
-    for index, row in enumerate(database):
-        #print("Index = " + str(index))
-        #print("Checking row" + str(index) + " with entry: "+ row[0])
-        if row[0] == fileName:
-            database[index] = rowEntry
-            #print("found, index:" + str(index))
-            newEntryFlag = False
-
-    # otherwise add new row to the end
-    if newEntryFlag is True:
-        database.append(rowEntry)
-        #print("adding new entry to database: \n" + str(rowEntry))
-
-    with open(databaseFileName, "w", newline="") as out_file:
-        writer = csv.writer(out_file)
-        for row in database:
-            writer.writerow(row)
-
-
     ##############################################
     ############## Printing outputs ##############
 
@@ -820,101 +880,206 @@ def analyzeAuditTrail(fileName):
     print("deletedFeature: " + str(deletedFeature))
 
     """
+    return rowEntry
+
+def analyzeAuditTrail(fileName, data=None, writeCleaned=True, saveToDatabase=True, plots=True, outputs=None):
+    """
+    Function to identify the relevant feature for each audit trail entry based on the description
+    Args:
+        fileName: name of the cleaned audit trail (XX_IDXX_cleaned.csv)
+        data: iterable of cleaned rows (header row first) or an already built AuditTrail table, if None the cleaned
+              csv file is loaded from disk instead
+        writeCleaned: write the cleaned audit trail with the identified features to Participant_audit_trails
+        saveToDatabase: add/update this audit trail's row in the metrics database
+        plots: draw and save the timeline plot (matplotlib is only imported if needed)
+        outputs: if given (a dict), the output files (cleaned csv, json, plot, ...) aren't written, their contents are
+                 added to it instead (file name -> bytes), e.g. to go into an output bundle (see AuditTrailBundle)
+
+    Returns:
+        the audit trail's row for the database (-1 if the audit trail couldn't be analyzed)
+    """
+
+    #fileName += ".csv"
+    # current directory is "API_Rel._Files", need to step one directory up first
+    # os.pardir adds the ".." to the end of the current wd, then abspath fines the actual path of the parent dir
+    #parentDirectory = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
+    # stepping into the participant audit trails folder, tacking on file name, with .csv tacked on already
+    #filePathName = os.path.join(parentDirectory, "Participant_audit_trails", fileName)
+    # updated file path with main python file at the root of the project folder
+    filePathName = os.path.join(os.getcwd(), "Participant_audit_trails", fileName)
+    #print("fileName: " + fileName)
+    #print("filePathName: " + filePathName)
+    #print("Opening file: " + filePathName)
+
+    if data is None:
+        # load in data (should be the cleaned .csv)
+        data = iterAuditTrailRows(filePathName)
+
+    fileName = fileName.removesuffix(".csv")  # fileName = XX_IDXX_cleaned.csv
+
+    ########################
+    # time_series array will be used to build the sequential list of actions (see TrailAnalysis.timeSeries)
+    """
+    Each element in the time_series array has the format: 
+    (action type, start time of the action, time duration) 
+
+    E.g.    ("sketch", datetime(00:05:15), datetime(00:00:20)) 
+            = did sketching starting at 5 min 15 sec for 20 seconds
+
+    All action_type: 
+    -- TO BE DOCUMENTED -- 
+    """
+    ########################
+
+    # Build the compact event table from the cleaned rows, the event time column is parsed in one go while building
+    # it, then any malformed entries are reported by index
+    trail = data if isinstance(data, AuditTrail) else AuditTrail.fromRows(data)
+    if trail.malformedRows:
+        for badIndex in trail.malformedRows:
+            print("Issue with date time entry at index: " + str(badIndex))
+        return -1
+
+    # Rows are in chronological order (position 0 is the oldest entry at the bottom of the csv), so the matching
+    # entries are searched for by moving forwards (position + 1) through the table.
+    # The feature reference and HMM sequence annotation columns start out blank
+    eventTime = trail.eventTime.tolist()
+    description = [trail.descriptions[code] for code in trail.descriptionCodes.tolist()]
+    tab = [trail.tabs[code] for code in trail.tabCodes.tolist()]
+    hmmSequence = trail.hmmSequence
+    lastPosition = len(trail) - 1
+
+    # classify every entry by its description (each distinct description is only checked against the rules once)
+    with stage("classify"):
+        eventTypes, markers = defaultClassifier.classifyTrail(trail)
+
+    # pair up every span start (add/edit feature, open drawing/partstudio) with the entry that ends it in one pass,
+    # spanEnds[i] is the position of the matching end entry of the span started at i (-1 if there is none)
+    with stage("pairSpans"):
+        spanEnds = pairSpans(trail, eventTypes, markers).tolist()
+    # bitmap of the "Add or modify a sketch" entries for the sketch checks, built once for the whole trail
+    sketchWindow = MarkerWindow(Marker.SKETCH, SKETCH_WINDOW, SKETCH_SAME_TAB)
+    sketchWindow.extend(markers, trail.tabCodes)
+    eventTypes = eventTypes.tolist()
+    markers = markers.tolist()
+
+    analysis = TrailAnalysis(eventTime, description, tab, trail.index, eventTypes, markers, spanEnds,
+                             trail.featureReference, trail.hmmSequence, trail.row, sketchWindow)
+    for i in range(len(trail)):
+        #print("Currently on position: " + str(i))
+        if not analysis.analyzeEntry(i, lastPosition):
+            return -1
+    skippedFeatures = analysis.skippedFeatures
+    HMMList = list(analysis.hmm.values())
+    time_series = analysis.timeSeries()
+
+    # print the list of entries that are skipped, to catch anything new that's not currently being checked for
+    if skippedFeatures: # if the skippedFeatures list is empty, then it is FALSE, then the if statement won't print
+        #print("WARNING: Skipped these entries (indices): " + str(skippedFeatures))
+        print("WARNING, skipped some entries, check the 'skipped' JSON file")
+        skippedFeatures.insert(0, "Skipped features indices: ")
+        fileName = fileName.removesuffix(".csv")  # fileName = XX_IDXX_cleaned.csv
+        jsonFileName = os.path.join(os.getcwd(), "Analysis_output", fileName)
+        jsonFileName = jsonFileName + "_skipped.json"
+        with stage("writeJson"), openOutput(jsonFileName, outputs) as outfile:
+            json.dump(skippedFeatures, outfile, indent=0, default=str)
+
+    # write cleaned audit trail to a new file
+    # (if needed) first, create the "filename_cleaned" string
+    #cleanedFileName = fileName[:-4] + "_cleaned" + fileName[-4:]
+    # if the function is fed the cleaned filename already then no need to add "_cleaned" to the name
+    #print("Output file name= " + cleanedFileName)
+    #parentDirectory = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
+
+    # fileName already includes "_cleaned"
+    outFilePath = os.path.join(os.getcwd(), "Participant_audit_trails", fileName + ".csv")
+    #print("Output file path: ", outFilePath)
+
+    if writeCleaned:
+        with stage("writeCsv"), openOutput(outFilePath, outputs, newline="") as out_file:
+            writer = csv.writer(out_file)
+            for row in trail.rows():
+                writer.writerow(row)
+        #print("INFO: Output csv file now includes identified relevant features: " + outFilePath)
+
+
+    ############################################################################
+    #### writing timeseries to json output file for easier manual error checking ####
+    #print(time_series)
+    jsonFileName = os.path.join(os.getcwd(), "Analysis_output", fileName)
+    jsonFileName = jsonFileName + "_timeseries.json"
+    #print(jsonFileName)
+    count("timeseriesEntries", len(time_series))
+    with stage("writeJson"), openOutput(jsonFileName, outputs) as outfile:
+        # indent=0 prints each list item as a new line, makes it easier to visually read
+        json.dump(time_series, outfile, indent=0, default=str)
+        #json.dump(time_series, outfile, default=str)
+    # same time series as typed binary records, for the tools that read it back (see AuditTrailTimeseries)
+    with stage("writeJson"), openOutput(jsonFileName[:-len(".json")] + ".bin", outputs, binary=True) as outfile:
+        writeTimeseries(time_series, outfile)
+
+    ############################################################################
+    ##################### Write HMM list to json output file ###################
+    HMMFileName = os.path.join(os.getcwd(), "Analysis_output", fileName)
+    HMMFileName = HMMFileName + "_HMM_List.json"
+    #print(HMMFileName)
+    with stage("writeJson"), openOutput(HMMFileName, outputs) as outfile:
+        # indent=0 prints each list item as a new line, makes it easier to visually read
+        json.dump(HMMList, outfile, indent=0, default=str)
+        #json.dump(HMMList, outfile, default=str)
+
+
+    ###########################################################################
+    ######### Write a separate HMM list with start and ends to output #########
+    HMMList_StartEnd = startEndSequence(hmmSequence)
+
+    HMMFileName = os.path.join(os.getcwd(), "Analysis_output", fileName)
+    HMMFileName = HMMFileName + "_HMM_StartEnd.json"
+    with stage("writeJson"), openOutput(HMMFileName, outputs) as outfile:
+        json.dump(HMMList_StartEnd, outfile, indent=0, default=str)
+        #json.dump(HMMList_StartEnd, outfile, default=str)
+
+    #############################################
+    #### Now deal with creating the eventplot ###
+
+    # first, calculate a few derived time values
+    startTime = trail.datetime(0)
+    endTime = trail.datetime(lastPosition)
+
+    ##### Append data to existing database #####
+    rowEntry = databaseRow(fileName, startTime, endTime, analysis)
+
+    # the batch mode collects the rows from all the audit trails and writes them to the database in one go at the end
+    if saveToDatabase:
+        with stage("database"):
+            updateDatabase([rowEntry])
+
 
     #print("\nsketch names: ")
-    #print(*sketchesCreatedNames, sep="\n")
+    #print(*analysis.sketchesCreatedNames, sep="\n")
+
+    if not plots:
+        return rowEntry
+
+    # matplotlib is slow to import, so it's only loaded once a plot is actually needed (the import is timed as part of
+    # the plot, it only happens once per process)
+    with stage("plot"):
+        from AuditTrailTimeline import plotTimeline
 
     #print(time_series)
-    # Plotting the time series event plot
-    #position = [[],[],[],[],[],[],[],[],[],[],[],[],[],[]]  # x coordinates, a list of 14 lists
-    position = [[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[]]  # x coordinates, a list of 18 lists
-    # (added 3 extra for plotting different drawings in different colours
-
-    for (action, timestamp, duration) in time_series:
-        if "readDrawingTime - Changes" in action:
-            for i in range(duration.seconds):
-                position[17].append((timestamp - startTime).seconds + i)
-        elif "readDrawingTime - Step 4" in action:
-            for i in range(duration.seconds):
-                position[16].append((timestamp - startTime).seconds + i)
-        elif "readDrawingTime - Step 3" in action:
-            for i in range(duration.seconds):
-                position[15].append((timestamp - startTime).seconds + i)
-        elif "readDrawingTime - Step 2" in action:
-            for i in range(duration.seconds):
-                position[14].append((timestamp - startTime).seconds + i)
-        elif "readDrawingTime - Step 1" in action:
-            for i in range(duration.seconds):
-                position[13].append((timestamp - startTime).seconds + i)
-        elif "sketchCreateTime" in action:
-            for i in range(duration.seconds):
-                position[12].append((timestamp - startTime).seconds + i)
-        elif "featureCreateTime" in action:
-            for i in range(duration.seconds):
-                position[11].append((timestamp - startTime).seconds + i)
-        elif "sketchEditTime" in action:
-            for i in range(duration.seconds):
-                position[10].append((timestamp - startTime).seconds + i)
-        elif "featureEditTime" in action:
-            for i in range(duration.seconds):
-                position[9].append((timestamp - startTime).seconds + i)
-        elif action == "cancelledCreateTime":
-            for i in range(duration.seconds):
-                position[8].append((timestamp - startTime).seconds + i)
-        elif action == "cancelledEditTime":
-            for i in range(duration.seconds):
-                position[7].append((timestamp - startTime).seconds + i)
-        elif action == "moveRollbackBar":
-            for i in range(duration.seconds):
-                position[6].append((timestamp - startTime).seconds + i)
-        elif action == "moveFeature":
-            for i in range(duration.seconds):
-                position[5].append((timestamp - startTime).seconds + i)
-        elif action == "renameFeature":
-            for i in range(duration.seconds):
-                position[4].append((timestamp - startTime).seconds + i)
-        elif action == "undoRedo":
-            for i in range(duration.seconds):
-                position[3].append((timestamp - startTime).seconds + i)
-        elif action == "deletedFeature":
-            for i in range(duration.seconds):
-                position[2].append((timestamp - startTime).seconds + i)
-        elif action == "showHide":
-            for i in range(duration.seconds):
-                position[1].append((timestamp - startTime).seconds + i)
-        elif action == "createFolder":
-            for i in range(duration.seconds):
-                position[0].append((timestamp - startTime).seconds + i)
-
-    offset =  [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 13, 13, 13, 13] # y coordinates, last 4 are for drawings so superimposing them
-    linelengths1 = 7 * [0.5] + 6 * [0.9] + 5*[0.9] #last 5 controls height of readDrawing bars
-    colors1 = 7*["orangered"] + 6*["mediumblue"] + ["red"] + ["gold"] + ["lime"] + ["purple"]+ ["blue"]
-                                    #Drawing:       #1          #2         #3         #4        #changes
-
-    plt.rcParams["figure.figsize"] = (10, 5)  # Resize the plot
+    # Plotting the time series as a timeline of bars (see AuditTrailTimeline)
     # task2 plots are much shorter in duration, so resize the overall plot to be narrower
+    figsize = (10, 5)
     if "Task2" in fileName:
-        plt.rcParams["figure.figsize"] = (8, 5)  # Resize the plot
-    plt.eventplot(position, lineoffsets=offset,linelengths=linelengths1, linewidths= 1, colors=colors1)
-    y = ["Created folder", "Show/hide", "Deleted feature", "Undo/Redo", "Rename feature", "Move feature",
-         "Move rollback bar", "Cancelled edit", "Cancelled creation", "Edit PS feature", "Edit sketch",
-         "Create PS feature", "Create sketch feature", "Read drawing"]
-    plt.yticks(np.arange(len(y)), y)
-    plt.xlabel("Time (s)")
+        figsize = (8, 5)
     # removing "_cleaned" from the plot title
     fileName = fileName.removesuffix("_cleaned")
     #print(fileName)
+    saveFigLocation = os.path.join(os.getcwd(), "Analysis_output", fileName + "_cleaned.png")
     # add filename as title
-    plt.title(fileName, fontdict=None, loc='center', pad=6)
-    plt.tight_layout()
+    with stage("plot"), openOutput(saveFigLocation, outputs, binary=True) as figFile:
+        plotTimeline(time_series, startTime, fileName, figFile, figsize)
 
-    saveFigLocation = os.path.join(os.getcwd(), "Analysis_output", fileName + "_cleaned")
-    plt.savefig(saveFigLocation) #, bbox_inches='tight'
-
-    #plt.show()
-    plt.close()
-
-    return None
+    return rowEntry
 
 
 ###############################################################################
@@ -927,13 +1092,52 @@ def analyzeAuditTrail(fileName):
 #analyzeAuditTrail(fileName)
 
 #"""
-for root,dirs,files in os.walk("Participant_audit_trails"):
-    for name in files:
-        #print(os.path.join(root, name))
-        if "cleaned" not in name:
-            print("\n########################################################")
-            print("Opening and analyzing: " + name)
-            read_file(name)
+if __name__ == "__main__":
+    # --force: analyze every audit trail, even the ones that haven't changed since the last run
+    force = "--force" in sys.argv[1:]
+    # --no-plots: skip the timeline plots (and never import matplotlib)
+    plots = "--no-plots" not in sys.argv[1:]
+    # --profile: save cProfile stats of every audit trail to Analysis_output/profiles (see AuditTrailTiming)
+    profile = "--profile" in sys.argv[1:]
+
+    names = []
+    for root,dirs,files in os.walk("Participant_audit_trails"):
+        for name in files:
+            #print(os.path.join(root, name))
+            # ~$ files are the lock files Excel leaves next to an open workbook
+            if "cleaned" not in name and not name.startswith("~$"):
+                names.append(name)
+
+    # the cache files next to the audit trails aren't analyzed on their own (see AuditTrailCache)
+    names = withoutCacheCopies(names)
+
+    manifest = Manifest(ANALYZER_VERSION)
+    changed, unchanged = findChangedTrails(names, manifest, force, plots)
+    for name in unchanged:
+        print("Unchanged since last run, skipping: " + name)
+    timings = []
+    for name, digest in changed:
+        print("\n########################################################")
+        print("Opening and analyzing: " + name)
+        AuditTrailTiming.startFile(name)
+        if profile:
+            rowEntry = AuditTrailTiming.profileFile(read_file, name, plots=plots, digest=digest)
+        else:
+            rowEntry = read_file(name, plots=plots, digest=digest)
+        timings.append(AuditTrailTiming.finishFile())
+        if rowEntry == -1:
+            manifest.remove(name)
+        else:
+            manifest.update(name, digest, outputFiles(name), plots)
+        # saved after every audit trail so an interrupted run doesn't lose track of the finished ones
+        manifest.save()
+    exportDatabase()
+    if timings:
+        summary = AuditTrailTiming.summarize(timings)
+        AuditTrailTiming.printSummary(summary)
+        AuditTrailTiming.saveTimings(timings, summary)
+    # uncomment to see how often each description rule was hit across all the audit trails
+    #defaultClassifier.printHitCounts()
 #"""
 
 
@@ -943,5 +1147,6 @@ name = "ID01_BT_Task2.csv"
 #name = str(os.getcwd()) + "/Participant_audit_trails/" + name
 print(name)
 read_file(name)
+exportDatabase()
 """
 
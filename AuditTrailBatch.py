@@ -0,0 +1,199 @@
+import os
+import sys
+import time
+import argparse
+import traceback
+import concurrent.futures
+
+import AuditTrailAnalyzer
+import AuditTrailValidator
+import AuditTrailTiming
+from AuditTrailBundle import OutputBundle
+
+"""
+Batch mode for analyzing every audit trail in Participant_audit_trails.
+
+The audit trails are spread across a pool of worker processes. Each worker runs the normal
+read_file -> cleanCsv -> analyzeAuditTrail chain on one audit trail and writes that trail's own outputs (timeseries,
+HMM lists, plot, cleaned csv), but doesn't touch the metrics database. The database rows are sent back to the main
+process and merged into the database in one go once every audit trail is done, so the workers never read/write the
+database at the same time. Audit_Trail_Database.csv is exported from the database at the end.
+A bad audit trail (failed integrity check or an exception during analysis) is reported and skipped, the rest of the
+batch carries on. Audit trails that haven't changed since the last run are skipped (see AuditTrailManifest), --force
+analyzes them anyway. With --validate every audit trail is run through all the integrity checks first (see
+AuditTrailValidator) and the ones that fail are reported with all of their problems and left out of the analysis.
+With --bundle FILE the outputs of every audit trail (cleaned csv, json, plot, ...) aren't written as separate files,
+they're sent back to the main process and stored in one SQLite bundle file instead (see AuditTrailBundle).
+Every stage of every audit trail is timed (see AuditTrailTiming), the summary (time per stage, percentiles per file,
+slowest files) is printed at the end and saved with the per file timings to Analysis_output/Audit_Trail_Timings.json.
+--profile also runs each audit trail under cProfile, the stats go to Analysis_output/profiles/<name>.prof.
+
+Usage:
+    python AuditTrailBatch.py --workers 8 [--force] [--no-plots] [--validate] [--bundle Analysis_output/run.sqlite]
+                              [--profile]
+"""
+
+
+def findAuditTrails(directory="Participant_audit_trails"):
+    """
+    Names of all the raw audit trails to analyze (anything that isn't a "cleaned" output), in the same order as the
+    os.walk loop in AuditTrailAnalyzer
+    """
+    names = []
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            # ~$ files are the lock files Excel leaves next to an open workbook
+            if "cleaned" not in name and not name.startswith("~$"):
+                names.append(name)
+    # the cache files next to the audit trails aren't analyzed on their own (see AuditTrailCache)
+    return AuditTrailAnalyzer.withoutCacheCopies(names)
+
+
+def analyzeFile(name, plots=True, digest=None, bundled=False, profile=False):
+    """
+    Worker function: analyzes one audit trail without updating the database
+    digest is the content hash of the audit trail, so the worker doesn't have to hash it again for the cache
+    bundled: collect the output files in memory instead of writing them (see AuditTrailBundle)
+    profile: run the analysis under cProfile (see AuditTrailTiming.profileFile)
+    Returns (name, database row or None, error message or None, output files (file name -> bytes) or None,
+    timing record (see AuditTrailTiming))
+    """
+    print("Opening and analyzing: " + name)
+    outputs = {} if bundled else None
+    AuditTrailTiming.startFile(name)
+    try:
+        if profile:
+            rowEntry = AuditTrailTiming.profileFile(AuditTrailAnalyzer.read_file, name, saveToDatabase=False,
+                                                    plots=plots, digest=digest, outputs=outputs)
+        else:
+            rowEntry = AuditTrailAnalyzer.read_file(name, saveToDatabase=False, plots=plots, digest=digest,
+                                                    outputs=outputs)
+    except Exception:
+        return name, None, traceback.format_exc(), None, AuditTrailTiming.finishFile()
+    if rowEntry == -1 or rowEntry is None:
+        return name, None, "failed the audit trail checks (see output above)", None, AuditTrailTiming.finishFile()
+    return name, rowEntry, None, outputs, AuditTrailTiming.finishFile()
+
+
+def runBatch(names=None, workers=None, force=False, plots=True, validate=False, bundle=None, profile=False):
+    """
+    Analyzes the audit trails across a pool of worker processes, then adds all of their rows to the database at once.
+    Audit trails that haven't changed since the last run (see AuditTrailManifest) are skipped unless force is True
+    Args:
+        names: audit trail file names (in Participant_audit_trails), defaults to all of them
+        workers: number of worker processes, defaults to the number of CPUs. With 1 worker everything runs in this
+                 process
+        force: analyze every audit trail, even the unchanged ones
+        plots: draw the timeline plots
+        validate: check the audit trails first (see AuditTrailValidator) and only analyze the ones that pass
+        bundle: path of an output bundle to store the outputs in, instead of writing them as separate files
+        profile: save cProfile stats for every audit trail (to Analysis_output/profiles)
+    Returns:
+        (rowEntries, failures): the database rows of the audit trails that were analyzed, and a list of
+        (name, error message) for the ones that weren't
+    """
+    if names is None:
+        names = findAuditTrails()
+
+    manifest = AuditTrailAnalyzer.Manifest(AuditTrailAnalyzer.ANALYZER_VERSION)
+    changed, unchanged = AuditTrailAnalyzer.findChangedTrails(names, manifest, force, plots)
+    if bundle is not None:
+        # unchanged audit trails are only skipped if their outputs are in this bundle
+        with OutputBundle(bundle) as outputBundle:
+            missing = [name for name in unchanged if not outputBundle.has(AuditTrailAnalyzer.baseName(name))]
+        changed += [(name, AuditTrailAnalyzer.fileHash(os.path.join("Participant_audit_trails", name)))
+                    for name in missing]
+        unchanged = [name for name in unchanged if name not in missing]
+    for name in unchanged:
+        print("Unchanged since last run, skipping: " + name)
+    digests = dict(changed)
+    names = [name for name, digest in changed]
+
+    results = []
+    if validate:
+        # caches were built from audit trails that passed the checks already
+        toValidate = [name for name in names if not AuditTrailAnalyzer.isCacheFile(name)]
+        reports = AuditTrailValidator.validateAuditTrails(toValidate, workers)
+        AuditTrailValidator.saveReports(reports)
+        invalid = set(report.fileName for report in reports if not report.ok)
+        results += [(report.fileName, None, report.describe(), None, None) for report in reports if not report.ok]
+        names = [name for name in names if name not in invalid]
+
+    if workers == 1:
+        for name in names:
+            results.append(analyzeFile(name, plots, digests[name], bundle is not None, profile))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(analyzeFile, name, plots, digests[name], bundle is not None, profile)
+                       for name in names]
+            for name, future in zip(names, futures):
+                try:
+                    results.append(future.result())
+                except Exception:
+                    # the worker process itself died (e.g. ran out of memory)
+                    results.append((name, None, traceback.format_exc(), None, None))
+
+    rowEntries = [rowEntry for name, rowEntry, error, outputs, timing in results if rowEntry is not None]
+    failures = [(name, error) for name, rowEntry, error, outputs, timing in results if error is not None]
+
+    if bundle is not None:
+        # single writer for the bundle, like the database
+        with OutputBundle(bundle) as outputBundle:
+            for name, rowEntry, error, outputs, timing in results:
+                if outputs:
+                    outputBundle.put(AuditTrailAnalyzer.baseName(name), outputs)
+
+    # single merge step into the database
+    mergeStarted = time.perf_counter()
+    if rowEntries:
+        AuditTrailAnalyzer.updateDatabase(rowEntries)
+    AuditTrailAnalyzer.exportDatabase()
+    mergeTime = time.perf_counter() - mergeStarted
+
+    # the manifest is only updated once the rows are safely in the database
+    for name, rowEntry, error, outputs, timing in results:
+        if rowEntry is not None:
+            manifest.update(name, digests[name],
+                            [bundle] if bundle is not None else AuditTrailAnalyzer.outputFiles(name), plots)
+        else:
+            manifest.remove(name)
+    manifest.save()
+
+    print("\n########################################################")
+    print("Analyzed " + str(len(rowEntries)) + " of " + str(len(results)) + " audit trails (" +
+          str(len(unchanged)) + " unchanged ones skipped)")
+    for name, error in failures:
+        print("FAILED: " + name + "\n\t" + error.strip().replace("\n", "\n\t"))
+
+    timings = [timing for name, rowEntry, error, outputs, timing in results]
+    summary = AuditTrailTiming.summarize(timings)
+    # the merge happens once for the whole batch, outside of any one audit trail's timings
+    summary["databaseMerge"] = mergeTime
+    AuditTrailTiming.printSummary(summary)
+    print("database merge (whole batch): %.3f s" % mergeTime)
+    AuditTrailTiming.saveTimings(timings, summary)
+
+    return rowEntries, failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze every audit trail in Participant_audit_trails in parallel")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--force", action="store_true",
+                        help="analyze every audit trail, even the ones that haven't changed since the last run")
+    parser.add_argument("--no-plots", dest="plots", action="store_false",
+                        help="skip the timeline plots (matplotlib is never imported)")
+    parser.add_argument("--validate", action="store_true",
+                        help="check the audit trails for problems first and skip the ones that fail")
+    parser.add_argument("--bundle", default=None,
+                        help="store all the outputs in this one SQLite bundle file instead of separate files")
+    parser.add_argument("--profile", action="store_true",
+                        help="save cProfile stats for every audit trail to Analysis_output/profiles")
+    parser.add_argument("names", nargs="*", help="only analyze these audit trails (file names)")
+    args = parser.parse_args()
+
+    rowEntries, failures = runBatch(args.names or None, args.workers, args.force, args.plots, args.validate,
+                                    args.bundle, args.profile)
+    if failures:
+        sys.exit(1)
@@ -0,0 +1,199 @@
+import os
+import csv
+import sys
+import time
+import argparse
+import tempfile
+import datetime
+import tracemalloc
+
+import AuditTrailAnalyzer
+import AuditTrailTiming
+from AuditTrailTable import AuditTrail
+from AuditTrailReader import MappedCsv, iterAuditTrailRowsReversed
+from AuditTrailSynthetic import writeSyntheticTrail
+
+"""
+Benchmarks on synthetic audit trails of any size.
+
+Readers (the default): the different ways of reading an audit trail csv into the (cleaned) event table
+- csv: csv.reader on the file (newest event first) -> index check -> cleaning -> AuditTrail.fromRows
+- reversed: the mmap backed reverse reader (oldest event first, see AuditTrailReader.iterAuditTrailRowsReversed)
+- mapped: memory mapped field offsets, only the needed columns materialized (see AuditTrailReader.MappedCsv)
+
+Stages (--stages): the whole read_file -> cleanCsv -> analyzeAuditTrail pipeline, with the time and peak memory of each
+of its stages (see AuditTrailTiming), including the database upsert, the cache write and (once the cache is there) the
+cache load. It runs in a temporary folder, the real Participant_audit_trails/Analysis_output aren't touched.
+
+The audit trails are realistic synthetic sessions (see AuditTrailSynthetic). With --template the rows of a real audit
+trail are repeated instead, with a new index and event times one second apart until the trail is long enough (only
+good for the readers, the repeated trail has an "Open document"/"Close document" in the middle).
+Times are the best of --repeats runs, memory is the peak (python/numpy) memory of a separate run under tracemalloc.
+
+Usage:
+    python AuditTrailBenchmark.py --rows 10000 100000 1000000
+    python AuditTrailBenchmark.py --stages --rows 1000 10000 100000 [--plots]
+"""
+
+
+def makeSyntheticTrail(filePathName, nRows, templateFileName):
+    """Writes an audit trail csv with nRows entries built by repeating the entries of templateFileName"""
+    with open(templateFileName, "r") as csv_file:
+        template = list(csv.reader(csv_file))
+    header, entries = template[0], template[1:]
+    startTime = datetime.datetime(2021, 1, 1)
+    with open(filePathName, "w", newline="") as out_file:
+        writer = csv.writer(out_file)
+        writer.writerow(header)
+        for i in range(nRows):
+            row = list(entries[i % len(entries)])
+            row[0] = str(i + 1)
+            # newest event first
+            row[1] = str(startTime + datetime.timedelta(seconds=nRows - i))
+            writer.writerow(row)
+
+
+def makeTrail(filePathName, nRows, templateFileName=None, seed=0):
+    """Writes a synthetic audit trail, realistic (AuditTrailSynthetic) or repeating templateFileName if given"""
+    if templateFileName is None:
+        writeSyntheticTrail(filePathName, nRows, seed)
+    else:
+        makeSyntheticTrail(filePathName, nRows, templateFileName)
+
+
+def readWithCsv(filePathName):
+    rows = AuditTrailAnalyzer.checkIndices(AuditTrailAnalyzer.iterAuditTrailRows(filePathName))
+    return AuditTrail.fromRows(AuditTrailAnalyzer.cleanRows(rows))
+
+
+def readReversed(filePathName):
+    rows = AuditTrailAnalyzer.checkIndicesDescending(iterAuditTrailRowsReversed(filePathName))
+    return AuditTrail.fromRows(AuditTrailAnalyzer.cleanRows(rows, reindex=False), oldestFirst=True, renumber=True)
+
+
+def readMapped(filePathName):
+    with MappedCsv(filePathName) as mapped:
+        AuditTrailAnalyzer.checkMappedIndices(mapped)
+        return AuditTrailAnalyzer.cleanMappedCsv(mapped)
+
+
+READERS = [("csv", readWithCsv), ("reversed", readReversed), ("mapped", readMapped)]
+
+
+def measure(reader, filePathName):
+    """Returns (seconds, peak memory in bytes, number of rows in the table) for one read"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    trail = reader(filePathName)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak, len(trail)
+
+
+def runBenchmark(rowCounts, templateFileName=None, repeats=3):
+    """Prints a table of the best time and peak memory of each reader for each trail size"""
+    print("rows".rjust(10) + "".join((name + " s").rjust(12) + (name + " MB").rjust(12) for name, reader in READERS))
+    with tempfile.TemporaryDirectory() as directory:
+        for nRows in rowCounts:
+            filePathName = os.path.join(directory, "synthetic_" + str(nRows) + ".csv")
+            makeTrail(filePathName, nRows, templateFileName)
+            line = str(nRows).rjust(10)
+            lengths = set()
+            for name, reader in READERS:
+                # time without tracemalloc running (it slows down allocations), memory from a separate run
+                best = float("inf")
+                for repeat in range(repeats):
+                    start = time.perf_counter()
+                    lengths.add(len(reader(filePathName)))
+                    best = min(best, time.perf_counter() - start)
+                seconds, peak, length = measure(reader, filePathName)
+                line += ("%.3f" % best).rjust(12) + ("%.1f" % (peak / 1e6)).rjust(12)
+            if len(lengths) != 1:
+                line += "  (readers disagree on the number of rows!)"
+            print(line)
+            sys.stdout.flush()
+
+
+def runPipeline(fileName, plots=False, useCache=False):
+    """Analyzes one audit trail (in the current folder) like the analyzer does, returns its timing record"""
+    AuditTrailTiming.startFile(fileName)
+    if AuditTrailAnalyzer.read_file(fileName, plots=plots, useCache=useCache) == -1:
+        raise RuntimeError(fileName + " failed the audit trail checks")
+    return AuditTrailTiming.finishFile()
+
+
+def measureStages(fileName, plots=False, repeats=3):
+    """
+    Time and memory of every stage of the pipeline for one audit trail
+    Returns (seconds, memory, counts): stage -> best time over the runs, stage -> peak bytes, the file's counts
+    """
+    seconds = {}
+    for repeat in range(repeats):
+        record = runPipeline(fileName, plots)
+        for name, value in record["stages"].items():
+            seconds[name] = min(seconds.get(name, float("inf")), value)
+    # the runs above left a current cache behind, this one loads it instead of parsing
+    for name, value in runPipeline(fileName, plots, useCache=True)["stages"].items():
+        if name not in seconds:
+            seconds[name] = value
+
+    tracemalloc.start()
+    try:
+        record = runPipeline(fileName, plots)
+        memory = dict(record["memory"])
+        memory.update((name, value) for name, value in runPipeline(fileName, plots, useCache=True)["memory"].items()
+                      if name not in memory)
+    finally:
+        tracemalloc.stop()
+    return seconds, memory, record["counts"]
+
+
+def runStageBenchmark(rowCounts, templateFileName=None, repeats=3, plots=False):
+    """Prints the best time and peak memory of every pipeline stage for each trail size"""
+    results = []
+    workingDirectory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.makedirs(os.path.join(directory, "Participant_audit_trails"))
+        os.makedirs(os.path.join(directory, "Analysis_output"))
+        # the analysis reads and writes relative to the current folder
+        os.chdir(directory)
+        try:
+            for nRows in rowCounts:
+                fileName = "synthetic_" + str(nRows) + ".csv"
+                makeTrail(os.path.join("Participant_audit_trails", fileName), nRows, templateFileName)
+                seconds, memory, counts = measureStages(fileName, plots, repeats)
+                results.append((nRows, seconds, memory))
+                print(str(nRows) + " rows (" + ", ".join(name + " " + str(n) for name, n in counts.items()) + "): " +
+                      "%.3f s" % sum(seconds.values()))
+                sys.stdout.flush()
+        finally:
+            os.chdir(workingDirectory)
+
+    stages = [name for name in AuditTrailTiming.STAGES if any(name in seconds for nRows, seconds, memory in results)]
+    print("\n" + "stage".ljust(12) + "".join((str(nRows) + " s").rjust(12) + (str(nRows) + " MB").rjust(12)
+                                            for nRows, seconds, memory in results))
+    for name in stages:
+        line = name.ljust(12)
+        for nRows, seconds, memory in results:
+            line += ("%.3f" % seconds.get(name, 0.0)).rjust(12) + ("%.1f" % (memory.get(name, 0) / 1e6)).rjust(12)
+        print(line)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the audit trail readers, or every stage of the analysis, "
+                                                 "on synthetic audit trails")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000],
+                        help="number of entries of the synthetic audit trails")
+    parser.add_argument("--stages", action="store_true",
+                        help="benchmark every stage of the analysis pipeline instead of just the readers")
+    parser.add_argument("--plots", action="store_true", help="include the timeline plot in the stage benchmark")
+    parser.add_argument("--template", default=None,
+                        help="repeat the entries of this audit trail instead of generating realistic sessions")
+    parser.add_argument("--repeats", type=int, default=3, help="number of timed runs per reader (best is shown)")
+    args = parser.parse_args()
+    if args.stages:
+        runStageBenchmark(args.rows, args.template, args.repeats, args.plots)
+    else:
+        runBenchmark(args.rows, args.template, args.repeats)
@@ -0,0 +1,130 @@
+import os
+import io
+import json
+import sqlite3
+import contextlib
+
+"""
+Single file bundle for all the outputs of a batch run.
+
+Normally every analyzed audit trail leaves half a dozen small files behind (cleaned csv in Participant_audit_trails,
+_timeseries.json/.bin, _HMM_List.json, _HMM_StartEnd.json, _skipped.json and the timeline .png in Analysis_output).
+Across a large cohort that's tens of thousands of files, which is slow on network storage. With a bundle the same
+files are stored as rows of one SQLite database instead:
+
+    artefacts(trail, name, data)
+
+trail is the name of the raw audit trail without its extension (e.g. "ID01_BT_Task1"), name is the file name the
+artefact would have had on disk (e.g. "ID01_BT_Task1_cleaned_HMM_List.json") and data its contents. All of a trail's
+artefacts are replaced together when it's analyzed again.
+
+The analysis collects a trail's outputs in memory when it's given an outputs dict (see openOutput and
+AuditTrailAnalyzer.analyzeAuditTrail), the batch mode then writes them to the bundle from the main process (see
+AuditTrailBatch --bundle), so the worker processes never write to the bundle at the same time.
+
+Reading back:
+    with OutputBundle("Analysis_output/run1.sqlite") as bundle:
+        bundle.trails()                                      # every trail in the bundle
+        bundle.get("ID01_BT_Task1", "_HMM_StartEnd.json")    # bytes of the artefact whose name ends with that
+        bundle.getJson("ID01_BT_Task1", "_timeseries.json")  # parsed json
+        bundle.extract("ID01_BT_Task1", "Analysis_output")   # write the artefacts out as the usual files
+"""
+
+
+@contextlib.contextmanager
+def openOutput(filePathName, outputs=None, binary=False, newline=None):
+    """
+    Opens an output file for writing, or, if outputs is given, an in memory file whose contents are added to
+    outputs (dict of file name -> bytes) under the file's name once it's closed
+    Args:
+        filePathName: where the file goes on disk
+        outputs: dict to collect the outputs in, None to write the file
+        binary: binary file instead of text
+        newline: as for open() (text files only)
+    """
+    if outputs is None:
+        with open(filePathName, "wb" if binary else "w", newline=None if binary else newline) as outFile:
+            yield outFile
+        return
+    buffer = io.BytesIO() if binary else io.StringIO(newline=newline)
+    yield buffer
+    contents = buffer.getvalue()
+    outputs[os.path.basename(filePathName)] = contents if binary else contents.encode("utf-8")
+
+
+class OutputBundle(object):
+    """
+    SQLite file holding the output files (artefacts) of many audit trails, can be used as a context manager
+    """
+    def __init__(self, bundleFileName):
+        """
+        Args:
+            bundleFileName: the SQLite database, created if it doesn't exist
+        """
+        self.bundleFileName = bundleFileName
+        self.connection = sqlite3.connect(bundleFileName, timeout=60)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS artefacts "
+                                    "(trail TEXT, name TEXT, data BLOB, PRIMARY KEY (trail, name))")
+
+    def put(self, trail, artefacts):
+        """
+        Stores the artefacts of one audit trail, replacing any it had before (in one transaction)
+        Args:
+            trail: audit trail name (raw file name without its extension)
+            artefacts: dict of file name -> bytes
+        """
+        with self.connection:
+            self.connection.execute("DELETE FROM artefacts WHERE trail = ?", (trail,))
+            self.connection.executemany("INSERT INTO artefacts (trail, name, data) VALUES (?, ?, ?)",
+                                        [(trail, name, data) for name, data in artefacts.items()])
+
+    def trails(self):
+        """Names of all the audit trails in the bundle, in the order they were added"""
+        return [trail for trail, in self.connection.execute(
+            "SELECT trail FROM artefacts GROUP BY trail ORDER BY MIN(rowid)")]
+
+    def has(self, trail):
+        return self.connection.execute("SELECT 1 FROM artefacts WHERE trail = ? LIMIT 1", (trail,)).fetchone() \
+            is not None
+
+    def names(self, trail):
+        """File names of an audit trail's artefacts"""
+        return [name for name, in self.connection.execute(
+            "SELECT name FROM artefacts WHERE trail = ? ORDER BY rowid", (trail,))]
+
+    def get(self, trail, suffix):
+        """
+        Contents (bytes) of the artefact of an audit trail whose file name ends with suffix (e.g. "_HMM_List.json",
+        "_cleaned.csv", ".png"), None if it doesn't have one
+        """
+        for name, data in self.connection.execute("SELECT name, data FROM artefacts WHERE trail = ? ORDER BY rowid",
+                                                  (trail,)):
+            if name.endswith(suffix):
+                return bytes(data)
+        return None
+
+    def getJson(self, trail, suffix):
+        """A json artefact, parsed (None if it doesn't have one)"""
+        data = self.get(trail, suffix)
+        return None if data is None else json.loads(data.decode("utf-8"))
+
+    def extract(self, trail, directory):
+        """Writes an audit trail's artefacts out to directory as ordinary files, returns their paths"""
+        paths = []
+        for name, data in self.connection.execute("SELECT name, data FROM artefacts WHERE trail = ? ORDER BY rowid",
+                                                  (trail,)):
+            path = os.path.join(directory, name)
+            with open(path, "wb") as outFile:
+                outFile.write(data)
+            paths.append(path)
+        return paths
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,148 @@
+import os
+import json
+import numpy as np
+
+from AuditTrailTable import AuditTrail
+
+"""
+Binary cache of parsed and cleaned audit trails.
+
+Parsing the csv (or xlsx) export and cleaning it is the same work every time an unchanged audit trail is analyzed
+again, e.g. while tuning the classification rules. After an audit trail has been read, its cleaned event table
+(see AuditTrailTable.AuditTrail) is saved column by column in an uncompressed numpy .npz file next to the input:
+
+    Participant_audit_trails/XX_IDXX_Task1.csv -> Participant_audit_trails/XX_IDXX_Task1.trail.npz
+
+Loading it back is a handful of array reads, no text is parsed. The cache is keyed by:
+- the sha256 hash of the raw audit trail it was built from (see AuditTrailManifest.fileHash)
+- CACHE_VERSION, bumped whenever the layout of the cache changes
+- the cleaning rules it was cleaned with (AuditTrailAnalyzer.REMOVED_DESCRIPTIONS)
+and is simply rebuilt if any of them don't match.
+
+The HMM annotation columns are saved too (with the analyzer version that filled them in), so the HMM scripts can
+take the sequences straight from the cache (see HMM_List_to_Code.py). They're never reused for a new analysis.
+
+A .trail.npz file is also an input format of its own: it can be analyzed without the export it was built from
+(a raw audit trail with the same name takes precedence though, see withoutCacheCopies).
+"""
+
+
+CACHE_SUFFIX = ".trail.npz"
+CACHE_VERSION = "1"
+
+
+def isCacheFile(fileName):
+    return fileName.endswith(CACHE_SUFFIX)
+
+
+def cacheFileName(filePathName):
+    """Path of the cache of a raw audit trail (same folder and name, .trail.npz instead of .csv/.xlsx)"""
+    if isCacheFile(filePathName):
+        return filePathName
+    return os.path.splitext(filePathName)[0] + CACHE_SUFFIX
+
+
+def baseName(fileName):
+    """Name of an audit trail without its extension (XX_IDXX_Task1.csv / .xlsx / .trail.npz -> XX_IDXX_Task1)"""
+    if isCacheFile(fileName):
+        return fileName[:-len(CACHE_SUFFIX)]
+    return os.path.splitext(fileName)[0]
+
+
+def withoutCacheCopies(names):
+    """
+    Drops the cache files of the audit trails whose raw export is in the list as well, so the same audit trail doesn't
+    get analyzed twice. Caches without their export stay in as inputs of their own
+    """
+    rawNames = set(baseName(name) for name in names if not isCacheFile(name))
+    return [name for name in names if not (isCacheFile(name) and baseName(name) in rawNames)]
+
+
+def encodeCategories(values):
+    """(int32 codes, list of distinct values) of a list of strings, values = categories[codes]"""
+    lookup = {}
+    codes = np.array([lookup.setdefault(value, len(lookup)) for value in values], dtype=np.int32)
+    return codes, list(lookup)
+
+
+def saveTrail(trail, cachePathName, sourceHash, cleaningRules, analyzerVersion=""):
+    """
+    Writes an audit trail table to a cache file
+    Args:
+        trail: AuditTrail table, cleaned
+        cachePathName: where to save it (see cacheFileName)
+        sourceHash: content hash of the raw audit trail the table was built from
+        cleaningRules: list of the descriptions removed while cleaning (see AuditTrailAnalyzer.REMOVED_DESCRIPTIONS)
+        analyzerVersion: version of the analysis that filled in the annotation columns ("" if they're blank)
+    """
+    columns = {"header": np.array(trail.header, dtype=str),
+               "index": trail.index,
+               "eventTime": trail.eventTime,
+               "malformedRows": np.array(trail.malformedRows, dtype=np.int64),
+               "metadata": np.array(json.dumps({"cacheVersion": CACHE_VERSION,
+                                                "sourceHash": sourceHash,
+                                                "cleaningRules": list(cleaningRules),
+                                                "analyzerVersion": analyzerVersion}))}
+    for name, codes, categories in [("document", trail.documentCodes, trail.documents),
+                                    ("tab", trail.tabCodes, trail.tabs),
+                                    ("user", trail.userCodes, trail.users),
+                                    ("description", trail.descriptionCodes, trail.descriptions),
+                                    # the annotation columns repeat the same few values too, as numpy strings they'd
+                                    # take the length of the longest value on every row
+                                    ("featureReference",) + encodeCategories(trail.featureReference),
+                                    ("hmmSequence",) + encodeCategories(trail.hmmSequence)]:
+        columns[name + "Codes"] = codes
+        columns[name + "Categories"] = np.array(categories, dtype=str)
+
+    # write to a temporary file first so an interrupted run (or a parallel one) can't leave a half written cache,
+    # np.savez would tack .npz onto the temporary name, so it's given an open file instead
+    temporaryFileName = cachePathName + "." + str(os.getpid()) + ".tmp"
+    with open(temporaryFileName, "wb") as outFile:
+        np.savez(outFile, **columns)
+    os.replace(temporaryFileName, cachePathName)
+
+
+def loadTrail(cachePathName, annotations=True):
+    """
+    Reads an audit trail table back from a cache file
+    Args:
+        cachePathName: path of the .trail.npz file
+        annotations: fill in the feature reference/HMM sequence columns from the cache, otherwise they start out blank
+                     (as needed for a new analysis)
+    Returns:
+        (trail, metadata): the AuditTrail and a dict with the cacheVersion, sourceHash, cleaningRules and
+        analyzerVersion it was saved with
+    """
+    with np.load(cachePathName, allow_pickle=False) as columns:
+        metadata = json.loads(str(columns["metadata"]))
+        categoryColumns = [(columns[name + "Codes"], columns[name + "Categories"].tolist())
+                           for name in ["document", "tab", "user", "description"]]
+        trail = AuditTrail(columns["header"].tolist(), columns["index"], columns["eventTime"], *categoryColumns)
+        trail.malformedRows = columns["malformedRows"].tolist()
+        if annotations:
+            for name in ["featureReference", "hmmSequence"]:
+                categories = columns[name + "Categories"].tolist()
+                setattr(trail, name, [categories[code] for code in columns[name + "Codes"].tolist()])
+    return trail, metadata
+
+
+def loadCachedTrail(filePathName, sourceHash, cleaningRules):
+    """
+    The cached table of a raw audit trail, if there is one that's still valid for these contents and cleaning rules,
+    otherwise None
+    Returns:
+        (trail, analyzerVersion): the AuditTrail (annotation columns blank) and the analyzer version its annotations
+        were saved with (see saveTrail)
+    """
+    cachePathName = cacheFileName(filePathName)
+    if not os.path.isfile(cachePathName):
+        return None
+    try:
+        trail, metadata = loadTrail(cachePathName, annotations=False)
+    except (OSError, ValueError, KeyError):
+        # unreadable (e.g. truncated) cache, it just gets rebuilt
+        return None
+    if metadata.get("cacheVersion") != CACHE_VERSION or metadata.get("sourceHash") != sourceHash or \
+            metadata.get("cleaningRules") != list(cleaningRules):
+        return None
+    return trail, metadata.get("analyzerVersion", "")
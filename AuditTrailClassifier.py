@@ -0,0 +1,285 @@
+import re
+import enum
+import numpy as np
+
+"""
+Classifies audit trail entries by their "Description" text.
+
+The rules below are checked in order and the first one that matches decides the event type of the entry, the same
+way the elif chain in analyzeAuditTrail used to (e.g. anything containing "Move" that isn't an exact "Add part studio
+feature"/"Start edit of part studio feature" or a drawing/partstudio opened entry is a move).
+Rather than running every check on every row, all the rules are compiled into a single regular expression and each
+distinct description string is only classified once (there are only a few dozen distinct descriptions in a trail),
+every row then just looks up the event type of its description code.
+
+Separately from the event type, each description also gets a set of Marker flags used when pairing span start/end
+entries (e.g. "Insert feature", "Cancel Operation"), these are independent of the order of the rules.
+"""
+
+
+class EventType(enum.IntEnum):
+    ADD_FEATURE = 0
+    START_EDIT = 1
+    DRAWING_OPENED = 2
+    PARTSTUDIO_OPENED = 3
+    MOVE_ROLLBACK_BAR = 4
+    MOVE_TAB = 5
+    MOVE_FEATURE = 6
+    UNDO_REDO = 7
+    CREATE_FOLDER = 8
+    RENAME = 9
+    SHOW_HIDE = 10
+    SKETCH = 11
+    DELETE = 12
+    CLOSE_DOCUMENT = 13
+    OPEN_DOCUMENT = 14
+    # entries that are accounted for as part of other entries (e.g. "Insert feature") or deliberately ignored
+    ACCOUNTED_FOR = 15
+    # anything not matched by any of the rules, these get listed in the "skipped" output
+    UNACCOUNTED = 16
+
+
+class Marker(enum.IntFlag):
+    NONE = 0
+    ADD_FEATURE = 1
+    START_EDIT = 2
+    INSERT_FEATURE = 4
+    FEATURE_EDIT = 8     # "Edit : XXX"
+    EDIT = 16            # anything containing "Edit"
+    SKETCH = 32          # "Add or modify a sketch"
+    CANCEL = 64
+    DRAWING_CLOSED = 128
+    PARTSTUDIO_CLOSED = 256
+    UNDO = 512           # "Undo : XXX"
+    REDO = 1024          # "Redo : XXX"
+
+
+# (event type, match kind, pattern(s)), in priority order
+# match kinds: "equals" the whole description, "prefix", "contains" or "regex" (searched anywhere in the description)
+# a tuple of patterns means all of them have to match
+DESCRIPTION_RULES = [
+    (EventType.ADD_FEATURE, "equals", "Add part studio feature"),
+    (EventType.START_EDIT, "equals", "Start edit of part studio feature"),
+    (EventType.DRAWING_OPENED, "contains", "BLOB opened"),
+    (EventType.PARTSTUDIO_OPENED, "contains", "PARTSTUDIO opened"),
+    (EventType.MOVE_ROLLBACK_BAR, "contains", ("Move", "Rollback bar")),
+    (EventType.MOVE_TAB, "contains", ("Move", "tab")),
+    (EventType.MOVE_FEATURE, "contains", "Move"),
+    (EventType.UNDO_REDO, "contains", "Undo Redo"),
+    (EventType.CREATE_FOLDER, "contains", "Create folder"),
+    (EventType.RENAME, "contains", "Rename"),
+    (EventType.SHOW_HIDE, "contains", "Show"),
+    (EventType.SHOW_HIDE, "contains", "Hide"),
+    (EventType.SKETCH, "contains", "Add or modify a sketch"),
+    (EventType.DELETE, "contains", "Delete"),
+    (EventType.CLOSE_DOCUMENT, "contains", "Close document"),
+    (EventType.OPEN_DOCUMENT, "contains", "Open document"),
+    # a list of things that I don't want to be accidentally marked as skipped, they're all accounted for as part of
+    # the entries above
+    (EventType.ACCOUNTED_FOR, "contains", "Edit"),
+    (EventType.ACCOUNTED_FOR, "contains", "Insert feature"),
+    (EventType.ACCOUNTED_FOR, "contains", "Cancel Operation"),
+    (EventType.ACCOUNTED_FOR, "contains", "Create Version"),
+    (EventType.ACCOUNTED_FOR, "contains", "Change size"),
+    (EventType.ACCOUNTED_FOR, "contains", "Change part appearance"),
+    (EventType.ACCOUNTED_FOR, "contains", "Branch Workspace"),
+    (EventType.ACCOUNTED_FOR, "contains", "Suppress"),
+    (EventType.ACCOUNTED_FOR, "contains", "Unsuppress"),
+    (EventType.ACCOUNTED_FOR, "contains", "Unpack"),
+    (EventType.ACCOUNTED_FOR, "contains", "Create variable"),
+    (EventType.ACCOUNTED_FOR, "contains", "Insert tab"),
+    (EventType.ACCOUNTED_FOR, "contains", "BLOB closed"),
+    (EventType.ACCOUNTED_FOR, "contains", "PARTSTUDIO closed"),
+    (EventType.ACCOUNTED_FOR, "contains", "Update version"),
+    (EventType.ACCOUNTED_FOR, "contains", "Create version"),
+    (EventType.ACCOUNTED_FOR, "contains", "Undo : "),
+    (EventType.ACCOUNTED_FOR, "contains", "Redo : "),
+    (EventType.ACCOUNTED_FOR, "contains", "Tab Part Studio 1 Copy 1 of type PARTSTUDIO created by CAD_Study"),
+]
+
+# (marker, match kind, pattern(s)), every marker that matches is set
+MARKER_RULES = [
+    (Marker.ADD_FEATURE, "contains", "Add part studio feature"),
+    (Marker.START_EDIT, "contains", "Start edit of part studio feature"),
+    (Marker.INSERT_FEATURE, "contains", "Insert feature"),
+    (Marker.FEATURE_EDIT, "contains", "Edit :"),
+    (Marker.EDIT, "contains", "Edit"),
+    (Marker.SKETCH, "contains", "Add or modify a sketch"),
+    (Marker.CANCEL, "contains", "Cancel Operation"),
+    (Marker.DRAWING_CLOSED, "contains", "BLOB closed"),
+    (Marker.PARTSTUDIO_CLOSED, "contains", "PARTSTUDIO closed"),
+    (Marker.UNDO, "contains", "Undo : "),
+    (Marker.REDO, "contains", "Redo : "),
+]
+
+
+def compileRule(kind, patterns):
+    """
+    Turns one rule into a regular expression lookahead, so that it can be combined with other rules without
+    consuming any of the description
+    """
+    if isinstance(patterns, str):
+        patterns = (patterns,)
+    lookaheads = []
+    for pattern in patterns:
+        if kind == "equals":
+            lookaheads.append("(?=" + re.escape(pattern) + r"\Z)")
+        elif kind == "prefix":
+            lookaheads.append("(?=" + re.escape(pattern) + ")")
+        elif kind == "contains":
+            lookaheads.append("(?=.*?" + re.escape(pattern) + ")")
+        elif kind == "regex":
+            lookaheads.append("(?=.*?(?:" + pattern + "))")
+        else:
+            raise ValueError("Unknown rule kind: " + str(kind))
+    return "".join(lookaheads)
+
+
+def ruleName(rule):
+    """Readable name of a rule for the hit counter report, e.g. 'MOVE_FEATURE contains Move'"""
+    eventType, kind, patterns = rule
+    if not isinstance(patterns, str):
+        patterns = " & ".join(patterns)
+    return eventType.name + " " + kind + " " + repr(patterns)
+
+
+class DescriptionClassifier(object):
+    """
+    Compiled, memoized version of the description rule table
+    """
+    def __init__(self, rules=DESCRIPTION_RULES, markerRules=MARKER_RULES):
+        self.rules = list(rules)
+        self.markerRules = list(markerRules)
+        # alternatives are tried in order at the start of the string, so the first rule whose lookahead matches wins
+        self.matcher = re.compile("|".join("(?P<rule" + str(number) + ">" + compileRule(kind, patterns) + ")"
+                                           for number, (eventType, kind, patterns) in enumerate(self.rules)),
+                                  re.DOTALL)
+        self.markerMatchers = [(marker, re.compile(compileRule(kind, patterns), re.DOTALL))
+                               for marker, kind, patterns in self.markerRules]
+        # description -> (event type, rule number, markers)
+        self.cache = {}
+        # number of entries each rule has matched (last slot is for unmatched entries)
+        self.ruleHits = np.zeros(len(self.rules) + 1, dtype=np.int64)
+
+    def classify(self, description):
+        """
+        Returns (event type, number of the matching rule, markers) for one description, only the first call for
+        each distinct description actually runs the rules
+        """
+        try:
+            return self.cache[description]
+        except KeyError:
+            pass
+        match = self.matcher.match(description)
+        if match is None:
+            eventType, ruleNumber = EventType.UNACCOUNTED, len(self.rules)
+        else:
+            ruleNumber = int(match.lastgroup[len("rule"):])
+            eventType = self.rules[ruleNumber][0]
+        markers = Marker.NONE
+        for marker, markerMatcher in self.markerMatchers:
+            if markerMatcher.match(description):
+                markers |= marker
+        self.cache[description] = (eventType, ruleNumber, markers)
+        return self.cache[description]
+
+    def classifyTrail(self, trail):
+        """
+        Classifies every row of an AuditTrail table, each distinct description is classified once and the result
+        is spread to the rows through the description codes
+        Returns (eventTypes, markers): int arrays with one entry per row
+        """
+        classified = [self.classify(description) for description in trail.descriptions]
+        eventTypes = np.array([eventType for eventType, ruleNumber, markers in classified], dtype=np.int8)
+        ruleNumbers = np.array([ruleNumber for eventType, ruleNumber, markers in classified], dtype=np.int32)
+        markerFlags = np.array([int(markers) for eventType, ruleNumber, markers in classified], dtype=np.int32)
+        codes = trail.descriptionCodes
+        self.ruleHits += np.bincount(ruleNumbers[codes], minlength=len(self.ruleHits))
+        return eventTypes[codes], markerFlags[codes]
+
+    def hitCounts(self):
+        """(rule name, hits) for every rule, most used first"""
+        names = [ruleName(rule) for rule in self.rules] + ["UNACCOUNTED (no rule)"]
+        counts = sorted(zip(names, self.ruleHits.tolist()), key=lambda item: -item[1])
+        return counts
+
+    def printHitCounts(self):
+        print("Description rule hits:")
+        for name, hits in self.hitCounts():
+            print("\t" + str(hits) + "\t" + name)
+
+
+class MarkerWindow(object):
+    """
+    Bitmap of the entries of a trail that have one marker (e.g. Marker.SKETCH, "Add or modify a sketch"), with the
+    running count of marked entries before every position, so whether there's a marked entry within radius entries of
+    a position is two lookups, whatever the radius. The bitmap is built once per trail (extend can add more entries,
+    e.g. in live mode, see AuditTrailLive)
+    With sameTab only the marked entries in the same tab as the position count: every tab that has marked entries gets
+    its own running counts
+    """
+    def __init__(self, marker, radius=1, sameTab=False):
+        """
+        Args:
+            marker: the Marker flag to look for
+            radius: default number of entries looked at on either side of a position
+            sameTab: only count marked entries in the same tab as the position
+        """
+        self.marker = int(marker)
+        self.radius = radius
+        self.sameTab = sameTab
+        self.flags = []
+        self.tabs = []
+        # number of marked entries before each position (one more entry than there are positions)
+        self.counts = [0]
+        # tab -> the same running counts for the marked entries in that tab
+        self.tabCounts = {}
+
+    def __len__(self):
+        return len(self.flags)
+
+    def extend(self, markers, tabs):
+        """Adds the markers and tabs (or tab codes) of the next entries, oldest first"""
+        flags = (np.asarray(markers, dtype=np.int64) & self.marker) != 0
+        tabs = np.asarray(tabs)
+        start = len(self.flags)
+        self.counts.extend((np.cumsum(flags) + self.counts[-1]).tolist())
+        if self.sameTab:
+            for tab in np.unique(tabs[flags]).tolist():
+                self.tabCounts.setdefault(tab, [0] * (start + 1))
+            for tab, counts in self.tabCounts.items():
+                counts.extend((np.cumsum(flags & (tabs == tab)) + counts[-1]).tolist())
+            self.tabs.extend(tabs.tolist())
+        self.flags.extend(flags.tolist())
+
+    def near(self, position, radius=None):
+        """Whether there's a marked entry within radius entries of position (not counting the position itself)"""
+        radius = self.radius if radius is None else radius
+        counts = self.tabCounts.get(self.tabs[position]) if self.sameTab else self.counts
+        if counts is None:
+            return False
+        low = max(position - radius, 0)
+        high = min(position + radius, len(self.flags) - 1)
+        return counts[high + 1] - counts[low] - self.flags[position] > 0
+
+    def nearMany(self, positions, radius=None):
+        """near for an array of positions at once (e.g. to compare radii over a whole cohort), bool array"""
+        radius = self.radius if radius is None else radius
+        positions = np.asarray(positions, dtype=np.int64)
+        low = np.maximum(positions - radius, 0)
+        high = np.minimum(positions + radius, len(self.flags) - 1) + 1
+        flags = np.asarray(self.flags, dtype=np.int64)[positions]
+        if not self.sameTab:
+            counts = np.asarray(self.counts, dtype=np.int64)
+            return counts[high] - counts[low] - flags > 0
+        near = np.zeros(len(positions), dtype=bool)
+        tabs = np.asarray(self.tabs)[positions] if len(positions) else np.asarray(self.tabs)
+        for tab, counts in self.tabCounts.items():
+            inTab = tabs == tab
+            counts = np.asarray(counts, dtype=np.int64)
+            near[inTab] = counts[high[inTab]] - counts[low[inTab]] - flags[inTab] > 0
+        return near
+
+
+# shared classifier, keeps its memoized descriptions and hit counters across all the trails analyzed in one run
+defaultClassifier = DescriptionClassifier()
@@ -0,0 +1,341 @@
+import os
+import re
+import csv
+import json
+import hashlib
+import argparse
+import numpy as np
+
+from AuditTrailDatabase import MetricsStore, COLUMN_NAMES, COUNTER_COLUMNS, DEFAULT_DATABASE
+
+"""
+Cohort summaries of the metrics database (see AuditTrailDatabase), e.g. experts vs intermediates on Task1/Task2.
+
+The rows of the metrics store are loaded into typed numpy columns (CohortTable): durations in seconds and the
+unaccounted percentage as float64 (NaN where the database has NULL), counters as int64, plus the ratios in RATIOS
+worked out for every audit trail (e.g. unaccountedRatio = unaccountedTime / partstudioTime).
+Every audit trail also gets attributes to group by:
+- participant, task and condition, taken from its file name: the "IDxx" part is the participant, the "Taskx" part the
+  task and whatever else is left the condition (e.g. BT_ID01_Task1_cleaned -> condition BT, participant ID01, task
+  Task1)
+- any columns of the participant attributes csv (Participant_attributes.csv, a "participant" column and then any
+  others, e.g. skillLevel), matched on the participant
+
+groupSummary works out, for every metric, the number of audit trails, mean, standard deviation, median and a
+bootstrap confidence interval of the mean for all the groups at once: the groups are integer codes, so the sums go
+through np.bincount, the medians come from one lexsort and the bootstrap draws every resample of every group in one
+array. The ratios also get their pooled value (sum of the numerators over sum of the denominators of the group).
+
+Summaries are memoized (Cohort) under a fingerprint of the database rows and the attributes file, in memory and in
+Analysis_output/Audit_Trail_Cohort_cache.json, so they're only worked out again once an audit trail has been
+(re)analyzed or the attributes have changed.
+
+Usage:
+    python AuditTrailCohort.py --by skillLevel task [--metrics totalTime unaccountedRatio] [--csv out.csv]
+"""
+
+
+# name -> (numerator column, denominator column), worked out for every audit trail
+RATIOS = {
+    "unaccountedRatio": ("unaccountedTime", "partstudioTime"),
+    "accountedRatio": ("partstudioTimeAccountedFor", "partstudioTime"),
+    "partstudioShare": ("partstudioTime", "totalTime"),
+    "readDrawingShare": ("readDrawingTime", "totalTime"),
+}
+
+# the attributes taken from the file name
+NAME_ATTRIBUTES = ["participant", "task", "condition"]
+
+DEFAULT_ATTRIBUTES = "Participant_attributes.csv"
+DEFAULT_CACHE = os.path.join("Analysis_output", "Audit_Trail_Cohort_cache.json")
+# bump whenever a change would change the summaries, so the ones saved in the cache are worked out again
+SUMMARY_VERSION = 2
+
+
+def parseTrailName(fileName):
+    """participant, task and condition of an audit trail from its file name (see module docstring), "" if missing"""
+    name = re.sub(r"_cleaned$", "", os.path.splitext(os.path.basename(fileName))[0])
+    attributes = {"participant": "", "task": "", "condition": ""}
+    condition = []
+    for token in name.split("_"):
+        if re.fullmatch(r"ID\d+", token, re.IGNORECASE):
+            attributes["participant"] = token.upper()
+        elif re.fullmatch(r"Task\d+", token, re.IGNORECASE):
+            attributes["task"] = token[0].upper() + token[1:].lower()
+        elif token:
+            condition.append(token)
+    attributes["condition"] = "_".join(condition)
+    return attributes
+
+
+def loadAttributes(attributesFileName):
+    """participant -> {attribute: value} from a participant attributes csv (first column is the participant)"""
+    with open(attributesFileName, "r", newline="") as in_file:
+        rows = [row for row in csv.reader(in_file) if row]
+    if not rows:
+        return {}
+    header = [name.strip() for name in rows[0][1:]]
+    return {row[0].strip().upper(): dict(zip(header, (value.strip() for value in row[1:]))) for row in rows[1:]}
+
+
+class CohortTable(object):
+    """
+    The metrics database as typed columns, one entry per audit trail
+    Attributes:
+        fileNames: list of the audit trails' file names
+        metrics: metric name -> float64 (durations in seconds, percentages, ratios) or int64 (counters) array
+        attributes: attribute name -> array of strings ("" where unknown)
+    """
+    def __init__(self, records, participantAttributes=None):
+        """
+        Args:
+            records: rows of the metrics store in COLUMN_NAMES order (see MetricsStore.records)
+            participantAttributes: participant -> {attribute: value} (see loadAttributes)
+        """
+        self.fileNames = [record[0] for record in records]
+        self.metrics = {}
+        for column, name in enumerate(COLUMN_NAMES[1:], 1):
+            if name in COUNTER_COLUMNS:
+                self.metrics[name] = np.array([record[column] for record in records], dtype=np.int64)
+            else:
+                # NULLs (None) become NaN
+                self.metrics[name] = np.array([record[column] for record in records], dtype=np.float64)
+        for name, (numerator, denominator) in RATIOS.items():
+            numerators = self.metrics[numerator].astype(np.float64)
+            denominators = self.metrics[denominator].astype(np.float64)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                self.metrics[name] = np.where(denominators > 0, numerators / denominators, np.nan)
+
+        fromNames = [parseTrailName(fileName) for fileName in self.fileNames]
+        self.attributes = {name: np.array([attributes[name] for attributes in fromNames], dtype=str)
+                           for name in NAME_ATTRIBUTES}
+        participantAttributes = participantAttributes or {}
+        extra = []
+        for attributes in participantAttributes.values():
+            extra.extend(name for name in attributes if name not in extra and name not in self.attributes)
+        for name in extra:
+            self.attributes[name] = np.array([participantAttributes.get(participant, {}).get(name, "")
+                                              for participant in self.attributes["participant"].tolist()], dtype=str)
+
+    def __len__(self):
+        return len(self.fileNames)
+
+    def groupCodes(self, by):
+        """
+        Integer group code of every audit trail for the attributes in by
+        Returns (codes, groups): int64 array, and the attribute values of every group (tuples, sorted)
+        """
+        if not by:
+            return np.zeros(len(self), dtype=np.int64), [()]
+        for name in by:
+            if name not in self.attributes:
+                raise KeyError("Unknown attribute: " + name + " (one of " + ", ".join(self.attributes) + ")")
+        keys = np.array(["\x1f".join(values) for values in zip(*(self.attributes[name].tolist() for name in by))],
+                        dtype=str)
+        unique, codes = np.unique(keys, return_inverse=True)
+        return codes.ravel().astype(np.int64), [tuple(key.split("\x1f")) for key in unique.tolist()]
+
+
+def groupStatistics(values, codes, nGroups, confidence=0.95, resamples=2000, random=None):
+    """
+    Statistics of one metric for every group, NaNs are left out
+    Args:
+        values: the metric of every audit trail
+        codes: group code of every audit trail (0 ... nGroups - 1)
+        confidence: level of the bootstrap confidence interval of the mean
+        resamples: number of bootstrap resamples (0 for no confidence interval)
+        random: numpy Generator for the resamples
+    Returns:
+        dict of float64 arrays with one entry per group: n, mean, std, median, ciLow, ciHigh (NaN where a group
+        doesn't have enough values)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    values, codes = values[valid], codes[valid]
+    n = np.bincount(codes, minlength=nGroups).astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.bincount(codes, weights=values, minlength=nGroups) / n
+        squares = np.bincount(codes, weights=(values - mean[codes]) ** 2, minlength=nGroups)
+        std = np.where(n > 1, np.sqrt(squares / (n - 1)), np.nan)
+
+    # values sorted within each group, the groups one after the other
+    order = np.lexsort((values, codes))
+    ordered = values[order]
+    counts = n.astype(np.int64)
+    starts = np.cumsum(counts) - counts
+    median = np.full(nGroups, np.nan)
+    present = counts > 0
+    median[present] = (ordered[starts[present] + (counts[present] - 1) // 2] +
+                       ordered[starts[present] + counts[present] // 2]) / 2
+
+    ciLow = np.full(nGroups, np.nan)
+    ciHigh = np.full(nGroups, np.nan)
+    if resamples and len(ordered):
+        random = random if random is not None else np.random.default_rng(0)
+        # every resample draws n values (with replacement) from its own group, for all the groups at once
+        groupOf = codes[order]
+        draws = starts[groupOf] + (random.random((resamples, len(ordered))) * counts[groupOf]).astype(np.int64)
+        slots = (np.arange(resamples)[:, None] * nGroups + groupOf[None, :]).ravel()
+        means = np.bincount(slots, weights=ordered[draws].ravel(), minlength=resamples * nGroups).reshape(
+            resamples, nGroups) / np.maximum(counts, 1)
+        tail = (1 - confidence) / 2 * 100
+        spread = counts > 1
+        if spread.any():
+            ciLow[spread], ciHigh[spread] = np.percentile(means[:, spread], [tail, 100 - tail], axis=0)
+    return {"n": n, "mean": mean, "std": std, "median": median, "ciLow": ciLow, "ciHigh": ciHigh}
+
+
+def groupSummary(table, by, metrics=None, confidence=0.95, resamples=2000, seed=0):
+    """
+    Summary of the metrics of a CohortTable grouped by the attributes in by (see module docstring)
+    Args:
+        by: attribute names, e.g. ["skillLevel", "task"] (empty for the whole cohort)
+        metrics: metric names, defaults to all of them
+        confidence, resamples: bootstrap confidence interval of the means (see groupStatistics)
+        seed: seed of the resamples, the same seed gives the same intervals
+    Returns:
+        {"by": by, "groups": [attribute values], "trails": [number of audit trails],
+         "metrics": {metric: {"n", "mean", "std", "median", "ciLow", "ciHigh"[, "pooled"]}}} with a list entry per
+        group (plain lists, so the summary can go into json)
+    """
+    codes, groups = table.groupCodes(by)
+    nGroups = len(groups)
+    random = np.random.default_rng(seed)
+    metrics = list(metrics) if metrics else list(table.metrics)
+    summary = {"by": list(by), "groups": [list(group) for group in groups],
+               "trails": np.bincount(codes, minlength=nGroups).tolist(), "metrics": {}}
+    for name in metrics:
+        if name not in table.metrics:
+            raise KeyError("Unknown metric: " + name + " (one of " + ", ".join(table.metrics) + ")")
+        statistics = groupStatistics(table.metrics[name], codes, nGroups, confidence, resamples, random)
+        if name in RATIOS:
+            numerator, denominator = (table.metrics[column].astype(np.float64) for column in RATIOS[name])
+            both = ~np.isnan(numerator) & ~np.isnan(denominator)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                statistics["pooled"] = np.bincount(codes[both], weights=numerator[both], minlength=nGroups) / \
+                    np.bincount(codes[both], weights=denominator[both], minlength=nGroups)
+        summary["metrics"][name] = {key: value.tolist() for key, value in statistics.items()}
+    return summary
+
+
+def summaryRows(summary):
+    """The summary as csv rows: one row per group and metric"""
+    statistics = ["n", "mean", "std", "median", "ciLow", "ciHigh", "pooled"]
+    rows = [summary["by"] + ["trails", "metric"] + statistics]
+    for position, group in enumerate(summary["groups"]):
+        for name, values in summary["metrics"].items():
+            rows.append(list(group) + [summary["trails"][position], name] +
+                        [values[key][position] if key in values else "" for key in statistics])
+    return rows
+
+
+def printSummary(summary):
+    """Prints a summary (see groupSummary) as a table per metric"""
+    by = summary["by"] or ["cohort"]
+    for name, values in summary["metrics"].items():
+        print("\n### " + name + " ###")
+        print(" / ".join(by).ljust(28) + "".join(column.rjust(12) for column in
+                                                 ["n", "mean", "median", "ci low", "ci high"] +
+                                                 (["pooled"] if "pooled" in values else [])))
+        for position, group in enumerate(summary["groups"]):
+            line = (" / ".join(value or "-" for value in group) or "all").ljust(28)
+            line += str(int(values["n"][position])).rjust(12)
+            for key in ["mean", "median", "ciLow", "ciHigh"] + (["pooled"] if "pooled" in values else []):
+                line += ("%.3f" % values[key][position]).rjust(12)
+            print(line)
+
+
+class Cohort(object):
+    """
+    Memoized group summaries of the metrics database: a summary is only worked out again once the database rows or
+    the participant attributes have changed (see module docstring)
+    """
+    def __init__(self, databaseFileName=DEFAULT_DATABASE, attributesFileName=DEFAULT_ATTRIBUTES,
+                 cacheFileName=DEFAULT_CACHE):
+        """
+        Args:
+            databaseFileName: the metrics database (see AuditTrailDatabase.MetricsStore)
+            attributesFileName: participant attributes csv, skipped if it doesn't exist
+            cacheFileName: json file the summaries are kept in between runs (None to only keep them in memory)
+        """
+        self.databaseFileName = databaseFileName
+        self.attributesFileName = attributesFileName
+        self.cacheFileName = cacheFileName
+        self.fingerprint = None
+        self.cohortTable = None
+        self.summaries = {}
+
+    def load(self):
+        """(records, participant attributes, fingerprint) of the current database rows and attributes file"""
+        with MetricsStore(self.databaseFileName) as store:
+            records = store.records()
+        digest = hashlib.sha256(repr(records).encode("utf-8"))
+        attributes = {}
+        if self.attributesFileName is not None and os.path.isfile(self.attributesFileName):
+            attributes = loadAttributes(self.attributesFileName)
+            digest.update(repr(sorted((participant, sorted(values.items()))
+                                      for participant, values in attributes.items())).encode("utf-8"))
+        return records, attributes, digest.hexdigest()
+
+    def table(self):
+        """The CohortTable of the current database rows, only rebuilt when they've changed"""
+        records, attributes, fingerprint = self.load()
+        if fingerprint != self.fingerprint:
+            self.fingerprint = fingerprint
+            self.cohortTable = CohortTable(records, attributes)
+            self.summaries = self.readCache(fingerprint)
+        return self.cohortTable
+
+    def readCache(self, fingerprint):
+        """
+        The summaries saved for this fingerprint, anything saved for other rows (or by another SUMMARY_VERSION) is
+        dropped
+        """
+        if self.cacheFileName is None or not os.path.isfile(self.cacheFileName):
+            return {}
+        with open(self.cacheFileName, "r") as in_file:
+            try:
+                cache = json.load(in_file)
+            except ValueError:
+                return {}
+        if cache.get("fingerprint") != fingerprint or cache.get("version") != SUMMARY_VERSION:
+            return {}
+        return cache.get("summaries", {})
+
+    def writeCache(self):
+        if self.cacheFileName is None:
+            return
+        with open(self.cacheFileName, "w") as out_file:
+            json.dump({"fingerprint": self.fingerprint, "version": SUMMARY_VERSION, "summaries": self.summaries},
+                      out_file)
+
+    def summary(self, by=(), metrics=None, confidence=0.95, resamples=2000, seed=0):
+        """groupSummary of the current database rows, from the memo if the rows haven't changed since"""
+        table = self.table()
+        key = json.dumps([list(by), list(metrics) if metrics else None, confidence, resamples, seed])
+        if key not in self.summaries:
+            self.summaries[key] = groupSummary(table, by, metrics, confidence, resamples, seed)
+            self.writeCache()
+        return self.summaries[key]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Group summaries (mean, median, confidence intervals, ratios) of "
+                                                 "the audit trail metrics database")
+    parser.add_argument("--by", nargs="*", default=["task"],
+                        help="attributes to group by: participant, task, condition or any column of the attributes "
+                             "csv (e.g. skillLevel)")
+    parser.add_argument("--metrics", nargs="*", default=None, help="metrics to summarize (default all)")
+    parser.add_argument("--database", default=DEFAULT_DATABASE, help="metrics database")
+    parser.add_argument("--attributes", default=DEFAULT_ATTRIBUTES, help="participant attributes csv")
+    parser.add_argument("--confidence", type=float, default=0.95, help="confidence level of the intervals")
+    parser.add_argument("--resamples", type=int, default=2000, help="bootstrap resamples for the intervals")
+    parser.add_argument("--csv", default=None, help="also write the summary to this csv file")
+    args = parser.parse_args()
+
+    cohort = Cohort(args.database, args.attributes)
+    summary = cohort.summary(args.by, args.metrics, args.confidence, args.resamples)
+    printSummary(summary)
+    if args.csv:
+        with open(args.csv, "w", newline="") as out_file:
+            csv.writer(out_file).writerows(summaryRows(summary))
@@ -0,0 +1,190 @@
+import os
+import csv
+import sqlite3
+import datetime
+
+"""
+Keyed store for the per audit trail metrics (one row per cleaned audit trail, keyed by its file name).
+
+Previously every analyzed audit trail read the whole of Analysis_output/Audit_Trail_Database.csv, searched it for a
+row with the same file name and wrote the whole file back out. The metrics now live in an SQLite database
+(Analysis_output/Audit_Trail_Database.sqlite) with a typed schema:
+- durations are stored as integer seconds (rather than the "H:MM:SS" strings of the timedeltas)
+- the unaccounted ratio is stored as a percentage (REAL)
+- the counters are integers
+- when the part studio time is less than the time accounted for, the unaccounted time/ratio are NULL (the csv shows
+    999 for these, see analyzeAuditTrail)
+Adding/updating rows is a single transactional upsert on the file name, and exportCsv writes the database out in the
+same layout Audit_Trail_Database.csv has always had. The first time the SQLite database is created, any rows already
+in Audit_Trail_Database.csv are imported into it (anything that isn't a row of metrics, e.g. a header row added by
+hand, is skipped).
+"""
+
+
+# (column name, SQL type) in the order of the csv/rowEntry layout ("Counters ->" is a separator column in the csv only)
+DURATION_COLUMNS = ["totalTime", "partstudioTime", "partstudioTimeAccountedFor", "unaccountedTime", "readDrawingTime",
+                    "sketchCreateTime", "featureCreateTime", "sketchEditTime", "featureEditTime",
+                    "cancelledCreateTime", "cancelledEditTime"]
+COUNTER_COLUMNS = ["sketchesCreated", "featuresCreated", "operationsCancelled", "sketchesEdited", "featuresEdited",
+                   "switchedToDrawing", "movedFeature", "movedRollbackBar", "undoRedo", "createFolder",
+                   "renameFeature", "showHide", "deletedFeature"]
+COLUMNS = [("fileName", "TEXT PRIMARY KEY")] + \
+          [(name, "INTEGER") for name in DURATION_COLUMNS] + \
+          [("unaccountedPercent", "REAL")] + \
+          [(name, "INTEGER") for name in COUNTER_COLUMNS]
+COLUMN_NAMES = [name for name, sqlType in COLUMNS]
+
+# value written to the csv for the unaccounted time/ratio when they couldn't be calculated
+OVERRUN_SENTINEL = 999
+
+# adds a row, or writes over the existing row with the same file name
+UPSERT = "INSERT INTO metrics (" + ", ".join(COLUMN_NAMES) + ") " + \
+         "VALUES (" + ", ".join("?" for name in COLUMN_NAMES) + ") " + \
+         "ON CONFLICT(fileName) DO UPDATE SET " + ", ".join(name + " = excluded." + name for name in COLUMN_NAMES[1:])
+
+DEFAULT_DATABASE = os.path.join("Analysis_output", "Audit_Trail_Database.sqlite")
+DEFAULT_CSV = os.path.join("Analysis_output", "Audit_Trail_Database.csv")
+
+
+def toSeconds(duration):
+    """timedelta (or "H:MM:SS"/"X days, H:MM:SS" string from the csv) -> integer seconds"""
+    if isinstance(duration, datetime.timedelta):
+        return int(duration.total_seconds())
+    if isinstance(duration, (int, float)):
+        return int(duration)
+    days = 0
+    if "day" in duration:
+        dayPart, duration = duration.split(",")
+        days = int(dayPart.split()[0])
+    hours, minutes, seconds = duration.strip().split(":")
+    return days * 86400 + int(hours) * 3600 + int(minutes) * 60 + int(float(seconds))
+
+
+def isDataRow(row):
+    """True if a row read from Audit_Trail_Database.csv is a row of metrics (not e.g. a header row)"""
+    if len(row) < 14 + len(COUNTER_COLUMNS):
+        return False
+    try:
+        toSeconds(row[1])
+    except ValueError:
+        return False
+    return True
+
+
+def readCsvRows(csvFileName):
+    """The rows of metrics of a csv in the Audit_Trail_Database.csv layout, see isDataRow"""
+    with open(csvFileName, 'r', newline='') as csv_file:
+        return [row for row in csv.reader(csv_file) if isDataRow(row)]
+
+
+def rowEntryToRecord(rowEntry):
+    """
+    Converts a database row as returned by analyzeAuditTrail (or read from the csv) into a tuple of typed column
+    values in COLUMN_NAMES order
+    """
+    fileName = rowEntry[0]
+    durations = []
+    for position, name in enumerate(DURATION_COLUMNS):
+        value = rowEntry[1 + position]
+        if name == "unaccountedTime" and str(value) == str(OVERRUN_SENTINEL):
+            durations.append(None)
+        else:
+            durations.append(toSeconds(value))
+    unaccountedPercent = float(rowEntry[12])
+    if unaccountedPercent == OVERRUN_SENTINEL * 100:
+        unaccountedPercent = None
+    # rowEntry[13] is the "Counters ->" separator
+    counters = [int(value) for value in rowEntry[14:14 + len(COUNTER_COLUMNS)]]
+    return tuple([fileName] + durations + [unaccountedPercent] + counters)
+
+
+def recordToCsvRow(record):
+    """Inverse of rowEntryToRecord, gives the row in the Audit_Trail_Database.csv layout"""
+    row = [record[0]]
+    for value in record[1:1 + len(DURATION_COLUMNS)]:
+        row.append(OVERRUN_SENTINEL if value is None else str(datetime.timedelta(seconds=value)))
+    unaccountedPercent = record[1 + len(DURATION_COLUMNS)]
+    row.append(OVERRUN_SENTINEL * 100 if unaccountedPercent is None else unaccountedPercent)
+    row.append("Counters ->")
+    row.extend(record[2 + len(DURATION_COLUMNS):])
+    return row
+
+
+class MetricsStore(object):
+    """
+    SQLite backed audit trail metrics database, can be used as a context manager:
+        with MetricsStore() as store:
+            store.upsert(rowEntries)
+            store.exportCsv()
+    """
+    def __init__(self, databaseFileName=DEFAULT_DATABASE, legacyCsvFileName=DEFAULT_CSV):
+        """
+        Args:
+            databaseFileName: the SQLite database, created if it doesn't exist
+            legacyCsvFileName: csv database to import rows from when the SQLite database is first created (None to
+                               skip)
+        """
+        self.databaseFileName = databaseFileName
+        self.connection = sqlite3.connect(databaseFileName, timeout=60)
+        # the table is created and the legacy rows imported in one transaction, if the import fails there's no table
+        # left behind and it's tried again next time. IMMEDIATE takes the write lock before checking for the table, so
+        # two processes opening a new database don't both import the csv
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            created = self.createTable()
+            if created and legacyCsvFileName is not None and os.path.isfile(legacyCsvFileName):
+                self.connection.executemany(UPSERT, [rowEntryToRecord(row) for row in readCsvRows(legacyCsvFileName)])
+
+    def createTable(self):
+        """
+        Creates the metrics table if needed (within the current transaction, nothing is committed), returns True if it
+        didn't exist yet
+        """
+        exists = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'metrics'").fetchone() is not None
+        if not exists:
+            self.connection.execute("CREATE TABLE metrics (" +
+                                    ", ".join(name + " " + sqlType for name, sqlType in COLUMNS) + ")")
+        return not exists
+
+    def upsert(self, rowEntries):
+        """
+        Adds the rows (as returned by analyzeAuditTrail), writing over the existing row for the same file name. All
+        the rows are added in one transaction. Updated rows keep their place in the exported csv, new ones go at the
+        end
+        """
+        records = [rowEntryToRecord(rowEntry) for rowEntry in rowEntries]
+        with self.connection:
+            self.connection.executemany(UPSERT, records)
+
+    def importCsv(self, csvFileName):
+        """Upserts every row of metrics of a csv in the Audit_Trail_Database.csv layout (see isDataRow)"""
+        self.upsert(readCsvRows(csvFileName))
+
+    def get(self, fileName):
+        """The typed row (dict of column name -> value) for one audit trail, or None"""
+        record = self.connection.execute("SELECT " + ", ".join(COLUMN_NAMES) + " FROM metrics WHERE fileName = ?",
+                                         (fileName,)).fetchone()
+        if record is None:
+            return None
+        return dict(zip(COLUMN_NAMES, record))
+
+    def records(self):
+        """All the rows as tuples in COLUMN_NAMES order, in the order they were first added"""
+        return self.connection.execute("SELECT " + ", ".join(COLUMN_NAMES) + " FROM metrics ORDER BY rowid").fetchall()
+
+    def exportCsv(self, csvFileName=DEFAULT_CSV):
+        """Writes the whole database out in the Audit_Trail_Database.csv layout"""
+        with open(csvFileName, "w", newline="") as out_file:
+            writer = csv.writer(out_file)
+            for record in self.records():
+                writer.writerow(recordToCsvRow(record))
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,351 @@
+import io
+import os
+import csv
+import sys
+import time
+import bisect
+import argparse
+import datetime
+
+from AuditTrailAnalyzer import REMOVED_DESCRIPTIONS, SKETCH_WINDOW, SKETCH_SAME_TAB, TrailAnalysis, databaseRow, \
+    updateDatabase, exportDatabase
+from AuditTrailTable import parseEventTimes
+from AuditTrailPairing import SpanPairer
+from AuditTrailClassifier import EventType, Marker, MarkerWindow, defaultClassifier
+from AuditTrailTimeseries import EPOCH
+from AuditTrailCache import baseName
+
+"""
+Live mode: follows an audit trail file while the session is still going and keeps the metrics up to date as new
+entries are added to it, without analyzing the whole audit trail again every time.
+
+Every new entry goes through the same steps as in the batch analysis, one entry at a time:
+- cleaning (entries with REMOVED_DESCRIPTIONS are dropped) and event time parsing
+- classification (DescriptionClassifier.classify, memoized per description)
+- span pairing: the SpanPairer keeps its queues of span starts still waiting for their end entry between updates,
+  these are the pending spans (e.g. the part studio that's still open, a feature being created)
+- the per entry analysis (AuditTrailAnalyzer.TrailAnalysis), as soon as the entries it depends on have come in: a
+  create/edit needs its end entry and the entries after it within the sketch window (see
+  AuditTrailAnalyzer.SKETCH_WINDOW), an undo/redo the entry after it. Entries are analyzed in
+  order (an entry's annotations can be overwritten by the entries before it), except for drawing/partstudio opens,
+  which can wait for their close entry while the entries after them are analyzed (nothing else writes to them)
+The category totals and counters (see AuditTrailTimeseries.CATEGORIES) are added up from the new spans only, and the
+HMM list is kept in order of position as new entries are added to it. Once "Close document" comes in, everything
+left is analyzed like the last entries of a complete audit trail and the database row is the same as the one
+AuditTrailAnalyzer.read_file gives for the finished audit trail.
+
+Two file layouts can be followed:
+- entries appended at the end of the file (header first, then oldest entry first), e.g. written by a logger as the
+  events happen. Only the bytes added since the last update are read
+- newest entry first, like an export from Onshape that is exported again over the same file (--newest-first), the
+  new entries are the ones at the top of the file
+
+Entries are named by the index they had in the file they were read from (e.g. in the skipped features and the
+"Issue with date time entry" messages). The batch analysis names them by the cleaned numbering instead (1 for the
+newest entry that's kept, counting up from there), which isn't known until the session is over, so the same entry
+can have a different index in the live and batch messages. The database row is the same.
+
+Usage:
+    python AuditTrailLive.py Participant_audit_trails/ID01_BT_Task1_live.csv [--interval 2] [--newest-first] [--save]
+"""
+
+
+# entries that can be analyzed out of order, once their close entry comes in
+TAB_OPENS = (EventType.DRAWING_OPENED, EventType.PARTSTUDIO_OPENED)
+
+
+class LiveTrail(object):
+    """
+    Incrementally analyzed audit trail, see module docstring. update() reads the new entries from the file, or
+    append() can be fed rows directly (csv layout, oldest first)
+    Attributes:
+        totalSeconds, counts: total duration and number of spans of every category code so far (see
+                              analysis.categoryNames)
+        closed: "Close document" has come in, the analysis is complete
+        failed: the audit trail turned out to be unusable (an entry with missing fields, an event time that couldn't
+                be parsed or entries after "Close document"), the same audit trails the batch analysis rejects
+        shortRows: index (as read from the file, see module docstring) of every entry with 5 or fewer fields
+        malformedRows: index (as read from the file, see module docstring) of every entry with an event time that
+                       couldn't be parsed
+    """
+    def __init__(self, filePathName, newestFirst=False, classifier=defaultClassifier):
+        self.filePathName = filePathName
+        self.newestFirst = newestFirst
+        self.classifier = classifier
+        # bytes of the file read so far (appended layout), number of raw entries read so far (newest first layout)
+        self.offset = 0
+        self.rawRows = 0
+        self.header = None
+        self.lastModified = None
+
+        # the columns of the cleaned audit trail, oldest entry first
+        self.eventTime = []
+        self.description = []
+        self.tab = []
+        self.index = []
+        self.eventTypes = []
+        self.markers = []
+        self.featureReference = []
+        self.hmmSequence = []
+        self.pairer = SpanPairer()
+        # grows with the columns, the new entries are added to it before they're analyzed
+        self.sketchWindow = MarkerWindow(Marker.SKETCH, SKETCH_WINDOW, SKETCH_SAME_TAB)
+        self.analysis = TrailAnalysis(self.eventTime, self.description, self.tab, self.index, self.eventTypes,
+                                      self.markers, self.pairer.ends, self.featureReference, self.hmmSequence,
+                                      self.row, self.sketchWindow)
+
+        # every entry before the frontier has been analyzed, except the tab opens still waiting for their close
+        self.frontier = 0
+        self.deferred = []
+        # positions of the HMM list entries, in order
+        self.hmmPositions = []
+        self.totalSeconds = []
+        self.counts = []
+        self.shortRows = []
+        self.malformedRows = []
+        self.closed = False
+        self.failed = False
+
+    def __len__(self):
+        return len(self.eventTime)
+
+    def row(self, position):
+        """One entry for printing: [index, event time, tab, description, feature reference, HMM sequence]"""
+        return [self.index[position], str(EPOCH + datetime.timedelta(seconds=self.eventTime[position])),
+                self.tab[position], self.description[position], self.featureReference[position],
+                self.hmmSequence[position]]
+
+    def readAppended(self):
+        """New rows of an appended (oldest first) audit trail file, only whole lines are taken"""
+        with open(self.filePathName, "rb") as in_file:
+            if os.fstat(in_file.fileno()).st_size < self.offset:
+                raise RuntimeError(self.filePathName + " got shorter, entries are only expected to be added at the end")
+            in_file.seek(self.offset)
+            data = in_file.read()
+        # a line that is still being written is left for the next update
+        end = data.rfind(b"\n") + 1
+        if end == 0:
+            return []
+        self.offset += end
+        rows = [row for row in csv.reader(io.StringIO(data[:end].decode("utf-8-sig"))) if row]
+        if self.header is None and rows:
+            self.header = rows.pop(0)
+        return rows
+
+    def readNewestFirst(self):
+        """New rows of a newest first audit trail file (the rows above the ones already read), oldest first"""
+        modified = os.stat(self.filePathName).st_mtime_ns
+        if modified == self.lastModified:
+            return []
+        self.lastModified = modified
+        with open(self.filePathName, "r", newline="", encoding="utf-8-sig") as in_file:
+            rows = [row for row in csv.reader(in_file) if row]
+        if not rows:
+            return []
+        self.header = rows[0]
+        entries = rows[1:]
+        if len(entries) < self.rawRows:
+            raise RuntimeError(self.filePathName + " has fewer entries than before, entries are only expected to be "
+                                                   "added")
+        newRows = entries[:len(entries) - self.rawRows]
+        self.rawRows = len(entries)
+        return newRows[::-1]
+
+    def update(self):
+        """Reads and analyzes the entries added to the file since the last update, returns how many there were"""
+        if self.closed or self.failed:
+            return 0
+        return self.append(self.readNewestFirst() if self.newestFirst else self.readAppended())
+
+    def append(self, rows):
+        """
+        Adds new raw audit trail rows (csv layout, oldest first) and analyzes whatever can be analyzed
+        Returns the number of entries kept after cleaning
+        """
+        shortRows = [row for row in rows if len(row) <= 5]
+        if shortRows:
+            # these can't be cleaned (no description), the batch analysis gives up on the whole audit trail for them
+            for row in shortRows:
+                print("Missing fields in entry at index: " + row[0])
+                self.shortRows.append(row[0])
+            self.failed = True
+            return 0
+        rows = [row for row in rows if not any(removed in row[5] for removed in REMOVED_DESCRIPTIONS)]
+        epochSeconds, badRows = parseEventTimes([row[1] for row in rows])
+        if badRows:
+            # the batch analysis rejects the whole audit trail for these (see analyzeAuditTrail)
+            for bad in badRows:
+                print("Issue with date time entry at index: " + rows[bad][0])
+                self.malformedRows.append(rows[bad][0])
+            self.failed = True
+            return 0
+        start = len(self)
+        for row, seconds in zip(rows, epochSeconds.tolist()):
+            eventType, ruleNumber, markers = self.classifier.classify(row[5])
+            eventType, markers = int(eventType), int(markers)
+            self.pairer.push(eventType, markers, row[3])
+            self.eventTime.append(seconds)
+            self.description.append(row[5])
+            self.tab.append(row[3])
+            self.index.append(row[0])
+            self.eventTypes.append(eventType)
+            self.markers.append(markers)
+            self.featureReference.append("")
+            self.hmmSequence.append("")
+            if eventType == EventType.CLOSE_DOCUMENT:
+                self.closed = True
+        self.sketchWindow.extend(self.markers[start:], self.tab[start:])
+        self.analyze()
+        return len(self) - start
+
+    def ready(self, i):
+        """Whether the entries the analysis of entry i looks at have all come in"""
+        if self.closed:
+            return True
+        eventType = self.eventTypes[i]
+        end = self.pairer.ends[i]
+        if eventType in (EventType.ADD_FEATURE, EventType.START_EDIT):
+            # the entries after the end are checked for "Add or modify a sketch" (and the one right after it for an
+            # "Edit : XXX")
+            return end != -1 and end + max(self.sketchWindow.radius, 1) < len(self)
+        if eventType in TAB_OPENS:
+            return end != -1
+        if eventType == EventType.UNDO_REDO:
+            return i + 1 < len(self)
+        return True
+
+    def analyze(self):
+        """Analyzes every entry that has become ready since the last call"""
+        if self.failed:
+            return
+        lastPosition = len(self) - 1
+        ready = []
+        while self.frontier <= lastPosition:
+            i = self.frontier
+            if self.ready(i):
+                ready.append(i)
+            elif self.eventTypes[i] in TAB_OPENS:
+                self.deferred.append(i)
+            else:
+                break
+            self.frontier += 1
+        waiting = []
+        for i in self.deferred:
+            if self.ready(i):
+                ready.append(i)
+            else:
+                waiting.append(i)
+        self.deferred = waiting
+
+        for i in ready:
+            if not self.analysis.analyzeEntry(i, lastPosition):
+                self.failed = True
+                return
+            if i in self.analysis.spans:
+                category, seconds, featureName = self.analysis.spans[i]
+                while len(self.totalSeconds) <= category:
+                    self.totalSeconds.append(0)
+                    self.counts.append(0)
+                self.totalSeconds[category] += seconds
+                self.counts[category] += 1
+            if i in self.analysis.hmm:
+                # almost always at the end, only the deferred drawing opens go further back
+                bisect.insort(self.hmmPositions, i)
+
+    def hmmList(self):
+        """The HMM list so far ("Create", "Revise", ...), in order"""
+        return [self.analysis.hmm[position] for position in self.hmmPositions]
+
+    def timeSeries(self):
+        """The time_series list so far (see TrailAnalysis.timeSeries), in order"""
+        return self.analysis.timeSeries(sorted(self.analysis.spans))
+
+    def totals(self):
+        """category name -> (total duration, number of spans) so far"""
+        names = self.analysis.categoryNames
+        return {names[category]: (datetime.timedelta(seconds=seconds), self.counts[category])
+                for category, seconds in enumerate(self.totalSeconds)}
+
+    def pending(self):
+        """(position, description, start time) of the span starts still waiting for their end entry"""
+        return [(position, self.description[position], EPOCH + datetime.timedelta(seconds=self.eventTime[position]))
+                for position in self.pairer.pending()]
+
+    def databaseRow(self):
+        """
+        The audit trail's database row so far (see AuditTrailAnalyzer.databaseRow), the final one once the audit
+        trail is closed. None before any entries have come in or if the audit trail is unusable
+        """
+        if not len(self) or self.failed:
+            return None
+        fileName = baseName(os.path.basename(self.filePathName)) + "_cleaned"
+        return databaseRow(fileName, EPOCH + datetime.timedelta(seconds=self.eventTime[0]),
+                           EPOCH + datetime.timedelta(seconds=self.eventTime[-1]), self.analysis)
+
+    def status(self, hmmEntries=8):
+        """A few lines on where the session is at: entries, pending spans, totals and the end of the HMM list"""
+        lines = [str(len(self)) + " entries, " + str(len(self.analysis.spans)) + " timed actions" +
+                 (", session closed" if self.closed else "")]
+        if len(self):
+            lines[0] += " (" + str(datetime.timedelta(seconds=self.eventTime[-1] - self.eventTime[0])) + ")"
+        for position, description, startTime in self.pending():
+            lines.append("\tpending: " + description + " since " + str(startTime.time()))
+        for name, (duration, n) in self.totals().items():
+            if n:
+                lines.append("\t" + name.ljust(20) + str(duration).rjust(10) + str(n).rjust(6))
+        hmmList = self.hmmList()
+        if hmmList:
+            lines.append("\tHMM (" + str(len(hmmList)) + "): " + ("... " if len(hmmList) > hmmEntries else "") +
+                         ", ".join(hmmList[-hmmEntries:]))
+        return "\n".join(lines)
+
+
+def follow(filePathName, interval=2.0, newestFirst=False, save=False, once=False):
+    """
+    Follows an audit trail file until "Close document" comes in (or Ctrl+C), printing the status after every update
+    that brought new entries. With save the final row goes into the metrics database
+    Returns the LiveTrail
+    """
+    live = LiveTrail(filePathName, newestFirst)
+    try:
+        while True:
+            added = live.update()
+            if added:
+                print("[" + datetime.datetime.now().strftime("%H:%M:%S") + "] +" + str(added) + " entries")
+                print(live.status())
+                sys.stdout.flush()
+            if live.closed or live.failed or once:
+                break
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("Stopped following " + filePathName)
+
+    if live.failed:
+        if live.shortRows:
+            reason = "entries with missing fields"
+        elif live.malformedRows:
+            reason = "malformed event times"
+        else:
+            reason = "entries after close document"
+        print("Error! The audit trail can't be analyzed (" + reason + ")")
+        return live
+    rowEntry = live.databaseRow()
+    if rowEntry is not None:
+        print(("Final" if live.closed else "Current") + " database row: " + str(rowEntry))
+        if save and live.closed:
+            updateDatabase([rowEntry])
+            exportDatabase()
+    return live
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Follow an audit trail while the session is still going and keep "
+                                                 "its metrics up to date")
+    parser.add_argument("fileName", help="audit trail csv file to follow")
+    parser.add_argument("--interval", type=float, default=2.0, help="seconds between checks for new entries")
+    parser.add_argument("--newest-first", action="store_true",
+                        help="the file is newest entry first (an Onshape export that gets exported again)")
+    parser.add_argument("--save", action="store_true", help="add the final row to the metrics database")
+    parser.add_argument("--once", action="store_true", help="read the file once and print its status")
+    args = parser.parse_args()
+    follow(args.fileName, args.interval, args.newest_first, args.save, args.once)
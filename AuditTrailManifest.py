@@ -0,0 +1,74 @@
+import os
+import json
+import hashlib
+
+"""
+Manifest of the audit trails that have already been analyzed, used to skip unchanged audit trails on the next run.
+
+Each raw audit trail is recorded under its file name with:
+- the sha256 hash of its contents
+- the analyzer version it was analyzed with (AuditTrailAnalyzer.ANALYZER_VERSION, bumped whenever a change to the
+    analysis would change the outputs)
+- the output files it produced (timeseries/HMM json, plot, cleaned csv, ...) and whether it was plotted
+An audit trail is only analyzed again if its contents or the analyzer version changed, or one of its recorded outputs
+went missing. Its previous outputs and database row are reused otherwise.
+
+The manifest is stored as Analysis_output/Audit_Trail_Manifest.json
+"""
+
+
+DEFAULT_MANIFEST = os.path.join("Analysis_output", "Audit_Trail_Manifest.json")
+
+
+def fileHash(filePathName, blockSize=1 << 20):
+    """sha256 hex digest of a file's contents, read in blocks"""
+    digest = hashlib.sha256()
+    with open(filePathName, "rb") as inFile:
+        for block in iter(lambda: inFile.read(blockSize), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Manifest(object):
+    """
+    Maps audit trail file name -> {"hash", "analyzerVersion", "plots", "outputs"}
+    """
+    def __init__(self, analyzerVersion, manifestFileName=DEFAULT_MANIFEST):
+        self.analyzerVersion = analyzerVersion
+        self.manifestFileName = manifestFileName
+        self.entries = {}
+        if os.path.isfile(manifestFileName):
+            with open(manifestFileName, "r") as inFile:
+                self.entries = json.load(inFile)
+
+    def isCurrent(self, name, digest, plots=True):
+        """
+        True if the audit trail was analyzed from exactly these contents with the current analyzer version, and all
+        of its outputs are still there (including the plot if plots are wanted)
+        """
+        entry = self.entries.get(name)
+        if entry is None:
+            return False
+        if entry["hash"] != digest or entry["analyzerVersion"] != self.analyzerVersion:
+            return False
+        if plots and not entry.get("plots", True):
+            return False
+        return all(os.path.isfile(output) for output in entry["outputs"])
+
+    def update(self, name, digest, outputs, plots=True):
+        """Records a successfully analyzed audit trail, outputs = paths of the files it produced"""
+        self.entries[name] = {"hash": digest,
+                              "analyzerVersion": self.analyzerVersion,
+                              "plots": plots,
+                              "outputs": [output for output in outputs if os.path.isfile(output)]}
+
+    def remove(self, name):
+        """Forgets an audit trail (e.g. it failed), so it gets analyzed again next time"""
+        self.entries.pop(name, None)
+
+    def save(self):
+        # write to a temporary file first so an interrupted run can't leave a half written manifest
+        temporaryFileName = self.manifestFileName + ".tmp"
+        with open(temporaryFileName, "w") as outFile:
+            json.dump(self.entries, outFile, indent=1, sort_keys=True)
+        os.replace(temporaryFileName, self.manifestFileName)
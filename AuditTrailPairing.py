@@ -0,0 +1,110 @@
+import collections
+import numpy as np
+from AuditTrailClassifier import EventType, Marker
+
+"""
+Single pass pairing of the audit trail entries that start a span of time with the entries that end them:
+- "Add part studio feature"            -> the next unmatched "Insert feature" (or a "Cancel Operation")
+- "Start edit of part studio feature"  -> the next unmatched "Edit : XXX", or whichever comes first of
+                                          "Add or modify a sketch", another "Start edit"/"Add part studio feature"
+                                          or a "Cancel Operation"
+- "Tab XXX of type BLOB opened"        -> the next "BLOB closed" of the same tab (drawing)
+- "Tab XXX of type PARTSTUDIO opened"  -> the next "PARTSTUDIO closed"
+
+Previously every start entry did its own forward search through the rest of the audit trail and checked a list of
+already matched indices, which is quadratic on long trails. Here the entries are visited once in chronological
+order: each type of span start waits in its own queue (drawings in one queue per tab) until an entry that ends it
+comes along. The pairings are identical to the forward searches: since start entries were searched for oldest first,
+the oldest waiting start is always the one that gets the next unmatched "Insert feature"/"Edit : XXX".
+"""
+
+
+# entries (other than "Edit : XXX") that end a pending edit
+EDIT_TERMINATORS = Marker.SKETCH | Marker.START_EDIT | Marker.ADD_FEATURE | Marker.CANCEL
+
+
+class SpanPairer(object):
+    """
+    Pairs span start entries with their end entries, one entry at a time (oldest first).
+    Can be fed a whole audit trail (see pairSpans) or new entries as they come in, starts that haven't been matched
+    yet are held in the pending queues
+    """
+    def __init__(self):
+        # end position for each entry pushed so far, -1 if the entry isn't a span start or isn't matched (yet)
+        self.ends = []
+        # span starts still waiting for their end entry
+        self.pendingCreates = collections.deque()
+        self.pendingEdits = collections.deque()
+        self.pendingDrawings = {}  # tab -> positions of the "BLOB opened" entries
+        self.pendingPartstudios = []
+
+    def push(self, eventType, markers, tab):
+        """
+        Adds the next (chronologically) audit trail entry, resolving any pending spans it ends
+        Args:
+            eventType, markers: classification of the entry's description (see AuditTrailClassifier)
+            tab: the entry's tab (code)
+        Returns the position of the entry
+        """
+        position = len(self.ends)
+        self.ends.append(-1)
+
+        # does this entry end any of the pending spans? an "Insert feature"/"Edit : XXX" entry can only end one span
+        matched = False
+        if self.pendingCreates:
+            if markers & Marker.INSERT_FEATURE:
+                self.ends[self.pendingCreates.popleft()] = position
+                matched = True
+            elif markers & Marker.CANCEL:
+                # every create waiting at this point was cancelled
+                while self.pendingCreates:
+                    self.ends[self.pendingCreates.popleft()] = position
+
+        if self.pendingEdits:
+            if markers & Marker.FEATURE_EDIT:
+                if not matched:
+                    self.ends[self.pendingEdits.popleft()] = position
+            elif markers & EDIT_TERMINATORS:
+                # these end every edit waiting at this point (sketch edits/no change edits/cancelled edits)
+                while self.pendingEdits:
+                    self.ends[self.pendingEdits.popleft()] = position
+
+        if markers & Marker.DRAWING_CLOSED and tab in self.pendingDrawings:
+            for start in self.pendingDrawings.pop(tab):
+                self.ends[start] = position
+
+        if markers & Marker.PARTSTUDIO_CLOSED:
+            for start in self.pendingPartstudios:
+                self.ends[start] = position
+            self.pendingPartstudios = []
+
+        # does this entry start a new span?
+        if eventType == EventType.ADD_FEATURE:
+            self.pendingCreates.append(position)
+        elif eventType == EventType.START_EDIT:
+            self.pendingEdits.append(position)
+        elif eventType == EventType.DRAWING_OPENED:
+            self.pendingDrawings.setdefault(tab, []).append(position)
+        elif eventType == EventType.PARTSTUDIO_OPENED:
+            self.pendingPartstudios.append(position)
+
+        return position
+
+    def pending(self):
+        """Positions of all the span starts that haven't been matched to an end entry yet"""
+        drawings = [start for starts in self.pendingDrawings.values() for start in starts]
+        return sorted(list(self.pendingCreates) + list(self.pendingEdits) + drawings + self.pendingPartstudios)
+
+
+def pairSpans(trail, eventTypes, markers):
+    """
+    Pairs up every span start entry of an AuditTrail table with its end entry in a single pass
+    Args:
+        trail: AuditTrail table
+        eventTypes, markers: per row classification of the table (see DescriptionClassifier.classifyTrail)
+    Returns an int64 array with the position of the matching end entry for every span start, -1 everywhere else
+    """
+    pairer = SpanPairer()
+    for eventType, markerFlags, tabCode in zip(eventTypes.tolist(), markers.tolist(), trail.tabCodes.tolist()):
+        pairer.push(eventType, markerFlags, tabCode)
+    return np.array(pairer.ends, dtype=np.int64)
@@ -0,0 +1,163 @@
+import re
+import sys
+import argparse
+import traceback
+import concurrent.futures
+import numpy as np
+
+import AuditTrailAnalyzer
+from AuditTrailClassifier import EventType, defaultClassifier
+
+"""
+Splits audit trail exports that hold many users and documents (e.g. exported from an organization account) into one
+event stream per (user, document, session) and analyzes each of them like a separate audit trail.
+
+The analysis assumes one user working in one document per audit trail, from "Open document" (first entry) to
+"Close document" (last entry). In a shared export the entries of different users and documents are interleaved, and
+the same user can open and close a document several times. The export is read and cleaned as usual (see
+AuditTrailAnalyzer.readCleanedTrail), then partitioned in a single pass over the columns:
+- the rows are grouped by (user, document) with one stable sort of the category codes, which keeps every group in
+  chronological order
+- within a group, a new session starts at every "Open document" entry and after every "Close document" entry
+Every session becomes its own event table (AuditTrail.take) named
+    <export name>_<user>_<document>_S<session number>
+(characters that can't go in a file name replaced by "-"), which gets the normal analysis outputs and database row.
+The sessions are independent of each other, so they're analyzed across a pool of worker processes. Like the batch
+mode (see AuditTrailBatch) the workers don't touch the database, their rows are merged into it in one go at the end.
+
+Usage:
+    python AuditTrailPartition.py ORG_Export.csv [--workers 8] [--no-plots]
+"""
+
+
+def partitionTrail(trail):
+    """
+    Finds the (user, document, session) streams of an audit trail table in one pass
+    Args:
+        trail: cleaned AuditTrail table
+    Returns:
+        list of (user, document, session number, positions) in order of the streams' first entries, positions is an
+        int array of the stream's row positions in chronological order. Sessions are numbered from 1 within each
+        (user, document)
+    """
+    if len(trail) == 0:
+        return []
+    # each distinct description is only classified once (classify, unlike classifyTrail, doesn't count rule hits)
+    eventTypes = np.array([defaultClassifier.classify(description)[0] for description in trail.descriptions],
+                          dtype=np.int8)[trail.descriptionCodes]
+    isOpen = eventTypes == EventType.OPEN_DOCUMENT
+    isClose = eventTypes == EventType.CLOSE_DOCUMENT
+
+    streamCodes = trail.userCodes.astype(np.int64) * len(trail.documents) + trail.documentCodes
+    order = np.argsort(streamCodes, kind="stable")
+    sortedCodes = streamCodes[order]
+
+    newStream = np.ones(len(order), dtype=bool)
+    newStream[1:] = sortedCodes[1:] != sortedCodes[:-1]
+    newSession = newStream | isOpen[order]
+    newSession[1:] |= isClose[order][:-1]
+
+    sessionStarts = np.flatnonzero(newSession)
+    sessionEnds = np.append(sessionStarts[1:], len(order))
+    # session number within the stream: sessions so far minus the ones before the stream started
+    sessionCounts = np.cumsum(newSession)
+    streamFirstSession = np.maximum.accumulate(np.where(newStream, sessionCounts, 0))
+    sessionNumbers = (sessionCounts - streamFirstSession + 1)[sessionStarts]
+
+    partitions = []
+    for start, end, number in zip(sessionStarts.tolist(), sessionEnds.tolist(), sessionNumbers.tolist()):
+        first = order[start]
+        partitions.append((trail.users[trail.userCodes[first]], trail.documents[trail.documentCodes[first]],
+                           number, order[start:end]))
+    partitions.sort(key=lambda partition: partition[3][0])
+    return partitions
+
+
+def partitionName(fileName, user, document, session):
+    """Name of one (user, document, session) stream of an export, used for all of its outputs"""
+    parts = [AuditTrailAnalyzer.baseName(fileName), user, document, "S" + str(session)]
+    return "_".join(re.sub(r"[^A-Za-z0-9.@-]+", "-", part) for part in parts)
+
+
+def analyzePartition(name, trail, plots=True):
+    """
+    Worker function: analyzes one stream without updating the database
+    Returns (name, database row or None, error message or None)
+    """
+    print("Analyzing stream: " + name)
+    try:
+        rowEntry = AuditTrailAnalyzer.analyzeAuditTrail(name + "_cleaned.csv", trail, saveToDatabase=False,
+                                                        plots=plots)
+    except Exception:
+        return name, None, traceback.format_exc()
+    if rowEntry == -1 or rowEntry is None:
+        return name, None, "failed the audit trail checks (see output above)"
+    return name, rowEntry, None
+
+
+def runPartitioned(fileName, workers=None, plots=True):
+    """
+    Reads an export from Participant_audit_trails, splits it into (user, document, session) streams and analyzes them
+    across a pool of worker processes, then adds all of their rows to the database at once
+    Args:
+        fileName: export file name (in Participant_audit_trails)
+        workers: number of worker processes, defaults to the number of CPUs. With 1 worker everything runs in this
+                 process
+        plots: draw the timeline plots
+    Returns:
+        (rowEntries, failures): the database rows of the streams that were analyzed, and a list of
+        (stream name, error message) for the ones that weren't
+    """
+    trail, cache = AuditTrailAnalyzer.readCleanedTrail(fileName)
+    if cache is not None and cache[2] is None:
+        # the whole export is never analyzed as one audit trail, so its cache has no annotations. A current cache (the
+        # table was just loaded from it) is left as it is
+        AuditTrailAnalyzer.saveTrail(trail, cache[0], cache[1], AuditTrailAnalyzer.REMOVED_DESCRIPTIONS)
+    partitions = partitionTrail(trail)
+    streams = [(partitionName(fileName, user, document, session), trail.take(positions))
+               for user, document, session, positions in partitions]
+    print("Found " + str(len(streams)) + " (user, document, session) streams in " + fileName)
+
+    results = []
+    if workers == 1:
+        for name, stream in streams:
+            results.append(analyzePartition(name, stream, plots))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(analyzePartition, name, stream, plots) for name, stream in streams]
+            for (name, stream), future in zip(streams, futures):
+                try:
+                    results.append(future.result())
+                except Exception:
+                    # the worker process itself died (e.g. ran out of memory)
+                    results.append((name, None, traceback.format_exc()))
+
+    rowEntries = [rowEntry for name, rowEntry, error in results if rowEntry is not None]
+    failures = [(name, error) for name, rowEntry, error in results if error is not None]
+
+    # single merge step into the database
+    if rowEntries:
+        AuditTrailAnalyzer.updateDatabase(rowEntries)
+    AuditTrailAnalyzer.exportDatabase()
+
+    print("\n########################################################")
+    print("Analyzed " + str(len(rowEntries)) + " of " + str(len(streams)) + " streams of " + fileName)
+    for name, error in failures:
+        print("FAILED: " + name + "\n\t" + error.strip().replace("\n", "\n\t"))
+
+    return rowEntries, failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split a multi-user, multi-document audit trail export into "
+                                                 "(user, document, session) streams and analyze each of them")
+    parser.add_argument("fileName", help="export file name (in Participant_audit_trails)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--no-plots", dest="plots", action="store_false",
+                        help="skip the timeline plots (matplotlib is never imported)")
+    args = parser.parse_args()
+
+    rowEntries, failures = runPartitioned(args.fileName, args.workers, args.plots)
+    if failures:
+        sys.exit(1)
@@ -0,0 +1,358 @@
+import csv
+import sys
+import datetime
+import mmap
+import numpy as np
+
+"""
+Reverse-chronological streaming reader for audit trail csv exports.
+
+Onshape exports audit trails newest event first, but the analysis works through them oldest event first. Rather than
+loading the whole file and walking it backwards, the file is memory mapped and read from the end towards the start in
+fixed size blocks, so the rows come out oldest first while only one block of the raw text is held in memory at a time
+(the mapped pages themselves are managed by the OS and don't count against the process).
+
+The header row is the first line of the file and is always yielded first.
+Rows with quoted fields are handled by the csv module as usual. A quoted field that contains a line break spans
+several lines of the file, these lines are joined back together before the row is parsed.
+
+MappedCsv is the columnar alternative: it keeps the offsets of every field into the mapped file and only turns the
+columns that are needed into arrays (see there).
+
+iterXlsxRows reads the Excel (.xlsx) download from Onshape directly, so it doesn't have to be re-saved as csv first
+(see there).
+"""
+
+
+# size of the chunks the file is read backwards in
+BLOCK_SIZE = 1 << 20
+
+
+def iterLinesReversed(buffer, start, end, blockSize=BLOCK_SIZE):
+    """
+    Generator that yields the lines (bytes, without the line break) of buffer[start:end] from last to first, reading
+    blockSize bytes at a time
+    """
+    # the (partial) line at the start of the block that was just read, completed by the end of the next one
+    carry = b""
+    blockEnd = end
+    while blockEnd > start:
+        blockStart = max(start, blockEnd - blockSize)
+        lines = (buffer[blockStart:blockEnd] + carry).split(b"\n")
+        # the first line of the block may continue in the block before it
+        carry = lines[0]
+        for line in reversed(lines[1:]):
+            yield line
+        blockEnd = blockStart
+    yield carry
+
+
+def iterRecordsReversed(lines):
+    """
+    Joins the lines of quoted fields that span line breaks back together, lines come in (and records go out) last to
+    first. A line with an odd number of quote characters opens or closes a multi-line field
+    """
+    pending = None
+    for line in lines:
+        if pending is not None:
+            pending = line + b"\n" + pending
+            if line.count(b'"') % 2 == 1:
+                yield pending
+                pending = None
+        elif line.count(b'"') % 2 == 1:
+            pending = line
+        else:
+            yield line
+    if pending is not None:
+        yield pending
+
+
+def decodeRow(record, encoding):
+    """Parses one csv record (bytes) into a list of strings"""
+    text = record.decode(encoding)
+    if text.endswith("\r"):
+        text = text[:-1]
+    # only rows with quoted fields need the full csv parser
+    if '"' not in text:
+        return text.split(",")
+    return next(csv.reader([text]))
+
+
+def iterAuditTrailRowsReversed(filePathName, blockSize=BLOCK_SIZE, encoding="utf-8"):
+    """
+    Generator that yields the rows of an audit trail csv export header row first, then the rest of the rows in the
+    reverse of their order in the file (i.e. oldest event first for an Onshape export)
+    Args:
+        filePathName: path of the csv file
+        blockSize: number of bytes read at a time
+        encoding: text encoding of the file
+    """
+    with open(filePathName, "rb") as csv_file:
+        try:
+            buffer = mmap.mmap(csv_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file, can't be mapped
+            return
+        with buffer:
+            headerEnd = buffer.find(b"\n")
+            if headerEnd == -1:
+                headerEnd = len(buffer)
+            yield decodeRow(buffer[:headerEnd], encoding)
+
+            # skip the line break(s) at the very end of the file
+            end = len(buffer)
+            while end > headerEnd + 1 and buffer[end - 1:end] in (b"\n", b"\r"):
+                end -= 1
+            for record in iterRecordsReversed(iterLinesReversed(buffer, headerEnd + 1, end, blockSize)):
+                if record.strip():
+                    yield decodeRow(record, encoding)
+
+
+# size of the chunks the delimiters are searched for in (MappedCsv)
+SCAN_CHUNK = 1 << 24
+# number of rows a column is materialized in at a time (MappedCsv)
+GATHER_ROWS = 1 << 14
+
+COMMA, NEWLINE, QUOTE, CARRIAGE_RETURN = ord(","), ord("\n"), ord('"'), ord("\r")
+
+
+def unquote(text):
+    """Removes the csv quoting from a field (surrounding quotes, doubled quotes inside)"""
+    if len(text) >= 2 and text[0] == '"' and text[-1] == '"':
+        return text[1:-1].replace('""', '"')
+    return text
+
+
+class MappedCsv(object):
+    """
+    Memory mapped csv file that only keeps the offsets of its fields.
+
+    The file is scanned once (in SCAN_CHUNK sized pieces, with numpy) for the commas and line breaks that aren't
+    inside quotes, which gives the start offset of every field of every row (one int per field, int32 unless the file
+    is over 2GB). No field is turned into a python string until a column is asked for, and then only the columns
+    that are actually needed:
+    - integers(): the digits are converted straight from the mapped bytes
+    - fixedWidth(): the raw bytes of a fixed width column (e.g. the event times) as a (rows x width) array
+    - categories(): int codes + the list of distinct values, each distinct value is only decoded (and interned) once.
+        This is what the Document/Tab/User/Description columns need, they only take a handful of distinct values
+    Rows are in file order (newest event first for an Onshape export), the header row isn't counted.
+
+    regular is False if the rows don't all have the same number of fields as the header (e.g. a hand edited file),
+    in which case the offsets aren't filled in and the file has to be read with the csv module instead.
+    """
+    def __init__(self, filePathName, encoding="utf-8"):
+        self.encoding = encoding
+        self.header = []
+        self.regular = False
+        # start offset of every field, (rows x fields)
+        self.fieldStarts = np.zeros((0, 0), dtype=np.int64)
+        # end offset of the last field of every row (the other fields end just before the next one starts)
+        self.rowEnds = np.zeros(0, dtype=np.int64)
+        self.buffer = None
+        self.data = np.zeros(0, dtype=np.uint8)
+
+        with open(filePathName, "rb") as csv_file:
+            try:
+                self.buffer = mmap.mmap(csv_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty file, can't be mapped
+                return
+        self.data = np.frombuffer(self.buffer, dtype=np.uint8)
+
+        headerEnd = self.buffer.find(b"\n")
+        if headerEnd == -1:
+            headerEnd = len(self.buffer)
+        self.header = decodeRow(self.buffer[:headerEnd], encoding)
+        self.findFields(headerEnd + 1)
+
+    def findFields(self, start):
+        """Scans everything after the header for the field delimiters and fills in fieldStarts/rowEnds"""
+        offsetType = np.int32 if len(self.data) < 2 ** 31 else np.int64
+        commas = []
+        newlines = []
+        quotesSoFar = 0
+        for chunkStart in range(start, len(self.data), SCAN_CHUNK):
+            chunk = self.data[chunkStart:chunkStart + SCAN_CHUNK]
+            quotes = np.flatnonzero(chunk == QUOTE)
+            chunkCommas = np.flatnonzero(chunk == COMMA)
+            chunkNewlines = np.flatnonzero(chunk == NEWLINE)
+            if len(quotes) or quotesSoFar % 2:
+                # a delimiter is inside a quoted field if an odd number of quotes come before it
+                chunkCommas = chunkCommas[(np.searchsorted(quotes, chunkCommas) + quotesSoFar) % 2 == 0]
+                chunkNewlines = chunkNewlines[(np.searchsorted(quotes, chunkNewlines) + quotesSoFar) % 2 == 0]
+            quotesSoFar += len(quotes)
+            commas.append((chunkCommas + chunkStart).astype(offsetType))
+            newlines.append((chunkNewlines + chunkStart).astype(offsetType))
+        commas = np.concatenate(commas) if commas else np.zeros(0, dtype=offsetType)
+        newlines = np.concatenate(newlines) if newlines else np.zeros(0, dtype=offsetType)
+
+        # every line runs from just after the previous line break to its own line break (or the end of the file)
+        lineEnds = np.append(newlines, len(self.data)).astype(offsetType)
+        lineStarts = np.append(start, newlines + 1).astype(offsetType)
+        # don't count the \r of \r\n line breaks
+        hasReturn = lineEnds > lineStarts
+        hasReturn[hasReturn] = self.data[lineEnds[hasReturn] - 1] == CARRIAGE_RETURN
+        lineEnds[hasReturn] -= 1
+
+        # how many commas each line has
+        commaCounts = np.bincount(np.searchsorted(newlines, commas), minlength=len(lineEnds))
+        # blank lines (e.g. at the end of the file) are skipped
+        nonBlank = lineEnds > lineStarts
+        nFields = len(self.header)
+        if not np.all(commaCounts[nonBlank] == nFields - 1) or np.any(commaCounts[~nonBlank] > 0):
+            return
+
+        rows = np.flatnonzero(nonBlank)
+        self.fieldStarts = np.empty((len(rows), nFields), dtype=offsetType)
+        self.fieldStarts[:, 0] = lineStarts[rows]
+        self.fieldStarts[:, 1:] = commas.reshape(len(rows), nFields - 1) + 1
+        self.rowEnds = lineEnds[rows]
+        self.regular = True
+
+    def __len__(self):
+        return len(self.fieldStarts)
+
+    def fieldBounds(self, field, rowStart=0, rowEnd=None):
+        """(starts, ends) int64 arrays of the offsets of one column for rows rowStart:rowEnd"""
+        starts = self.fieldStarts[rowStart:rowEnd, field].astype(np.int64)
+        if field == self.fieldStarts.shape[1] - 1:
+            ends = self.rowEnds[rowStart:rowEnd].astype(np.int64)
+        else:
+            # skip back over the comma before the next field
+            ends = self.fieldStarts[rowStart:rowEnd, field + 1].astype(np.int64) - 1
+        return starts, ends
+
+    def field(self, row, field):
+        """One field as a string (e.g. for error messages)"""
+        starts, ends = self.fieldBounds(field, row, row + 1)
+        return unquote(self.buffer[int(starts[0]):int(ends[0])].decode(self.encoding))
+
+    def gather(self, field, rowStart, rowEnd, width):
+        """
+        Raw bytes of one column for rows rowStart:rowEnd as a (rows x width) uint8 array (longer fields are cut off,
+        shorter ones padded with 0s), and the length of each field
+        """
+        starts, ends = self.fieldBounds(field, rowStart, rowEnd)
+        lengths = ends - starts
+        offsets = np.arange(width)
+        inField = offsets < lengths[:, np.newaxis]
+        positions = np.minimum(starts[:, np.newaxis] + offsets, len(self.data) - 1)
+        return np.where(inField, self.data[positions], 0).astype(np.uint8), lengths
+
+    def integers(self, field, maxDigits=18):
+        """
+        A column of (unsigned) integers, converted straight from the mapped bytes
+        Returns (values, valid): int64 array (0 where invalid) and a bool array, False where the field isn't a number
+        """
+        values = np.zeros(len(self), dtype=np.int64)
+        valid = np.zeros(len(self), dtype=bool)
+        for rowStart in range(0, len(self), GATHER_ROWS):
+            chars, lengths = self.gather(field, rowStart, rowStart + GATHER_ROWS, maxDigits)
+            digits = chars.astype(np.int64) - ord("0")
+            inField = np.arange(maxDigits) < lengths[:, np.newaxis]
+            chunkValues = np.zeros(len(chars), dtype=np.int64)
+            for column in range(maxDigits):
+                chunkValues = np.where(inField[:, column], chunkValues * 10 + digits[:, column], chunkValues)
+            isDigit = (digits >= 0) & (digits <= 9)
+            chunkValid = (lengths > 0) & (lengths <= maxDigits) & np.all(isDigit | ~inField, axis=1)
+            values[rowStart:rowStart + len(chars)] = np.where(chunkValid, chunkValues, 0)
+            valid[rowStart:rowStart + len(chars)] = chunkValid
+        return values, valid
+
+    def fixedWidth(self, field, width):
+        """
+        Raw bytes of a fixed width column
+        Returns (chars, lengths): (rows x width) uint8 array (longer fields are cut off, shorter ones padded with 0s)
+        and the actual length of each field
+        """
+        chars = np.zeros((len(self), width), dtype=np.uint8)
+        lengths = np.zeros(len(self), dtype=np.int64)
+        for rowStart in range(0, len(self), GATHER_ROWS):
+            chunkChars, chunkLengths = self.gather(field, rowStart, rowStart + GATHER_ROWS, width)
+            chars[rowStart:rowStart + len(chunkChars)] = chunkChars
+            lengths[rowStart:rowStart + len(chunkChars)] = chunkLengths
+        return chars, lengths
+
+    def categories(self, field):
+        """
+        A column with few distinct values
+        Returns (codes, categories): int32 array of codes and the list of distinct (interned) strings,
+        categories[codes[i]] is the value of row i.
+        Each field is only looked up by its raw bytes, a string is decoded once per distinct value
+        """
+        codes = np.zeros(len(self), dtype=np.int32)
+        lookup = {}
+        buffer = self.buffer
+        for rowStart in range(0, len(self), GATHER_ROWS):
+            starts, ends = self.fieldBounds(field, rowStart, rowStart + GATHER_ROWS)
+            codes[rowStart:rowStart + len(starts)] = [lookup.setdefault(buffer[start:end], len(lookup))
+                                                      for start, end in zip(starts.tolist(), ends.tolist())]
+        categories = [sys.intern(unquote(value.decode(self.encoding))) for value in lookup]
+        return codes, categories
+
+    def close(self):
+        self.data = np.zeros(0, dtype=np.uint8)
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def xlsxCellText(value):
+    """Turns a spreadsheet cell value into the text the same cell has in a csv export (event times are left alone)"""
+    if value is None:
+        return ""
+    # whole numbers (e.g. the index column) come back as floats from some spreadsheets
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def iterXlsxRows(filePathName, sheetName=None):
+    """
+    Generator that yields the rows of an audit trail Excel export (.xlsx) one at a time (header row first), in the
+    same layout as iterAuditTrailRows gives for the csv export: newest event first, every field a string except the
+    event time, which is given as the cell's own datetime (no string parsing needed, and no seconds lost the way
+    they can be when Excel saves a csv, see AuditTrailTable.parseEventTimeValues). Event times that were typed in as
+    text stay text.
+    The workbook is opened read only, so the rows are streamed out of the file instead of the whole workbook being
+    loaded. Needs openpyxl
+    Args:
+        filePathName: path of the .xlsx file
+        sheetName: worksheet to read, defaults to the active (first) one
+    """
+    try:
+        import openpyxl
+    except ImportError:
+        raise ImportError("Reading .xlsx audit trails needs openpyxl (pip install openpyxl), "
+                          "or save the audit trail as a csv file first: " + str(filePathName))
+
+    workbook = openpyxl.load_workbook(filePathName, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheetName] if sheetName is not None else workbook.active
+        nFields = None
+        for values in sheet.iter_rows(values_only=True):
+            # read only sheets can carry on with empty (formatted) rows past the end of the data
+            if all(value is None for value in values):
+                continue
+            if nFields is None:
+                # header row, trailing empty header cells aren't columns
+                header = [xlsxCellText(value) for value in values]
+                while header and header[-1] == "":
+                    header.pop()
+                nFields = len(header)
+                yield header
+                continue
+            row = [xlsxCellText(value) for value in values[:nFields]]
+            row += [""] * (nFields - len(row))
+            if len(values) > 1 and isinstance(values[1], datetime.datetime):
+                row[1] = values[1]
+            yield row
+    finally:
+        # read only workbooks keep the file open until closed
+        workbook.close()
@@ -0,0 +1,228 @@
+import csv
+import sys
+import argparse
+import datetime
+import numpy as np
+
+"""
+Generator for realistic synthetic Onshape audit trails, for testing and benchmarking the analysis at sizes the real
+audit trails never reach.
+
+A synthetic audit trail is built like a real session: it starts with "Open document" and the part studio being
+opened, ends with the part studio being closed and "Close document", and in between is a random sequence of episodes
+made up of the same entries (in the same order and with the same timing pattern) as in the example audit trails:
+- createSketch / createFeature: "Add part studio feature" ... "Add or modify a sketch" (sketches only),
+  "Insert feature : <name>", "Commit add or edit of part studio feature", "Update Part Metadata"
+- editSketch / editFeature: "Start edit of part studio feature" ... "Add or modify a sketch" (sketches only),
+  "Edit : <name>", "Commit add or edit of part studio feature"
+- noChangeEdit: "Start edit of part studio feature" ... "Add or modify a sketch" (green checkmark without changes)
+- cancelCreate / cancelEdit: "Add part studio feature" / "Start edit of part studio feature" ... "Cancel Operation"
+- readDrawing: part studio closed and a "Step N.pdf" BLOB opened, then the BLOB closed and the part studio opened
+- undoRedo: "Undo Redo Operation", sometimes with an "Undo : 1 step" entry
+- moveRollbackBar, moveFeature, moveTab, rename, createFolder, showHide, delete: one entry each
+Edits, renames, moves and deletes pick one of the features created so far. The mix of episodes can be changed with
+the weights (defaults are roughly the frequencies in EXAMPLE_Task1.csv), everything is reproducible from the seed.
+
+Usage:
+    python AuditTrailSynthetic.py Participant_audit_trails/SYNTH_Task1.csv --events 100000 [--seed 1]
+"""
+
+
+HEADER = ["", "Event Time", "Document", "Tab", "User", "Description", "Feature Reference"]
+
+PART_STUDIO = "Part Studio 1"
+DRAWINGS = ["Step 1.pdf", "Step 2.pdf", "Step 3.pdf", "Changes.pdf"]
+FEATURE_KINDS = ["Extrude", "Fillet", "Chamfer", "Hole", "Mirror", "Linear pattern", "Revolve", "Shell"]
+
+# episode -> relative weight
+DEFAULT_WEIGHTS = {
+    "createSketch": 10,
+    "createFeature": 16,
+    "editSketch": 7,
+    "editFeature": 12,
+    "noChangeEdit": 2,
+    "cancelCreate": 1,
+    "cancelEdit": 2,
+    "readDrawing": 30,
+    "undoRedo": 1,
+    "moveRollbackBar": 6,
+    "moveFeature": 2,
+    "moveTab": 0.5,
+    "rename": 4,
+    "createFolder": 0.5,
+    "showHide": 2,
+    "delete": 0.5,
+}
+
+# mean number of seconds between two episodes, and the mean length of the episodes that take a while (the actual
+# times are drawn from exponential distributions around these, at least 1 second)
+MEAN_GAP = 6
+MEAN_DURATION = {"create": 25, "edit": 15, "cancel": 5, "readDrawing": 12}
+
+
+class SyntheticSession(object):
+    """
+    Builds one synthetic audit trail in chronological order (see module docstring)
+    Attributes:
+        entries: list of (seconds since the start, tab, description), oldest first
+    """
+    def __init__(self, seed=0, weights=None):
+        self.random = np.random.default_rng(seed)
+        weights = dict(DEFAULT_WEIGHTS if weights is None else weights)
+        self.episodes = list(weights)
+        probabilities = np.array([weights[name] for name in self.episodes], dtype=np.float64)
+        self.probabilities = probabilities / probabilities.sum()
+        self.entries = []
+        self.time = 0
+        self.sketches = []
+        self.features = []
+        self.featureCounts = {}
+
+    def add(self, tab, description, seconds=0):
+        """Adds an entry seconds after the previous one"""
+        self.time += int(seconds)
+        self.entries.append((self.time, tab, description))
+
+    def wait(self, mean):
+        """Random number of seconds (at least 1) for something that takes mean seconds on average"""
+        return 1 + int(self.random.exponential(mean))
+
+    def newName(self, kind):
+        self.featureCounts[kind] = self.featureCounts.get(kind, 0) + 1
+        return kind + " " + str(self.featureCounts[kind])
+
+    def existing(self, names):
+        """One of the features created so far (None if there aren't any yet)"""
+        return names[int(self.random.integers(len(names)))] if names else None
+
+    def metadataUpdates(self):
+        for i in range(int(self.random.integers(0, 3))):
+            self.add(PART_STUDIO, "Update Part Metadata")
+
+    def episode(self, name):
+        """Adds the entries of one episode"""
+        add = self.add
+        if name in ("createSketch", "createFeature"):
+            sketch = name == "createSketch"
+            featureName = self.newName("Sketch" if sketch else FEATURE_KINDS[int(self.random.integers(len(
+                FEATURE_KINDS)))])
+            add(PART_STUDIO, "Add part studio feature")
+            if sketch:
+                add(PART_STUDIO, "Add or modify a sketch", self.wait(MEAN_DURATION["create"]))
+                add(PART_STUDIO, "Insert feature : " + featureName)
+                self.sketches.append(featureName)
+            else:
+                add(PART_STUDIO, "Insert feature : " + featureName, self.wait(MEAN_DURATION["create"]))
+                self.features.append(featureName)
+            add(PART_STUDIO, "Commit add or edit of part studio feature")
+            self.metadataUpdates()
+        elif name in ("editSketch", "editFeature"):
+            sketch = name == "editSketch"
+            featureName = self.existing(self.sketches if sketch else self.features)
+            if featureName is None:
+                # nothing to edit yet
+                return self.episode("createSketch" if sketch else "createFeature")
+            add(PART_STUDIO, "Start edit of part studio feature")
+            if sketch:
+                add(PART_STUDIO, "Add or modify a sketch", self.wait(MEAN_DURATION["edit"]))
+                add(PART_STUDIO, "Edit : " + featureName)
+            else:
+                add(PART_STUDIO, "Edit : " + featureName, self.wait(MEAN_DURATION["edit"]))
+            add(PART_STUDIO, "Commit add or edit of part studio feature")
+            self.metadataUpdates()
+        elif name == "noChangeEdit":
+            add(PART_STUDIO, "Start edit of part studio feature")
+            add(PART_STUDIO, "Add or modify a sketch", self.wait(MEAN_DURATION["cancel"]))
+        elif name in ("cancelCreate", "cancelEdit"):
+            add(PART_STUDIO, "Add part studio feature" if name == "cancelCreate" else
+                "Start edit of part studio feature")
+            add("N/A", "Cancel Operation", self.wait(MEAN_DURATION["cancel"]))
+        elif name == "readDrawing":
+            drawing = DRAWINGS[int(self.random.integers(len(DRAWINGS)))]
+            add(PART_STUDIO, "Tab " + PART_STUDIO + " of type PARTSTUDIO closed by CAD_Study")
+            add(drawing, "Tab " + drawing + " of type BLOB opened by CAD_Study")
+            add(drawing, "Tab " + drawing + " of type BLOB closed by CAD_Study", self.wait(MEAN_DURATION["readDrawing"]))
+            add(PART_STUDIO, "Tab " + PART_STUDIO + " of type PARTSTUDIO opened by CAD_Study")
+        elif name == "undoRedo":
+            add(PART_STUDIO, "Undo Redo Operation")
+            if self.random.random() < 0.5:
+                add(PART_STUDIO, "Undo : 1 step")
+        elif name == "moveRollbackBar":
+            add(PART_STUDIO, "Move : Rollback bar")
+        elif name == "moveFeature":
+            add(PART_STUDIO, "Move : " + (self.existing(self.features + self.sketches) or "Origin"))
+        elif name == "moveTab":
+            drawing = DRAWINGS[int(self.random.integers(len(DRAWINGS)))]
+            add("Document as a whole", "Moved tab " + drawing + " to position 2")
+        elif name == "rename":
+            add(PART_STUDIO, "Rename : " + (self.existing(self.features + self.sketches) or "Origin"))
+        elif name == "createFolder":
+            add(PART_STUDIO, "Create folder : " + self.newName("Folder"))
+        elif name == "showHide":
+            add(PART_STUDIO, ["Hide all construction", "Show parts", "Hide all sketches"][int(self.random.integers(3))])
+        elif name == "delete":
+            names = self.features if self.features else self.sketches
+            featureName = self.existing(names)
+            if featureName is None:
+                return self.episode("createFeature")
+            names.remove(featureName)
+            add(PART_STUDIO, "Delete : " + featureName)
+        else:
+            raise ValueError("Unknown episode: " + name)
+
+    def generate(self, nEvents):
+        """
+        Builds the whole session with (at least, the last episode isn't cut short) nEvents entries
+        Returns the entries, see class docstring
+        """
+        self.add("N/A", "Open document")
+        self.add(PART_STUDIO, "Tab " + PART_STUDIO + " of type PARTSTUDIO opened by CAD_Study", self.wait(MEAN_GAP))
+        # two more entries at the end
+        while len(self.entries) < nEvents - 2:
+            self.time += self.wait(MEAN_GAP)
+            self.episode(self.episodes[int(self.random.choice(len(self.episodes), p=self.probabilities))])
+        self.add(PART_STUDIO, "Tab " + PART_STUDIO + " of type PARTSTUDIO closed by CAD_Study", self.wait(MEAN_GAP))
+        self.add("N/A", "Close document")
+        return self.entries
+
+
+def syntheticRows(nEvents, seed=0, weights=None, startTime=datetime.datetime(2021, 7, 13, 15, 0, 0),
+                  document="SYNTH-01", user="synthetic@example.com"):
+    """
+    Generator of the csv rows of a synthetic audit trail (header first, then newest event first like an export from
+    Onshape, see SyntheticSession for the arguments)
+    """
+    entries = SyntheticSession(seed, weights).generate(nEvents)
+    yield HEADER
+    for index, (seconds, tab, description) in enumerate(reversed(entries), 1):
+        yield [str(index), str(startTime + datetime.timedelta(seconds=seconds)), document, tab, user, description, ""]
+
+
+def writeSyntheticTrail(filePathName, nEvents, seed=0, weights=None):
+    """Writes a synthetic audit trail csv with (about) nEvents entries, returns the number of entries written"""
+    with open(filePathName, "w", newline="") as out_file:
+        writer = csv.writer(out_file)
+        nRows = -1
+        for nRows, row in enumerate(syntheticRows(nEvents, seed, weights)):
+            writer.writerow(row)
+    return nRows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a realistic synthetic Onshape audit trail")
+    parser.add_argument("fileName", help="csv file to write")
+    parser.add_argument("--events", type=int, default=10000, help="number of entries (the last episode isn't cut "
+                                                                     "short, so there can be a few more)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--weight", nargs=2, action="append", default=[], metavar=("EPISODE", "WEIGHT"),
+                        help="change the weight of one kind of episode, e.g. --weight readDrawing 0 (see "
+                             "DEFAULT_WEIGHTS)")
+    args = parser.parse_args()
+
+    weights = dict(DEFAULT_WEIGHTS)
+    for name, weight in args.weight:
+        if name not in weights:
+            sys.exit("Unknown episode: " + name + " (one of " + ", ".join(weights) + ")")
+        weights[name] = float(weight)
+    print("Wrote " + str(writeSyntheticTrail(args.fileName, args.events, args.seed, weights)) + " entries to " +
+          args.fileName)
@@ -0,0 +1,270 @@
+import sys
+import datetime
+import numpy as np
+
+from AuditTrailTiming import stage
+
+"""
+Compact, column-oriented storage for an audit trail.
+
+Instead of keeping every row as a python list of strings (several hundred bytes per event), each column is stored
+separately:
+- Index: int32 array
+- Event Time: int64 array of seconds since 1970-01-01 (see parseEventTimes)
+- Document, Tab, User, Description: int32 category codes into a list of interned strings (these columns only ever
+    take a handful of distinct values per trail, e.g. the same document/user on every row)
+- Feature Reference and HMM Sequence: annotation columns filled in by analyzeAuditTrail
+
+Rows are stored chronologically (position 0 = oldest event = "Open document"), i.e. the REVERSE of the order in the
+csv exported from Onshape (newest event at the top). rows() gives them back in the csv order.
+"""
+
+
+# names of the columns in the exported audit trail, in order
+COLUMN_NAMES = ["Index", "Event Time", "Document", "Tab", "User", "Description", "Feature Reference", "HMM Sequence"]
+
+
+class AuditTrailIntegrityError(Exception):
+    """Raised while streaming an audit trail when it fails one of the integrity checks"""
+    pass
+
+
+def parseEventTimes(eventTimes):
+    """
+    Fixed format parser for the "Event Time" column, replaces calling
+    datetime.datetime.strptime(row[1], "%Y-%m-%d %H:%M:%S") on every row.
+    The whole column is converted in one go: since every timestamp has exactly 19 characters, the strings are viewed as
+    a (rows x 19) array of character codes and the date/time fields are pulled out of their fixed positions with numpy.
+
+    Args:
+        eventTimes: sequence of event time strings ("YYYY-MM-DD HH:MM:SS")
+    Returns:
+        (epochSeconds, badRows): int64 array of seconds since 1970-01-01 (0 for malformed entries),
+        and a list of the positions (within eventTimes) of the malformed entries
+    """
+    eventTimes = np.asarray(eventTimes, dtype=str)
+    if len(eventTimes) == 0:
+        return np.zeros(0, dtype=np.int64), []
+
+    # anything that isn't exactly 19 characters long can't match the format
+    goodLength = np.char.str_len(eventTimes) == 19
+    # one row of unicode code points per timestamp, shorter strings are padded with 0s
+    chars = eventTimes.astype("<U19").view(np.uint32).reshape(len(eventTimes), 19).astype(np.int64)
+
+    epochSeconds, valid = parseEventTimeChars(chars, goodLength)
+    return epochSeconds, np.flatnonzero(~valid).tolist()
+
+
+def parseEventTimeChars(chars, goodLength):
+    """
+    The actual parser behind parseEventTimes, works on the character codes directly so it can also be fed the raw
+    bytes of a memory mapped csv (see AuditTrailReader.MappedCsv)
+    Args:
+        chars: (rows x 19) int array of character codes
+        goodLength: bool array, whether each timestamp is exactly 19 characters long
+    Returns:
+        (epochSeconds, valid): int64 array of seconds since 1970-01-01 (0 for malformed entries) and a bool array
+        that is False for the malformed entries
+    """
+    chars = np.asarray(chars, dtype=np.int64)
+    digitPositions = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]
+    separators = {4: "-", 7: "-", 10: " ", 13: ":", 16: ":"}
+    digits = chars[:, digitPositions] - ord("0")
+    valid = goodLength & np.all((digits >= 0) & (digits <= 9), axis=1)
+    for position, separator in separators.items():
+        valid &= chars[:, position] == ord(separator)
+
+    # combine the digit pairs/quads back into numbers
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month = digits[:, 4] * 10 + digits[:, 5]
+    day = digits[:, 6] * 10 + digits[:, 7]
+    hour = digits[:, 8] * 10 + digits[:, 9]
+    minute = digits[:, 10] * 10 + digits[:, 11]
+    second = digits[:, 12] * 10 + digits[:, 13]
+
+    valid &= (month >= 1) & (month <= 12) & (day >= 1) & (hour < 24) & (minute < 60) & (second < 60)
+    # blank out the malformed rows so the date arithmetic below stays in range
+    year = np.where(valid, year, 1970)
+    month = np.where(valid, month, 1)
+    day = np.where(valid, day, 1)
+
+    monthStart = (year - 1970).astype("datetime64[Y]") + (month - 1).astype("timedelta64[M]")
+    date = monthStart.astype("datetime64[D]") + (day - 1).astype("timedelta64[D]")
+    # catches days past the end of the month (e.g. 2021-02-30)
+    valid &= date.astype("datetime64[M]") == monthStart
+
+    epochSeconds = date.astype(np.int64) * 86400 + hour * 3600 + minute * 60 + second
+    epochSeconds[~valid] = 0
+
+    return epochSeconds, valid
+
+
+def parseEventTimeValues(eventTimes):
+    """
+    parseEventTimes for a column that can also hold datetime objects, e.g. the native date cells of an Excel export
+    (see AuditTrailReader.iterXlsxRows). Those are converted straight to epoch seconds (rounded to the nearest second,
+    spreadsheet times are stored as fractions of a day and can come back a microsecond short), only the text entries
+    go through the string parser
+    Returns:
+        (epochSeconds, badRows), same as parseEventTimes
+    """
+    native = np.array([isinstance(value, datetime.datetime) for value in eventTimes], dtype=bool)
+    if not native.any():
+        return parseEventTimes(eventTimes)
+
+    epochSeconds = np.zeros(len(eventTimes), dtype=np.int64)
+    nativePositions = np.flatnonzero(native)
+    microseconds = np.array([eventTimes[position] for position in nativePositions.tolist()],
+                            dtype="datetime64[us]").astype(np.int64)
+    epochSeconds[nativePositions] = (microseconds + 500000) // 1000000
+
+    textPositions = np.flatnonzero(~native)
+    textSeconds, badRows = parseEventTimes([eventTimes[position] for position in textPositions.tolist()])
+    epochSeconds[textPositions] = textSeconds
+    return epochSeconds, textPositions[badRows].tolist()
+
+
+def formatEventTimes(epochSeconds):
+    """
+    Inverse of parseEventTimes, turns an array of epoch seconds back into "YYYY-MM-DD HH:MM:SS" strings
+    """
+    if len(epochSeconds) == 0:
+        return []
+    isoStrings = np.datetime_as_string(np.asarray(epochSeconds, dtype=np.int64).astype("datetime64[s]"))
+    return np.char.replace(isoStrings, "T", " ").tolist()
+
+
+class AuditTrail(object):
+    """
+    Column-oriented audit trail event table (see module docstring), rows in chronological order
+    """
+    def __init__(self, header, index, eventTime, document, tab, user, description):
+        """
+        Args:
+            header: column header row of the csv
+            index: int array of the "Index" column
+            eventTime: int64 array of event times (seconds since 1970-01-01)
+            document, tab, user, description: (codes, categories) tuples, an int32 array of codes and the list of
+                distinct (interned) strings they refer to, categories[codes[i]] is the value of row i
+        """
+        self.header = list(header[:6]) + COLUMN_NAMES[6:]
+        self.index = np.asarray(index, dtype=np.int32)
+        self.eventTime = np.asarray(eventTime, dtype=np.int64)
+        self.documentCodes, self.documents = document
+        self.tabCodes, self.tabs = tab
+        self.userCodes, self.users = user
+        self.descriptionCodes, self.descriptions = description
+
+        # annotation columns, filled in during analysis
+        self.featureReference = [""] * len(self.index)
+        self.hmmSequence = [""] * len(self.index)
+        # Index of any rows whose event time could not be parsed
+        self.malformedRows = []
+
+    @classmethod
+    def fromRows(cls, rows, oldestFirst=False, renumber=False):
+        """
+        Builds the table from csv rows (header row first, newest event first as exported from Onshape).
+        The event times can be strings or datetime objects (see parseEventTimeValues).
+        The rows are consumed one at a time so they can come straight from a generator, the string columns are
+        interned as they stream in.
+        Event times that don't match the expected format are listed (by their Index) in trail.malformedRows,
+        their eventTime is left as 0. Raises AuditTrailIntegrityError if there isn't even a header row
+        Args:
+            rows: iterable of csv rows
+            oldestFirst: the rows (after the header) come oldest event first instead, e.g. from
+                         AuditTrailReader.iterAuditTrailRowsReversed
+            renumber: ignore the Index column of the rows and number them 1, 2, ... from the newest event (like the
+                      cleaned audit trails)
+        """
+        rows = iter(rows)
+        # a bare StopIteration would turn into a RuntimeError inside the streaming generators
+        header = next(rows, None)
+        if header is None:
+            raise AuditTrailIntegrityError("empty audit trail")
+
+        indexColumn = []
+        eventTimeColumn = []
+        # document, tab, user, description
+        lookups = [{}, {}, {}, {}]
+        codeColumns = [[], [], [], []]
+        for row in rows:
+            if not renumber:
+                indexColumn.append(int(row[0]))
+            eventTimeColumn.append(row[1])
+            for codes, lookup, value in zip(codeColumns, lookups, row[2:6]):
+                codes.append(lookup.setdefault(value, len(lookup)))
+
+        if renumber:
+            indexColumn = np.arange(len(eventTimeColumn), 0, -1, dtype=np.int32)
+            if not oldestFirst:
+                indexColumn = indexColumn[::-1]
+        # reverse everything into chronological order
+        if not oldestFirst:
+            eventTimeColumn.reverse()
+            indexColumn = indexColumn[::-1]
+            codeColumns = [codes[::-1] for codes in codeColumns]
+        with stage("parseTimes"):
+            epochSeconds, badRows = parseEventTimeValues(eventTimeColumn)
+        categoryColumns = []
+        for codes, lookup in zip(codeColumns, lookups):
+            categoryColumns.append((np.array(codes, dtype=np.int32), [sys.intern(value) for value in lookup]))
+
+        trail = cls(header, indexColumn, epochSeconds, *categoryColumns)
+        trail.malformedRows = [int(trail.index[position]) for position in badRows]
+        return trail
+
+    def take(self, positions):
+        """
+        New table with only the rows at the given positions (e.g. one user's events out of a shared export, see
+        AuditTrailPartition), numbered like a cleaned audit trail. The annotation columns start out blank
+        Args:
+            positions: int array of row positions, in chronological order
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        categoryColumns = []
+        for codes, categories in [(self.documentCodes, self.documents), (self.tabCodes, self.tabs),
+                                  (self.userCodes, self.users), (self.descriptionCodes, self.descriptions)]:
+            # drop the categories only the other rows used
+            used, newCodes = np.unique(codes[positions], return_inverse=True)
+            categoryColumns.append((newCodes.astype(np.int32).ravel(), [categories[code] for code in used.tolist()]))
+
+        trail = AuditTrail(self.header, np.arange(len(positions), 0, -1), self.eventTime[positions], *categoryColumns)
+        malformed = np.isin(self.index[positions], self.malformedRows)
+        trail.malformedRows = trail.index[malformed].tolist()
+        return trail
+
+    def __len__(self):
+        return len(self.index)
+
+    def description(self, position):
+        return self.descriptions[self.descriptionCodes[position]]
+
+    def tab(self, position):
+        return self.tabs[self.tabCodes[position]]
+
+    def datetime(self, position):
+        """Event time of a row as a datetime object"""
+        return datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=int(self.eventTime[position]))
+
+    def row(self, position):
+        """One row of the table in the csv layout, e.g. for printing"""
+        return [str(self.index[position]), str(self.datetime(position)),
+                self.documents[self.documentCodes[position]], self.tab(position),
+                self.users[self.userCodes[position]], self.description(position),
+                self.featureReference[position], self.hmmSequence[position]]
+
+    def rows(self):
+        """
+        Generator giving the table back as csv rows in the Onshape export order (header first, newest event first)
+        """
+        yield self.header
+        eventTimes = formatEventTimes(self.eventTime)
+        documents = [self.documents[code] for code in self.documentCodes.tolist()]
+        tabs = [self.tabs[code] for code in self.tabCodes.tolist()]
+        users = [self.users[code] for code in self.userCodes.tolist()]
+        descriptions = [self.descriptions[code] for code in self.descriptionCodes.tolist()]
+        for position in reversed(range(len(self))):
+            yield [str(self.index[position]), eventTimes[position], documents[position], tabs[position],
+                   users[position], descriptions[position], self.featureReference[position],
+                   self.hmmSequence[position]]
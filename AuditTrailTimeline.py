@@ -0,0 +1,140 @@
+import numpy as np
+import matplotlib.pyplot as plt
+
+"""
+Timeline (event plot) of an analyzed audit trail.
+
+Every entry of the time_series list built by analyzeAuditTrail ((action, start time, duration), see there) is drawn as
+one horizontal bar from its start to its end with broken_barh, one row per type of action. Previously every span was
+expanded into one point per second and drawn with eventplot, which means hundreds of thousands of points for
+multi-hour sessions.
+
+The spans are turned into arrays (start offset, end offset, row) in one go. For long trails, bars of the same row that
+are closer together than what can be seen on the saved figure (less than a pixel apart) are merged before drawing, so
+the number of bars drawn stays bounded by the figure width no matter how long the audit trail is.
+"""
+
+
+# (match kind, action label, plot row, colour, bar height) checked in order, the first one that matches the time_series
+# action label decides where it gets drawn. "contains" rules are for the labels that have the feature/drawing name
+# tacked on the end (e.g. "sketchCreateTime - Sketch 1 (Sketch)"). Actions not in the table aren't drawn.
+TIMELINE_ROWS = [
+    ("contains", "readDrawingTime - Changes", 13, "blue", 0.9),
+    ("contains", "readDrawingTime - Step 4", 13, "purple", 0.9),
+    ("contains", "readDrawingTime - Step 3", 13, "lime", 0.9),
+    ("contains", "readDrawingTime - Step 2", 13, "gold", 0.9),
+    ("contains", "readDrawingTime - Step 1", 13, "red", 0.9),
+    ("contains", "sketchCreateTime", 12, "mediumblue", 0.9),
+    ("contains", "featureCreateTime", 11, "mediumblue", 0.9),
+    ("contains", "sketchEditTime", 10, "mediumblue", 0.9),
+    ("contains", "featureEditTime", 9, "mediumblue", 0.9),
+    ("equals", "cancelCreateTime", 8, "mediumblue", 0.9),
+    ("equals", "cancelledCreateTime", 8, "mediumblue", 0.9),
+    ("equals", "cancelledEditTime", 7, "mediumblue", 0.9),
+    ("equals", "moveRollbackBar", 6, "orangered", 0.5),
+    ("equals", "moveFeature", 5, "orangered", 0.5),
+    ("equals", "renameFeature", 4, "orangered", 0.5),
+    ("equals", "undoRedo", 3, "orangered", 0.5),
+    ("equals", "deletedFeature", 2, "orangered", 0.5),
+    ("equals", "showHide", 1, "orangered", 0.5),
+    ("equals", "createFolder", 0, "orangered", 0.5),
+]
+
+# y axis labels, one per plot row
+ROW_LABELS = ["Created folder", "Show/hide", "Deleted feature", "Undo/Redo", "Rename feature", "Move feature",
+              "Move rollback bar", "Cancelled edit", "Cancelled creation", "Edit PS feature", "Edit sketch",
+              "Create PS feature", "Create sketch feature", "Read drawing"]
+
+# resolution of the saved figure, used to decide which bars are too close together to tell apart
+DPI = 100
+
+
+def timelineRule(action):
+    """Number of the TIMELINE_ROWS rule an action label falls under, -1 if it isn't drawn"""
+    for number, (kind, pattern, row, colour, height) in enumerate(TIMELINE_ROWS):
+        if (kind == "contains" and pattern in action) or (kind == "equals" and action == pattern):
+            return number
+    return -1
+
+
+def timelineIntervals(time_series, startTime):
+    """
+    Turns the time_series list into interval arrays
+    Args:
+        time_series: list of (action label, start datetime, duration timedelta)
+        startTime: datetime of the start of the audit trail (x = 0 on the plot)
+    Returns:
+        (starts, ends, rules): int64 arrays of the start/end offsets (seconds from startTime) and the TIMELINE_ROWS
+        rule of every span that gets drawn (zero length spans and actions not in the table are dropped)
+    """
+    if not time_series:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    actions, timestamps, durations = zip(*time_series)
+    # each distinct label is only matched against the table once
+    distinctActions, actionCodes = np.unique(np.array(actions, dtype=object).astype(str), return_inverse=True)
+    rules = np.array([timelineRule(action) for action in distinctActions], dtype=np.int64)[actionCodes]
+
+    starts = (np.array(timestamps, dtype="datetime64[s]") - np.datetime64(startTime, "s")).astype(np.int64)
+    ends = starts + np.array(durations, dtype="timedelta64[s]").astype(np.int64)
+
+    keep = (rules >= 0) & (ends > starts)
+    return starts[keep], ends[keep], rules[keep]
+
+
+def mergeIntervals(starts, ends, groups, minGap):
+    """
+    Merges the intervals of each group that overlap or are less than minGap apart
+    Returns (starts, ends, groups) of the merged intervals, sorted by group then start
+    """
+    if len(starts) == 0:
+        return starts, ends, groups
+    order = np.lexsort((starts, groups))
+    starts, ends, groups = starts[order], ends[order], groups[order]
+
+    # shifting every group into its own range of the number line means a single running maximum of the ends works
+    # across all the groups at once
+    shift = groups * (int(ends.max()) + int(minGap) + 1)
+    reachedSoFar = np.maximum.accumulate(ends + shift)
+    newInterval = np.ones(len(starts), dtype=bool)
+    newInterval[1:] = starts[1:] + shift[1:] > reachedSoFar[:-1] + minGap
+    firsts = np.flatnonzero(newInterval)
+
+    return starts[firsts], np.maximum.reduceat(ends, firsts), groups[firsts]
+
+
+def plotTimeline(time_series, startTime, title, saveFigLocation, figsize=(10, 5)):
+    """
+    Draws the timeline of an audit trail and saves it
+    Args:
+        time_series: list of (action label, start datetime, duration timedelta) from analyzeAuditTrail
+        startTime: datetime of the start of the audit trail
+        title: plot title
+        saveFigLocation: where to save the figure (path, or a binary file open for writing)
+        figsize: figure size in inches
+    """
+    starts, ends, rules = timelineIntervals(time_series, startTime)
+
+    # bars less than a pixel apart can't be told apart on the saved figure anyway
+    plotWidth = int(ends.max()) if len(ends) else 0
+    secondsPerPixel = plotWidth / (figsize[0] * DPI)
+    if int(secondsPerPixel) > 0:
+        starts, ends, rules = mergeIntervals(starts, ends, rules, int(secondsPerPixel))
+    # short actions (a few seconds) still need to show up as a visible tick, like they did on the eventplot
+    widths = np.maximum(ends - starts, 3 * secondsPerPixel)
+
+    fig, ax = plt.subplots(figsize=figsize)
+    for number in np.unique(rules).tolist():
+        kind, pattern, row, colour, height = TIMELINE_ROWS[number]
+        inRule = rules == number
+        ax.broken_barh(list(zip(starts[inRule].tolist(), widths[inRule].tolist())),
+                       (row - height / 2, height), facecolors=colour, linewidth=0, antialiased=False)
+
+    ax.set_yticks(np.arange(len(ROW_LABELS)), ROW_LABELS)
+    ax.set_ylim(-0.5, len(ROW_LABELS) - 0.5)
+    ax.set_xlabel("Time (s)")
+    ax.set_title(title, fontdict=None, loc='center', pad=6)
+    fig.tight_layout()
+
+    fig.savefig(saveFigLocation, dpi=DPI) #, bbox_inches='tight'
+    plt.close(fig)
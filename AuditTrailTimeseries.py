@@ -0,0 +1,188 @@
+import os
+import sys
+import json
+import struct
+import datetime
+import numpy as np
+
+"""
+Binary record format for the time series of an analyzed audit trail (XX_IDXX_cleaned_timeseries.bin).
+
+The _timeseries.json output stores every (action, start time, duration) entry of the time_series list built by
+analyzeAuditTrail as three strings, e.g. ["sketchCreateTime - Sketch 1 (Sketch)", "2021-07-13 15:12:01", "0:00:20"],
+which all have to be parsed again by anything that reads it. Here every entry is one fixed size typed record:
+    category (int16)  code of the action, e.g. sketchCreateTime (the part of the label before " - ")
+    feature  (int32)  code of the feature/drawing name (the part after " - "), -1 if the label doesn't have one
+    start    (int64)  start time, seconds since 1970-01-01
+    duration (int64)  duration in seconds
+Category and feature names are interned: each distinct name is stored once in a name table at the end of the file.
+
+File layout: MAGIC (8 bytes), the records back to back, the name table (json: {"categories": [...],
+"features": [...]}), and the offset of the name table (uint64, last 8 bytes). TimeseriesWriter writes the records out
+as they come, only the name table is held until the end; loadTimeseries reads all the records in one numpy call.
+"""
+
+
+MAGIC = b"ATTS\x00\x01\x00\x00"
+
+RECORD_DTYPE = np.dtype([("category", "<i2"), ("feature", "<i4"), ("start", "<i8"), ("duration", "<i8")])
+
+# categories every file starts out with (in this order), so that the codes of the usual actions are the same in every
+# file. Anything else gets added to the end of the file's own table
+CATEGORIES = ["partstudioTime", "readDrawingTime", "sketchCreateTime", "featureCreateTime", "sketchEditTime",
+              "featureEditTime", "cancelCreateTime", "cancelledCreateTime", "cancelledEditTime", "moveRollbackBar",
+              "moveFeature", "undoRedo", "createFolder", "renameFeature", "showHide", "deletedFeature"]
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# number of records buffered before they're written out
+FLUSH_RECORDS = 4096
+
+
+def splitLabel(label):
+    """(category, feature name or None) of a time_series action label, e.g. "readDrawingTime - Step 1.pdf" """
+    category, separator, feature = label.partition(" - ")
+    return category, (feature if separator else None)
+
+
+class TimeseriesWriter(object):
+    """
+    Writes time series entries to a binary record file one at a time (see module docstring)
+    Usage:
+        with TimeseriesWriter(path) as writer:
+            for action, start, duration in time_series:
+                writer.write(action, start, duration)
+    """
+    def __init__(self, fileName):
+        """
+        Args:
+            fileName: path of the file, or an already open binary file (left open by close)
+        """
+        self.categoryCodes = {name: code for code, name in enumerate(CATEGORIES)}
+        self.featureCodes = {}
+        self.pending = []
+        self.ownsFile = isinstance(fileName, (str, bytes, os.PathLike))
+        self.outFile = open(fileName, "wb") if self.ownsFile else fileName
+        # the offsets in the file are relative to where it starts (an open file may already have something in it)
+        self.start = self.outFile.tell()
+        self.outFile.write(MAGIC)
+
+    def write(self, label, start, duration):
+        """
+        Adds one entry
+        Args:
+            label: action label as in time_series, e.g. "featureEditTime - Extrude 1"
+            start: start time, datetime (or seconds since 1970-01-01)
+            duration: timedelta (or seconds)
+        """
+        category, feature = splitLabel(label)
+        categoryCode = self.categoryCodes.setdefault(category, len(self.categoryCodes))
+        featureCode = -1 if feature is None else self.featureCodes.setdefault(feature, len(self.featureCodes))
+        if isinstance(start, datetime.datetime):
+            start = (start - EPOCH) // datetime.timedelta(seconds=1)
+        if isinstance(duration, datetime.timedelta):
+            duration = duration // datetime.timedelta(seconds=1)
+        self.pending.append((categoryCode, featureCode, start, duration))
+        if len(self.pending) >= FLUSH_RECORDS:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.outFile.write(np.array(self.pending, dtype=RECORD_DTYPE).tobytes())
+            self.pending = []
+
+    def close(self):
+        if self.outFile is None:
+            return
+        self.flush()
+        tableOffset = self.outFile.tell() - self.start
+        table = {"categories": list(self.categoryCodes), "features": list(self.featureCodes)}
+        self.outFile.write(json.dumps(table).encode("utf-8"))
+        self.outFile.write(struct.pack("<Q", tableOffset))
+        if self.ownsFile:
+            self.outFile.close()
+        self.outFile = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def categoryTotals(category, duration, nCategories=len(CATEGORIES)):
+    """
+    Total duration and number of entries of every category in one grouped reduction (np.bincount)
+    Args:
+        category: category code of every entry (array or list)
+        duration: duration of every entry in seconds
+        nCategories: number of categories (the arrays returned are at least this long)
+    Returns:
+        (totalSeconds, counts): int64 arrays indexed by category code
+    """
+    category = np.asarray(category, dtype=np.int64)
+    # float64 sums of whole seconds are exact far beyond any audit trail's length
+    totalSeconds = np.bincount(category, weights=np.asarray(duration, dtype=np.float64), minlength=nCategories)
+    return np.rint(totalSeconds).astype(np.int64), np.bincount(category, minlength=nCategories).astype(np.int64)
+
+
+def writeTimeseries(time_series, fileName):
+    """Writes a whole time_series list (see analyzeAuditTrail) to a binary record file (path or open file)"""
+    with TimeseriesWriter(fileName) as writer:
+        for label, start, duration in time_series:
+            writer.write(label, start, duration)
+
+
+class Timeseries(object):
+    """
+    A time series read back from a record file, as arrays
+    Attributes:
+        category, feature, start, duration: one entry per record (see RECORD_DTYPE), feature is -1 for labels
+                                            without a feature name
+        categories, features: the name tables, categories[category[i]] is the category of record i
+    """
+    def __init__(self, records, categories, features):
+        self.category = records["category"].astype(np.int32)
+        self.feature = records["feature"].astype(np.int32)
+        self.start = records["start"].astype(np.int64)
+        self.duration = records["duration"].astype(np.int64)
+        self.categories = [sys.intern(name) for name in categories]
+        self.features = [sys.intern(name) for name in features]
+
+    def __len__(self):
+        return len(self.start)
+
+    def categoryCode(self, name):
+        """Code of a category in this file, -1 if it doesn't have any records of it"""
+        return self.categories.index(name) if name in self.categories else -1
+
+    def totals(self):
+        """(totalSeconds, counts) of every category, indexed by category code (see categoryTotals)"""
+        return categoryTotals(self.category, self.duration, len(self.categories))
+
+    def labels(self):
+        """The action labels as they are in time_series"""
+        return [self.categories[category] if feature < 0 else self.categories[category] + " - " + self.features[feature]
+                for category, feature in zip(self.category.tolist(), self.feature.tolist())]
+
+    def entries(self):
+        """The time series as the original list of (action label, start datetime, duration timedelta)"""
+        return [(label, EPOCH + datetime.timedelta(seconds=start), datetime.timedelta(seconds=duration))
+                for label, start, duration in zip(self.labels(), self.start.tolist(), self.duration.tolist())]
+
+
+def loadTimeseries(fileName):
+    """Reads a binary time series record file, returns a Timeseries"""
+    with open(fileName, "rb") as inFile:
+        return parseTimeseries(inFile.read())
+
+
+def parseTimeseries(data):
+    """Timeseries from the contents (bytes) of a record file, e.g. as stored in an output bundle (AuditTrailBundle)"""
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a time series record file (or a different version of the format)")
+    tableOffset = struct.unpack("<Q", data[-8:])[0]
+    records = np.frombuffer(data, dtype=RECORD_DTYPE, count=(tableOffset - len(MAGIC)) // RECORD_DTYPE.itemsize,
+                            offset=len(MAGIC))
+    table = json.loads(data[tableOffset:-8].decode("utf-8"))
+    return Timeseries(records, table["categories"], table["features"])
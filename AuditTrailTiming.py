@@ -0,0 +1,185 @@
+import os
+import time
+import json
+import cProfile
+import contextlib
+import tracemalloc
+import numpy as np
+
+"""
+Per stage timing of the audit trail pipeline.
+
+The pipeline functions (read_file -> readCleanedTrail -> cleanCsv -> analyzeAuditTrail, see AuditTrailAnalyzer) wrap
+each of their stages in stage("name"), and record how much they processed with count("name", n). The times of one
+audit trail are collected between startFile() and finishFile(), which returns a record:
+    {"file": name, "total": seconds, "stages": {stage: seconds}, "counts": {name: n}}
+Stages can be nested, a stage's time doesn't include the time spent in the stages inside it, so the stage times of a
+file add up to the time spent in stages overall. The timer is per process (the batch workers each time their own
+files and send the records back with their results).
+While tracemalloc is tracing (e.g. in AuditTrailBenchmark) the record also has "memory": {stage: bytes}, the peak
+memory allocated during each stage (including the stages inside it) above what was allocated when it started.
+
+summarize/printSummary turn the records of a batch into totals per stage, percentiles of the time per file and the
+slowest files. profileFile runs one audit trail under cProfile and saves the stats for pstats/snakeviz.
+"""
+
+
+# the stages in the order they happen, for the summary
+STAGES = ["hash", "cacheLoad", "parse", "clean", "parseTimes", "classify", "pairSpans", "analysis", "writeCsv",
+          "writeJson", "plot", "database", "cacheWrite"]
+
+DEFAULT_TIMINGS = os.path.join("Analysis_output", "Audit_Trail_Timings.json")
+PROFILE_DIRECTORY = os.path.join("Analysis_output", "profiles")
+
+
+class StageTimer(object):
+    """Accumulates the time spent in each stage (and the counts) of the current file"""
+    def __init__(self):
+        self.reset(None)
+
+    def reset(self, fileName):
+        self.fileName = fileName
+        self.stages = {}
+        self.counts = {}
+        self.memory = {}
+        # [stage name, start time, time spent in nested stages, memory at the start, peak memory so far] of the
+        # stages currently running
+        self.running = []
+        self.started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        tracing = tracemalloc.is_tracing()
+        entry = [name, time.perf_counter(), 0.0, 0, 0]
+        if tracing:
+            # the peak is reset for this stage, the enclosing stage keeps the peak it had reached so far
+            current, peak = tracemalloc.get_traced_memory()
+            if self.running:
+                self.running[-1][4] = max(self.running[-1][4], peak)
+            tracemalloc.reset_peak()
+            entry[3] = entry[4] = current
+        self.running.append(entry)
+        try:
+            yield
+        finally:
+            self.running.pop()
+            elapsed = time.perf_counter() - entry[1]
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed - entry[2]
+            if self.running:
+                self.running[-1][2] += elapsed
+            if tracing:
+                peak = max(entry[4], tracemalloc.get_traced_memory()[1])
+                self.memory[name] = max(self.memory.get(name, 0), peak - entry[3])
+                if self.running:
+                    self.running[-1][4] = max(self.running[-1][4], peak)
+
+    def count(self, name, n):
+        self.counts[name] = self.counts.get(name, 0) + int(n)
+
+    def record(self):
+        record = {"file": self.fileName,
+                  "total": time.perf_counter() - self.started,
+                  "stages": dict(self.stages),
+                  "counts": dict(self.counts)}
+        if self.memory:
+            record["memory"] = dict(self.memory)
+        return record
+
+
+# the timer of this process
+timer = StageTimer()
+
+
+def stage(name):
+    """Context manager timing one stage of the current file"""
+    return timer.stage(name)
+
+
+def count(name, n):
+    """Adds n to one of the current file's counts (e.g. events processed)"""
+    timer.count(name, n)
+
+
+def startFile(fileName):
+    timer.reset(fileName)
+
+
+def finishFile():
+    """The timing record of the current file (see module docstring)"""
+    return timer.record()
+
+
+def profileFile(function, fileName, *args, **kwargs):
+    """
+    Calls function(fileName, *args, **kwargs) under cProfile and saves the stats to
+    Analysis_output/profiles/<fileName>.prof, returns what the function returned
+    """
+    os.makedirs(PROFILE_DIRECTORY, exist_ok=True)
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, fileName, *args, **kwargs)
+    finally:
+        profiler.dump_stats(os.path.join(PROFILE_DIRECTORY, os.path.basename(fileName) + ".prof"))
+
+
+def summarize(records, slowest=5):
+    """
+    Batch summary of the timing records of many files
+    Returns a dict with:
+        files: number of files
+        stages: stage -> {"total", "mean", "p50", "p90", "p99", "max"} seconds over the files
+        total: the same statistics for the whole time per file
+        counts: name -> total count
+        slowest: the slowest files, [(file, seconds, slowest stage)]
+    """
+    records = [record for record in records if record is not None]
+
+    def statistics(values):
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return {"total": 0.0, "mean": 0.0, "p50": 0.0, "p90": 0.0, "p99": 0.0, "max": 0.0}
+        p50, p90, p99 = np.percentile(values, [50, 90, 99]).tolist()
+        return {"total": float(values.sum()), "mean": float(values.mean()), "p50": p50, "p90": p90, "p99": p99,
+                "max": float(values.max())}
+
+    names = [name for name in STAGES if any(name in record["stages"] for record in records)]
+    names += sorted(set(name for record in records for name in record["stages"]) - set(names))
+    counts = {}
+    for record in records:
+        for name, n in record["counts"].items():
+            counts[name] = counts.get(name, 0) + n
+
+    bySpeed = sorted(records, key=lambda record: record["total"], reverse=True)[:slowest]
+    return {"files": len(records),
+            "stages": {name: statistics([record["stages"].get(name, 0.0) for record in records]) for name in names},
+            "total": statistics([record["total"] for record in records]),
+            "counts": counts,
+            "slowest": [(record["file"], record["total"],
+                         max(record["stages"], key=record["stages"].get) if record["stages"] else "")
+                        for record in bySpeed]}
+
+
+def printSummary(summary):
+    """Prints a batch summary (see summarize) as a table"""
+    print("\n### Timings (" + str(summary["files"]) + " files) ###")
+    print("stage".ljust(12) + "".join(column.rjust(10) for column in ["total s", "mean", "p50", "p90", "p99", "max"]) +
+          "share".rjust(8))
+    overall = sum(values["total"] for values in summary["stages"].values()) or 1.0
+    for name, values in list(summary["stages"].items()) + [("per file", summary["total"])]:
+        line = name.ljust(12) + "".join(("%.3f" % values[column]).rjust(10)
+                                        for column in ["total", "mean", "p50", "p90", "p99", "max"])
+        if name != "per file":
+            line += ("%.1f%%" % (100 * values["total"] / overall)).rjust(8)
+        print(line)
+    if summary["counts"]:
+        print("counts: " + ", ".join(name + " " + str(n) for name, n in summary["counts"].items()))
+    print("slowest files:")
+    for fileName, seconds, slowestStage in summary["slowest"]:
+        print("\t%.3f s  %s (mostly %s)" % (seconds, fileName, slowestStage))
+
+
+def saveTimings(records, summary, timingsFileName=DEFAULT_TIMINGS):
+    """Writes the per file records and the summary to a json file"""
+    with open(timingsFileName, "w") as outFile:
+        json.dump({"summary": summary, "files": [record for record in records if record is not None]}, outFile,
+                  indent=1)
@@ -0,0 +1,296 @@
+import os
+import sys
+import csv
+import json
+import argparse
+import concurrent.futures
+import numpy as np
+
+from AuditTrailTable import COLUMN_NAMES, parseEventTimeChars, parseEventTimeValues
+from AuditTrailReader import MappedCsv, iterXlsxRows
+from AuditTrailClassifier import EventType, defaultClassifier
+from AuditTrailAnalyzer import REMOVED_DESCRIPTIONS
+
+"""
+Integrity checks for raw audit trails that report every problem at once.
+
+read_file stops at the first index that's out of order, and a malformed event time is only found once the analysis
+is under way. That's fine for one audit trail, but sorting through a few thousand exports that way means fixing and
+re-running them one problem at a time. validateFile runs all the checks on whole columns (numpy arrays, no per row
+python loop for csv files, see AuditTrailReader.MappedCsv) and returns a ValidationReport listing every violation:
+- header: the header row has the expected columns (Index/blank, Event Time, Document, Tab, User, Description)
+- fieldCount: every row has as many fields as the header
+- index: the index column counts up by one from 1 (the rows where the count breaks are reported)
+- eventTime: every event time is "YYYY-MM-DD HH:MM:SS"
+- timeOrder: the event times never go forwards down the file (the export is newest event first)
+- openDocument/closeDocument: "Open document" is the oldest entry (last row) and "Close document" the newest one
+  (first row), and neither shows up anywhere else
+- closeDocumentMissing: the newest entry isn't "Close document" (e.g. the session was exported before it was closed)
+Rows are numbered like the index column should be (1 = the first row under the header).
+The eventTime and open/close document checks only look at the rows that are kept while cleaning (see
+AuditTrailAnalyzer.REMOVED_DESCRIPTIONS), e.g. the newest entry is the first row that's kept, the analysis never sees
+the others.
+
+The checks that make read_file/analyzeAuditTrail give up on an audit trail are errors, the others are warnings.
+
+Usage:
+    python AuditTrailValidator.py [names ...] [--workers 8] [--limit 20]
+writes the reports of all the audit trails in Participant_audit_trails (or just the named ones) to
+Analysis_output/Audit_Trail_Validation.json and prints a summary
+"""
+
+
+ERROR = "error"
+WARNING = "warning"
+
+# check name -> (severity, description of the problem)
+CHECKS = {
+    "header": (ERROR, "Header row doesn't have the expected columns"),
+    "fieldCount": (WARNING, "Row has a different number of fields than the header"),
+    "index": (ERROR, "Index doesn't continue from the row above (or the first index isn't 1)"),
+    "eventTime": (ERROR, "Event time isn't in the YYYY-MM-DD HH:MM:SS format"),
+    "timeOrder": (WARNING, "Event time is later than the row above (the export should be newest event first)"),
+    "openDocument": (WARNING, "Open document should be the oldest entry (last row), and only there"),
+    "closeDocument": (ERROR, "Close document should be the newest entry (first row), and only there"),
+    "closeDocumentMissing": (WARNING, "The newest entry (first row) isn't Close document"),
+}
+
+DEFAULT_REPORT = os.path.join("Analysis_output", "Audit_Trail_Validation.json")
+
+
+class ValidationReport(object):
+    """
+    All the problems found in one audit trail, check name -> array of the rows it failed on
+    """
+    def __init__(self, fileName, nRows=0):
+        self.fileName = fileName
+        self.nRows = nRows
+        self.problems = {}
+        # anything that went wrong reading the file at all (e.g. missing openpyxl)
+        self.readError = None
+
+    def add(self, check, rows=()):
+        """Records the rows (numbered from 1) that failed a check, nothing is recorded if there aren't any"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if check == "header" or len(rows):
+            self.problems[check] = rows
+
+    @property
+    def ok(self):
+        """True if nothing would stop the audit trail from being analyzed (warnings are allowed)"""
+        return self.readError is None and not any(CHECKS[check][0] == ERROR for check in self.problems)
+
+    def toDict(self, limit=None):
+        """json-able version of the report, with at most limit rows listed per check"""
+        return {"fileName": self.fileName,
+                "rows": self.nRows,
+                "ok": self.ok,
+                "readError": self.readError,
+                "problems": [{"check": check,
+                              "severity": CHECKS[check][0],
+                              "message": CHECKS[check][1],
+                              "count": len(rows),
+                              "rows": rows[:limit].tolist()}
+                             for check, rows in self.problems.items()]}
+
+    def describe(self, limit=10):
+        """Readable summary of the report, one line per failed check"""
+        if self.readError is not None:
+            return self.fileName + ": could not be read: " + self.readError
+        if not self.problems:
+            return self.fileName + ": OK (" + str(self.nRows) + " rows)"
+        lines = [self.fileName + ": " + ("OK with warnings" if self.ok else "FAILED") + " (" + str(self.nRows) +
+                 " rows)"]
+        for check, rows in self.problems.items():
+            severity, message = CHECKS[check]
+            line = "\t" + severity + " " + check + ": " + message
+            if len(rows):
+                line += " - " + str(len(rows)) + " rows: " + ", ".join(str(row) for row in rows[:limit].tolist())
+                if len(rows) > limit:
+                    line += ", ..."
+            lines.append(line)
+        return "\n".join(lines)
+
+
+def checkHeader(report, header):
+    """Checks the header row, returns False if the columns the other checks need aren't there"""
+    expected = COLUMN_NAMES[1:6]
+    if len(header) < 6 or [name.strip() for name in header[1:6]] != expected or \
+            header[0].strip() not in ("", COLUMN_NAMES[0]):
+        report.add("header")
+    return len(header) >= 6
+
+
+def checkColumns(report, index, indexValid, epochSeconds, timeValid, eventTypes, kept):
+    """
+    The column checks, all arrays are in file order (newest event first)
+    Args:
+        report: ValidationReport to add the problems to
+        index, indexValid: int array of the index column, and whether each entry was a number at all
+        epochSeconds, timeValid: int array of the event times (see AuditTrailTable.parseEventTimes) and whether
+                                 each one was in the right format
+        eventTypes: int array of the AuditTrailClassifier.EventType of each row
+        kept: bool array, False for the rows that are removed while cleaning
+    """
+    n = len(index)
+    rowNumbers = np.arange(1, n + 1)
+
+    # every index should be one more than the one above it, only the rows where that breaks are reported (a
+    # missing row would otherwise flag every row after it)
+    expectedIndex = np.empty(n, dtype=np.int64)
+    expectedIndex[:1] = 1
+    expectedIndex[1:] = index[:-1] + 1
+    report.add("index", rowNumbers[~indexValid | (index != expectedIndex)])
+
+    report.add("eventTime", rowNumbers[~timeValid & kept])
+    # newest first: going down the file the times can stay the same or go back, never forwards
+    laterThanAbove = np.zeros(n, dtype=bool)
+    laterThanAbove[1:] = timeValid[1:] & timeValid[:-1] & (epochSeconds[1:] > epochSeconds[:-1])
+    report.add("timeOrder", rowNumbers[laterThanAbove])
+
+    # the oldest/newest entries the analysis sees are the last/first rows kept while cleaning
+    keptRows = rowNumbers[kept]
+    if not len(keptRows):
+        return
+    isOpen = kept & (eventTypes == EventType.OPEN_DOCUMENT)
+    misplaced = isOpen & (rowNumbers != keptRows[-1])
+    if not isOpen[keptRows[-1] - 1]:
+        misplaced[keptRows[-1] - 1] = True
+    report.add("openDocument", rowNumbers[misplaced])
+    # analyzeAuditTrail only gives up on a Close document that isn't the newest entry, an audit trail without one is
+    # still analyzed
+    isClose = kept & (eventTypes == EventType.CLOSE_DOCUMENT)
+    report.add("closeDocument", rowNumbers[isClose & (rowNumbers != keptRows[0])])
+    if not isClose[keptRows[0] - 1]:
+        report.add("closeDocumentMissing", keptRows[:1])
+
+
+def classifyCategories(codes, descriptions):
+    """
+    EventType of every row, and whether it's kept while cleaning, from the description codes: each distinct
+    description is classified once
+    Returns (eventTypes, kept): int8 and bool arrays
+    """
+    eventTypes = np.array([defaultClassifier.classify(description)[0] for description in descriptions],
+                          dtype=np.int8)
+    kept = np.array([not any(removed in description for removed in REMOVED_DESCRIPTIONS)
+                     for description in descriptions], dtype=bool)
+    if len(eventTypes) == 0:
+        return np.zeros(len(codes), dtype=np.int8), np.ones(len(codes), dtype=bool)
+    return eventTypes[codes], kept[codes]
+
+
+def validateMapped(report, mapped):
+    """Checks a memory mapped csv with regular rows (see AuditTrailReader.MappedCsv), column by column"""
+    report.nRows = len(mapped)
+    if not checkHeader(report, mapped.header):
+        return
+    index, indexValid = mapped.integers(0)
+    chars, lengths = mapped.fixedWidth(1, 19)
+    epochSeconds, timeValid = parseEventTimeChars(chars, lengths == 19)
+    checkColumns(report, index, indexValid, epochSeconds, timeValid, *classifyCategories(*mapped.categories(5)))
+
+
+def validateRows(report, rows):
+    """Checks an audit trail given as rows (header first), e.g. an xlsx export or a csv with ragged rows"""
+    rows = iter(rows)
+    header = next(rows, [])
+    indexColumn = []
+    eventTimeColumn = []
+    descriptionCodes = []
+    lookup = {}
+    fieldCounts = []
+    for row in rows:
+        fieldCounts.append(len(row))
+        # missing fields are treated as blank
+        row = list(row) + [""] * (6 - len(row))
+        indexColumn.append(str(row[0]).strip())
+        eventTimeColumn.append(row[1])
+        descriptionCodes.append(lookup.setdefault(row[5], len(lookup)))
+
+    report.nRows = len(indexColumn)
+    rowNumbers = np.arange(1, len(indexColumn) + 1)
+    report.add("fieldCount", rowNumbers[np.array(fieldCounts, dtype=np.int64) != len(header)])
+    if not checkHeader(report, header):
+        return
+
+    indexStrings = np.array(indexColumn, dtype=str)
+    # plain digits only, like MappedCsv.integers
+    indexValid = np.array([text.isdigit() and text.isascii() for text in indexColumn], dtype=bool)
+    index = np.zeros(len(indexColumn), dtype=np.int64)
+    index[indexValid] = indexStrings[indexValid].astype(np.int64)
+
+    epochSeconds, badRows = parseEventTimeValues(eventTimeColumn)
+    timeValid = np.ones(len(eventTimeColumn), dtype=bool)
+    timeValid[badRows] = False
+    checkColumns(report, index, indexValid, epochSeconds, timeValid,
+                 *classifyCategories(np.array(descriptionCodes, dtype=np.int64), list(lookup)))
+
+
+def validateFile(filePathName):
+    """
+    Runs all the checks on one raw audit trail (csv or xlsx)
+    Returns a ValidationReport
+    """
+    report = ValidationReport(os.path.basename(filePathName))
+    try:
+        if os.path.splitext(filePathName)[1].lower() == ".xlsx":
+            validateRows(report, iterXlsxRows(filePathName))
+            return report
+        with MappedCsv(filePathName) as mapped:
+            if mapped.regular:
+                validateMapped(report, mapped)
+                return report
+        # some rows have a different number of fields, only the csv module can sort those out
+        with open(filePathName, "r", newline="") as csv_file:
+            validateRows(report, csv.reader(csv_file))
+    except Exception as error:
+        report.readError = type(error).__name__ + ": " + str(error)
+    return report
+
+
+def validateAuditTrails(names, workers=None, directory="Participant_audit_trails"):
+    """
+    Validates many audit trails across a pool of worker processes (in this process with workers=1)
+    Args:
+        names: audit trail file names (in directory)
+        workers: number of worker processes, defaults to the number of CPUs
+    Returns:
+        list of ValidationReport, in the same order as names
+    """
+    paths = [os.path.join(directory, name) for name in names]
+    if workers == 1:
+        return [validateFile(path) for path in paths]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(validateFile, paths, chunksize=8))
+
+
+def saveReports(reports, reportFileName=DEFAULT_REPORT, limit=None):
+    """Writes the reports out as one json file (at most limit rows listed per check)"""
+    with open(reportFileName, "w") as outFile:
+        json.dump([report.toDict(limit) for report in reports], outFile, indent=1)
+
+
+if __name__ == "__main__":
+    # the folder scan lives in the batch module, only imported here so the validator itself doesn't need it
+    from AuditTrailBatch import findAuditTrails
+    from AuditTrailCache import isCacheFile
+
+    parser = argparse.ArgumentParser(description="Check audit trails for problems and report all of them")
+    parser.add_argument("names", nargs="*", help="only check these audit trails (file names)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--limit", type=int, default=20, help="number of rows listed per problem in the summary")
+    args = parser.parse_args()
+
+    # the caches were built from audit trails that already passed the checks
+    names = [name for name in (args.names or findAuditTrails()) if not isCacheFile(name)]
+    reports = validateAuditTrails(names, args.workers)
+    saveReports(reports)
+    for report in reports:
+        print(report.describe(args.limit))
+    failed = sum(1 for report in reports if not report.ok)
+    print("\n" + str(len(reports) - failed) + " of " + str(len(reports)) + " audit trails passed, report saved to " +
+          DEFAULT_REPORT)
+    if failed:
+        sys.exit(1)
@@ -2,10 +2,7 @@ import sys
 
 import numpy as np
 from hmmlearn.hmm import MultinomialHMM
-import matplotlib.pyplot as plt
-from hmmviz import TransGraph
 import pandas as pd
-import seaborn as sns
 import pickle
 import os
 import json
@@ -366,6 +363,9 @@ if saveOrNot == "Y" or saveOrNot == "y":
     # Generate iterationsData figure and save in the "HMM_outputs" folder
     figFileName = "iterationsData" + selectedList + ".png"
     figFilePath = os.path.join(os.getcwd(), "HMM_outputs", figFileName)
+    # plotting libraries are only imported when a figure is actually made
+    import matplotlib.pyplot as plt
+    import seaborn as sns
     sns.set_theme(style="darkgrid")
     ax = sns.pointplot(x="nComponents", y="logLikelihood", data=iterationsData, ci=90)
     plt.savefig(figFilePath)
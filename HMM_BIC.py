@@ -1,10 +1,7 @@
 import sys
 import numpy as np
 from hmmlearn.hmm import MultinomialHMM
-import matplotlib.pyplot as plt
-from hmmviz import TransGraph
 import pandas as pd
-import seaborn as sns
 import pickle
 import os
 import json
@@ -47,6 +44,9 @@ allTask1CombinedLengths = [152, 242, 236, 258, 174, 234, 123, 90, 205, 154, 271,
 allTask2Combined = [[0, 0, 0, 3, 4, 3, 0, 0, 4, 3, 4, 3, 0, 4, 0, 3, 0, 0, 0, 4, 3, 0, 4, 3, 4, 0, 3, 4, 3, 4, 3, 4, 0, 3, 0, 4, 3, 0, 4, 0], [0, 3, 4, 3, 4, 3, 4, 0, 3, 4, 0, 3, 4, 0, 3, 4, 0, 3, 4, 3, 4, 3, 4, 3, 4, 0, 0, 0, 0, 3, 4, 5, 3, 4, 0, 0, 3, 0, 4, 0, 0, 3, 4, 0, 3, 4, 0, 0, 0, 0, 0, 3, 4, 3, 4, 3, 4, 1, 2, 3, 4, 0, 0, 0, 0, 0, 3, 4, 3, 4, 0], [0, 3, 4, 0, 0, 3, 4, 0, 3, 4, 3, 4, 3, 4, 0, 3, 4, 0, 3, 4, 0, 3, 4, 0, 6, 3, 4, 0, 3, 4, 0, 3, 4, 3, 4, 0, 3, 4, 3, 4, 0, 3, 4, 0, 3, 4, 0, 6, 0, 3, 4, 3, 4, 6, 3, 4, 0, 0, 3, 4, 0, 3, 4, 6, 0, 0, 0, 0, 3, 4, 3, 4, 3, 4, 0, 0, 3, 4, 1, 2, 0, 1, 2, 0, 1, 2, 1, 5, 3, 4, 0, 1, 2, 0, 1, 2], [0, 3, 0, 0, 0, 0, 4, 3, 4, 0, 3, 0, 0, 0, 0, 0, 0, 0, 4, 0, 3, 4, 3, 4, 3, 4, 3, 4, 0, 3, 0, 0, 4, 3, 4, 3, 4, 0, 3, 4, 0, 1, 2, 3, 4, 5, 3, 4, 3, 4, 3, 4, 5, 0, 5, 5, 1, 2, 0, 0, 3, 4, 0, 0, 3, 4, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 3, 4, 3, 4, 0, 3, 4, 0, 3, 4, 3, 4, 0, 3, 4, 3, 4, 0, 3, 4, 0, 3, 4, 3, 4, 0, 0, 0, 0, 0, 0, 0, 3, 4, 3, 4, 3, 4, 0, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 5, 3, 4, 0], [0, 0, 0, 3, 4, 0, 3, 0, 4, 3, 0, 4, 0, 3, 4, 0, 3, 4, 0, 0, 0, 3, 4, 0, 0, 3, 0, 4, 0, 3, 4, 0, 3, 4, 3, 4, 3, 4, 0, 0, 0, 3, 0, 4, 0, 3, 0, 4, 0, 3, 0, 0, 0, 0, 4, 3, 4, 3, 4, 3, 0, 4, 5, 3, 0, 4, 0, 0, 3, 0, 4, 0, 0, 0], [0, 3, 0, 4, 3, 4, 3, 0, 4, 0, 3, 4, 0, 3, 4, 0, 3, 4, 0, 3, 4, 0, 3, 0, 4, 3, 0, 4, 0, 3, 0, 4, 3, 4, 3, 4, 3, 0, 4, 3, 4, 0, 3, 0, 4, 3, 4, 3, 4, 5, 3, 4, 3, 4, 3, 4, 3, 4, 0, 3, 4, 3, 4, 0, 3, 0, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 0, 4, 0, 3, 4, 0, 0, 3, 4, 3, 0, 4, 3, 0, 0, 0, 4, 3, 4, 5, 1, 2, 3, 0, 4, 3, 0, 4, 3, 4, 3, 4, 0], [0, 3, 0, 0, 0, 0, 0, 4, 3, 4, 0, 3, 4, 0, 3, 0, 4, 0, 3, 4, 0, 3, 0, 4, 3, 4, 3, 4, 0, 3, 4, 0, 3, 0, 4, 3, 4, 1, 0, 2, 0, 0, 0, 0, 3, 4, 0, 3, 4, 3, 4, 0, 3, 4, 0, 3, 4, 3, 4, 3, 4, 3, 4, 0], [0, 0, 6, 6, 6, 1, 2, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 1, 2, 1, 2, 3, 4, 6, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 1, 2, 3, 4, 3, 4, 1, 2, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 1, 2, 3, 4, 5], [0, 3, 4, 0, 3, 4, 0, 3, 4, 0, 3, 0, 4, 0, 3, 4, 0, 0, 3, 4, 3, 0, 0, 4, 5, 0, 3, 4, 0, 3, 4, 0, 3, 4, 0, 1, 1, 2, 2, 6, 0, 0, 0, 3, 4, 3, 4, 0, 3, 4, 3, 4, 3, 4, 0, 0, 3, 0, 4, 0, 0, 0], [0, 3, 0, 0, 0, 0, 0, 4, 0, 0, 0, 0, 0, 3, 0, 4, 0, 3, 4, 0, 3, 0, 4, 0, 3, 4, 3, 0, 4, 3, 4, 0, 3, 4, 3, 4, 3, 4, 0, 0, 3, 4, 3, 4, 5, 3, 4, 3, 4, 0, 0, 3, 0, 4, 3, 4, 3, 4, 0], [0, 3, 4, 3, 4, 3, 4, 3, 4, 0, 3, 4, 3, 4, 3, 4, 0, 0, 0, 1, 0, 0, 2, 5, 1, 2, 3, 4, 3, 4, 5, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 0, 5, 3, 4, 1, 2, 1, 2, 6, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 0, 3, 4, 0, 3, 4, 3, 4, 6, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 0, 3, 4, 3, 4, 0, 3, 4, 3, 4], [0, 0, 3, 4, 3, 4, 3, 4, 3, 0, 4, 3, 4, 3, 4, 3, 4, 3, 4, 0, 3, 4, 0, 3, 4, 0], [0, 0, 3, 0, 0, 0, 0, 0, 0, 0, 0, 4, 0, 3, 4, 3, 4, 3, 4, 0, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 3, 0, 4, 0, 0, 3, 0, 4, 0, 3, 0, 4, 0], [0, 3, 0, 0, 0, 0, 0, 4, 3, 4, 3, 0, 4, 3, 4, 0, 3, 4, 0, 3, 0, 0, 0, 4, 3, 4, 0, 3, 4, 3, 4, 0, 3, 4, 0, 0, 3, 4, 3, 4, 3, 0, 4, 3, 4, 5, 5, 0, 3, 4, 3, 0, 4, 3, 4, 3, 4, 0, 3, 4], [0, 3, 4, 0, 3, 4, 0, 3, 0, 0, 0, 0, 0, 4, 0, 0, 3, 4, 3, 4, 3, 4, 3, 0, 4, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 3, 0, 4, 0, 3, 0, 0, 4, 3, 4, 0, 3, 4, 0, 3, 4, 3, 4, 3, 4, 0, 0, 3, 4, 3, 4, 3, 4, 3, 4, 3, 4, 0, 3, 4, 0, 3, 0, 4, 0, 0, 0, 3, 4], [0, 3, 4, 0, 0, 3, 4, 3, 4, 0, 3, 4, 0, 3, 4, 0, 3, 4, 0, 0, 3, 4, 0, 3, 4, 0, 0], [0, 3, 4, 0, 3, 4, 3, 4, 3, 4, 0, 3, 4, 3, 4, 0, 3, 4, 3, 4, 3, 0, 4, 0, 0, 3, 4, 0, 0, 3, 0, 4, 3, 4, 0, 3, 4, 3, 4, 3, 4, 3, 4, 0, 3, 4, 3, 4, 0, 3, 4, 0, 3, 4, 1, 2, 0, 3, 4, 0], [0, 3, 4, 0, 0, 0, 0, 3, 4, 3, 4, 0, 3, 4, 3, 0, 4, 0, 0, 3, 0, 0, 0, 4, 3, 4, 3, 4, 1, 2, 3, 4, 5, 3, 4, 3, 4, 3, 4, 0, 3, 0, 4, 0, 3, 4, 0, 3, 0, 4, 3, 4, 0, 0, 3, 0, 4, 0, 0, 0], [0, 3, 4, 3, 0, 4, 0, 3, 4, 0, 3, 4, 3, 0, 4, 0, 3, 4, 0, 3, 0, 4, 3, 4, 0, 3, 0, 0, 0, 4, 0, 3, 4, 3, 4, 0, 0, 0, 3, 4, 3, 0, 4, 0, 3, 4, 0]]
 allTask2CombinedLengths = [40, 71, 96, 129, 74, 121, 64, 81, 62, 59, 117, 26, 53, 60, 80, 27, 60, 60, 47]
 
+# --no-plots: skip the BIC figure at the end (and never import matplotlib/seaborn), e.g. when running headless
+plots = "--no-plots" not in sys.argv[1:]
+
 selectedList = input("Select list to analyze: ")
 # 1: combined task 1
 # 2: combined task 2
@@ -219,9 +219,13 @@ print("#########################################")
 iterationsDataName = "./HMM_Outputs/iterationsData" + str(selectedList) + ".csv"
 json = iterationsData.to_csv(iterationsDataName)
 
-figFileName = "iterationsData" + selectedList + "_BIC.png"
-figFilePath = os.path.join(os.getcwd(), "HMM_outputs", figFileName)
-sns.set_theme(style="darkgrid")
-ax = sns.pointplot(x="nComponents", y="logLikelihood", data=iterationsData, ci=90)
-plt.savefig(figFilePath)
-plt.show()
\ No newline at end of file
+if plots:
+    # plotting libraries are only imported when a figure is actually made
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    figFileName = "iterationsData" + selectedList + "_BIC.png"
+    figFilePath = os.path.join(os.getcwd(), "HMM_outputs", figFileName)
+    sns.set_theme(style="darkgrid")
+    ax = sns.pointplot(x="nComponents", y="logLikelihood", data=iterationsData, ci=90)
+    plt.savefig(figFilePath)
+    plt.show()
\ No newline at end of file
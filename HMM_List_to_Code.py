@@ -5,6 +5,17 @@ import numpy as np
 import json
 #sys.path.append("Analysis_output")
 
+"""
+Codes the HMM lists of the analyzed audit trails into numbers for the HMM scripts.
+
+By default the lists are read from the _HMM_StartEnd.json outputs in Analysis_output. With --from-cache they're taken
+from the cached event tables next to the audit trails instead (Participant_audit_trails/*.trail.npz, see
+AuditTrailCache), which hold the HMM sequence of the last analysis, so no json/csv has to be parsed at all.
+
+Usage:
+    python HMM_List_to_Code.py [--from-cache]
+"""
+
 
 expertIDs = ["01", "04", "05", "06", "09", "10", "11", "13", "14", "19"]
 intermediateIDs = ["02", "03", "07", "08", "12", "15", "16", "17", "18"]
@@ -39,14 +50,16 @@ all_task1_startEnd = []
 all_task2_startEnd = []
 
 
-def codeHMM(fileName):
+def codeHMM(fileName, data=None):
     # to store the coded series
     codedSeries = []
 
-    filepath = os.path.join(os.getcwd(), "Analysis_output", fileName)
+    # data is the list itself if it didn't come from the json file (see loadCachedStartEnd)
     print(fileName)
-    with open(filepath, "r") as jsonFile:
-        data = json.load(jsonFile)
+    if data is None:
+        filepath = os.path.join(os.getcwd(), "Analysis_output", fileName)
+        with open(filepath, "r") as jsonFile:
+            data = json.load(jsonFile)
     if "List" in fileName:
         for entry in data:
             if entry == "Drawing":
@@ -123,19 +136,43 @@ def codeHMM(fileName):
 
 
 
-for root,dirs,files in os.walk("Analysis_output"):
-    for name in files:
-        #print(os.path.join(root, name))
-        if "cleaned_HMM_List" in name:
-            #print("\n########################################################")
-            #print("Opening and analyzing: " + name)
-            #print(name)
-            #codeHMM(name)
-            pass
-
-        if "cleaned_HMM_StartEnd" in name:
-            #print(name)
-            codeHMM(name)
+def loadCachedStartEnd(directory="Participant_audit_trails"):
+    """
+    Codes the HMM start/end lists straight from the audit trail caches (see AuditTrailCache), the caches left from an
+    older version of the analysis are skipped
+    """
+    # only imported when needed, the json route doesn't need any of the analysis code
+    from AuditTrailAnalyzer import ANALYZER_VERSION, startEndSequence
+    from AuditTrailCache import isCacheFile, baseName, loadTrail
+
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            if not isCacheFile(name):
+                continue
+            trail, metadata = loadTrail(os.path.join(root, name))
+            if metadata["analyzerVersion"] != ANALYZER_VERSION:
+                print("Cache not analyzed with the current version, run AuditTrailAnalyzer.py first: " + name)
+                continue
+            # same name as the json output so the participant ID/task are picked out the same way
+            codeHMM(baseName(name) + "_cleaned_HMM_StartEnd.json", startEndSequence(trail.hmmSequence))
+
+
+if "--from-cache" in sys.argv[1:]:
+    loadCachedStartEnd()
+else:
+    for root,dirs,files in os.walk("Analysis_output"):
+        for name in files:
+            #print(os.path.join(root, name))
+            if "cleaned_HMM_List" in name:
+                #print("\n########################################################")
+                #print("Opening and analyzing: " + name)
+                #print(name)
+                #codeHMM(name)
+                pass
+
+            if "cleaned_HMM_StartEnd" in name:
+                #print(name)
+                codeHMM(name)
 
 
 jsonFileName = os.path.join(os.getcwd(), "Analysis_output", "HMMdatabase.json")
@@ -2,9 +2,7 @@ import seaborn as sns
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-from hmmlearn.hmm import MultinomialHMM
 import os
-from hmmviz import TransGraph
 
 
 class HMM_model(object):
@@ -173,6 +171,8 @@ plt.show()
 """
 ##### For drawing the transition diagrams ####
 # https://pypi.org/project/hmmviz/
+# hmmviz is only needed for this diagram, so it's imported here rather than at the top
+from hmmviz import TransGraph
 
 
 
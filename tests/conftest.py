@@ -0,0 +1,30 @@
+import os
+import sys
+
+# the modules live at the root of the project folder
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+"""
+Shared setup for the tests: the EXAMPLE audit trails in Participant_audit_trails are what the behavior of the
+analysis is checked against, the reference implementations in the tests are the code the optimized versions replaced.
+"""
+
+
+EXAMPLE_TRAILS = ["EXAMPLE_Task1.csv", "EXAMPLE_Task2.csv"]
+
+
+def examplePath(fileName):
+    """Path of an audit trail in Participant_audit_trails"""
+    return os.path.join(ROOT, "Participant_audit_trails", fileName)
+
+
+def loadExample(fileName):
+    """The cleaned AuditTrail table of an EXAMPLE audit trail, read the way read_file reads a csv row by row"""
+    import csv
+    from AuditTrailAnalyzer import cleanRows
+    from AuditTrailTable import AuditTrail
+
+    with open(examplePath(fileName), "r", newline="") as csv_file:
+        return AuditTrail.fromRows(cleanRows(csv.reader(csv_file)))
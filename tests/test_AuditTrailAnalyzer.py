@@ -0,0 +1,91 @@
+import io
+import json
+import datetime
+import contextlib
+import pytest
+
+from conftest import EXAMPLE_TRAILS, loadExample
+from AuditTrailAnalyzer import analyzeAuditTrail, cleanRows
+from AuditTrailTable import AuditTrail
+from AuditTrailDatabase import toSeconds
+from AuditTrailSynthetic import syntheticRows
+
+"""
+The database row of analyzeAuditTrail (totals and counters summed in one grouped reduction over the spans, see
+AuditTrailTimeseries.categoryTotals) against the per category running totals it used to keep.
+"""
+
+
+def seconds(value):
+    return datetime.timedelta(seconds=value)
+
+
+# the rows the running totals gave for the EXAMPLE audit trails (Analysis_output/Audit_Trail_Database.csv)
+EXPECTED_ROWS = {
+    "EXAMPLE_Task1.csv": ["EXAMPLE_Task1_cleaned", seconds(2139), seconds(1529), seconds(1526), seconds(3),
+                          seconds(607), seconds(943), seconds(378), seconds(105), seconds(26), seconds(69),
+                          seconds(5), 0.2, "Counters ->", 10, 17, 5, 7, 4, 59, 2, 10, 1, 1, 8, 6, 0],
+    "EXAMPLE_Task2.csv": ["EXAMPLE_Task2_cleaned", seconds(283), seconds(172), seconds(124), seconds(48),
+                          seconds(109), seconds(0), seconds(0), seconds(94), seconds(26), seconds(0), seconds(4),
+                          27.91, "Counters ->", 0, 0, 3, 5, 5, 16, 0, 0, 0, 0, 0, 0, 0],
+}
+
+# time series label (before " - feature name") -> (row column of its total time or None, row columns it counts in),
+# the way the running totals were added up in analyzeAuditTrail
+RUNNING_TOTALS = {
+    "readDrawingTime": (5, [19]),
+    "sketchCreateTime": (6, [14]),
+    "featureCreateTime": (7, [15]),
+    "sketchEditTime": (8, [17]),
+    "featureEditTime": (9, [18]),
+    "cancelCreateTime": (10, [16]),
+    "cancelledEditTime": (11, [16]),
+    "partstudioTime": (2, []),
+    "moveFeature": (None, [20]),
+    "moveRollbackBar": (None, [21]),
+    "undoRedo": (None, [22]),
+    "createFolder": (None, [23]),
+    "renameFeature": (None, [24]),
+    "showHide": (None, [25]),
+    "deletedFeature": (None, [26]),
+}
+
+
+def analyze(name, trail):
+    """(database row, time series) of a cleaned table, nothing is written to disk"""
+    outputs = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        rowEntry = analyzeAuditTrail(name + "_cleaned.csv", trail, writeCleaned=False, saveToDatabase=False,
+                                     plots=False, outputs=outputs)
+    timeSeries = json.loads(outputs[name + "_cleaned_timeseries.json"])
+    return rowEntry, timeSeries
+
+
+def runningTotals(timeSeries):
+    """The time totals and counters of the database row, added up one time series entry at a time"""
+    totals = {column: datetime.timedelta(0) for column, counted in RUNNING_TOTALS.values() if column is not None}
+    counts = {column: 0 for total, counted in RUNNING_TOTALS.values() for column in counted}
+    for label, start, duration in timeSeries:
+        total, counted = RUNNING_TOTALS[label.split(" - ")[0]]
+        if total is not None:
+            totals[total] += datetime.timedelta(seconds=toSeconds(duration))
+        for column in counted:
+            counts[column] += 1
+    return totals, counts
+
+
+@pytest.mark.parametrize("fileName", EXAMPLE_TRAILS)
+def test_database_row_matches_running_totals_on_examples(fileName):
+    rowEntry, timeSeries = analyze(fileName[:-len(".csv")], loadExample(fileName))
+    assert rowEntry == EXPECTED_ROWS[fileName]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_database_row_matches_running_totals_on_synthetic_trails(seed):
+    trail = AuditTrail.fromRows(cleanRows(syntheticRows(3000, seed)))
+    rowEntry, timeSeries = analyze("SYNTH_" + str(seed), trail)
+    totals, counts = runningTotals(timeSeries)
+    for column, total in totals.items():
+        assert rowEntry[column] == total, column
+    for column, count in counts.items():
+        assert rowEntry[column] == count, column
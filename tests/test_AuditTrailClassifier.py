@@ -0,0 +1,118 @@
+import pytest
+
+from conftest import EXAMPLE_TRAILS, loadExample
+from AuditTrailClassifier import EventType, DescriptionClassifier, defaultClassifier
+from AuditTrailSynthetic import syntheticRows
+
+"""
+The compiled rule table (DescriptionClassifier) against the elif chain analyzeAuditTrail used to classify every entry
+with, the first matching rule has to give the same event type as the first matching branch did.
+"""
+
+
+def elifChainEventType(description):
+    """Event type of a description, checked in the order of the elif chain the rule table replaced"""
+    if description == "Add part studio feature":
+        return EventType.ADD_FEATURE
+    elif description == "Start edit of part studio feature":
+        return EventType.START_EDIT
+    elif "BLOB opened" in description:
+        return EventType.DRAWING_OPENED
+    elif "PARTSTUDIO opened" in description:
+        return EventType.PARTSTUDIO_OPENED
+    elif "Move" in description:
+        if "Rollback bar" in description:
+            return EventType.MOVE_ROLLBACK_BAR
+        elif "tab" in description:
+            return EventType.MOVE_TAB
+        else:
+            return EventType.MOVE_FEATURE
+    elif "Undo Redo" in description:
+        return EventType.UNDO_REDO
+    elif "Create folder" in description:
+        return EventType.CREATE_FOLDER
+    elif "Rename" in description:
+        return EventType.RENAME
+    elif "Show" in description or "Hide" in description:
+        return EventType.SHOW_HIDE
+    elif "Add or modify a sketch" in description:
+        return EventType.SKETCH
+    elif "Delete" in description:
+        return EventType.DELETE
+    elif "Close document" in description:
+        return EventType.CLOSE_DOCUMENT
+    elif "Open document" in description:
+        return EventType.OPEN_DOCUMENT
+    elif "Edit" in description or \
+            "Insert feature" in description or \
+            "Cancel Operation" in description or \
+            "Create Version" in description or \
+            "Change size" in description or \
+            "Change part appearance" in description or \
+            "Branch Workspace" in description or \
+            "Suppress" in description or \
+            "Unsuppress" in description or \
+            "Unpack" in description or \
+            "Create variable" in description or \
+            "Insert tab" in description or \
+            "BLOB closed" in description or \
+            "PARTSTUDIO closed" in description or \
+            "Update version" in description or \
+            "Create version" in description or \
+            "Undo : " in description or \
+            "Redo : " in description or \
+            "Tab Part Studio 1 Copy 1 of type PARTSTUDIO created by CAD_Study" in description:
+        return EventType.ACCOUNTED_FOR
+    else:
+        return EventType.UNACCOUNTED
+
+
+# descriptions that match more than one branch, the earlier branch has to win
+OVERLAPPING_DESCRIPTIONS = [
+    "Move Rollback bar",
+    "Move tab Drawing 1",
+    "Move feature : Extrude 1",
+    "Move : Show sketch",
+    "Undo Redo : Delete Extrude 1",
+    "Rename : Edit folder",
+    "Show : Sketch 1",
+    "Hide : Delete me",
+    "Add or modify a sketch : Delete constraint",
+    "Delete : Close document",
+    "Edit : Open document",
+    "Edit : Insert feature",
+    "Tab Drawing 1 of type BLOB opened by CAD_Study : Move",
+    "Tab Part Studio 1 of type PARTSTUDIO opened by CAD_Study",
+    "Add part studio feature ",
+    "Start edit of part studio feature : Move",
+    "Unsuppress : Extrude 1",
+    "Redo : Extrude 1",
+    "Something new",
+    "",
+]
+
+
+@pytest.mark.parametrize("fileName", EXAMPLE_TRAILS)
+def test_rule_table_matches_elif_chain_on_examples(fileName):
+    classifier = DescriptionClassifier()
+    for description in loadExample(fileName).descriptions:
+        assert classifier.classify(description)[0] == elifChainEventType(description), description
+
+
+def test_rule_table_matches_elif_chain_on_synthetic_descriptions():
+    classifier = DescriptionClassifier()
+    for description in set(row[5] for row in syntheticRows(5000, seed=3)):
+        assert classifier.classify(description)[0] == elifChainEventType(description), description
+
+
+@pytest.mark.parametrize("description", OVERLAPPING_DESCRIPTIONS)
+def test_rule_order_matches_elif_chain(description):
+    assert DescriptionClassifier().classify(description)[0] == elifChainEventType(description)
+
+
+@pytest.mark.parametrize("fileName", EXAMPLE_TRAILS)
+def test_classifyTrail_spreads_the_classification_to_every_row(fileName):
+    trail = loadExample(fileName)
+    eventTypes, markers = defaultClassifier.classifyTrail(trail)
+    expected = [elifChainEventType(trail.descriptions[code]) for code in trail.descriptionCodes.tolist()]
+    assert eventTypes.tolist() == expected
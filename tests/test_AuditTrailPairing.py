@@ -0,0 +1,109 @@
+import pytest
+
+from conftest import EXAMPLE_TRAILS, loadExample
+from AuditTrailAnalyzer import cleanRows
+from AuditTrailTable import AuditTrail
+from AuditTrailPairing import SpanPairer, pairSpans
+from AuditTrailClassifier import defaultClassifier
+from AuditTrailSynthetic import syntheticRows
+
+"""
+pairSpans/SpanPairer against the forward searches analyzeAuditTrail used to do for every span start entry.
+"""
+
+
+def forwardScanEnds(description, tab):
+    """
+    End position of every span start (-1 where there isn't one), found the way analyzeAuditTrail did before the
+    single pass pairing: each start searches forwards through the rest of the audit trail, skipping the "Insert
+    feature"/"Edit : XXX" entries already matched to an earlier start
+    """
+    lastPosition = len(description) - 1
+    ends = [-1] * len(description)
+    insertFeatureIndices = []
+    editFeatureIndices = []
+    for i in range(len(description)):
+        featureStartIndex = i
+        if description[i] == "Add part studio feature":
+            while featureStartIndex < lastPosition:
+                featureStartIndex += 1
+                if "Insert feature" in description[featureStartIndex] and \
+                        featureStartIndex not in insertFeatureIndices:
+                    insertFeatureIndices.append(featureStartIndex)
+                    ends[i] = featureStartIndex
+                    break
+                if "Cancel Operation" in description[featureStartIndex]:
+                    ends[i] = featureStartIndex
+                    break
+
+        elif description[i] == "Start edit of part studio feature":
+            while featureStartIndex < lastPosition:
+                featureStartIndex += 1
+                if "Edit :" in description[featureStartIndex]:
+                    if featureStartIndex not in editFeatureIndices:
+                        editFeatureIndices.append(featureStartIndex)
+                        ends[i] = featureStartIndex
+                        break
+                elif "Add or modify a sketch" in description[featureStartIndex] or \
+                        "Start edit of part studio feature" in description[featureStartIndex] or \
+                        "Add part studio feature" in description[featureStartIndex]:
+                    editFeatureIndices.append(featureStartIndex)
+                    ends[i] = featureStartIndex
+                    break
+                elif "Cancel Operation" in description[featureStartIndex]:
+                    ends[i] = featureStartIndex
+                    break
+
+        elif "BLOB opened" in description[i]:
+            while featureStartIndex < lastPosition:
+                featureStartIndex += 1
+                if "BLOB closed" in description[featureStartIndex] and tab[featureStartIndex] == tab[i]:
+                    ends[i] = featureStartIndex
+                    break
+
+        elif "PARTSTUDIO opened" in description[i]:
+            while featureStartIndex < lastPosition:
+                featureStartIndex += 1
+                if "PARTSTUDIO closed" in description[featureStartIndex]:
+                    ends[i] = featureStartIndex
+                    break
+    return ends
+
+
+def columns(trail):
+    """description and tab of every entry of a table, in chronological order"""
+    description = [trail.descriptions[code] for code in trail.descriptionCodes.tolist()]
+    tab = [trail.tabs[code] for code in trail.tabCodes.tolist()]
+    return description, tab
+
+
+def syntheticTrail(nEvents, seed):
+    return AuditTrail.fromRows(cleanRows(syntheticRows(nEvents, seed)))
+
+
+@pytest.mark.parametrize("fileName", EXAMPLE_TRAILS)
+def test_pairSpans_matches_forward_scan_on_examples(fileName):
+    trail = loadExample(fileName)
+    ends = pairSpans(trail, *defaultClassifier.classifyTrail(trail))
+    assert ends.tolist() == forwardScanEnds(*columns(trail))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_pairSpans_matches_forward_scan_on_synthetic_trails(seed):
+    trail = syntheticTrail(2000, seed)
+    ends = pairSpans(trail, *defaultClassifier.classifyTrail(trail))
+    assert ends.tolist() == forwardScanEnds(*columns(trail))
+
+
+@pytest.mark.parametrize("fileName", EXAMPLE_TRAILS)
+def test_spanPairer_fed_in_batches_matches_pairSpans(fileName):
+    # the live mode pushes the entries as they come in, the pending starts carry over between batches
+    trail = loadExample(fileName)
+    eventTypes, markers = defaultClassifier.classifyTrail(trail)
+    pairer = SpanPairer()
+    entries = list(zip(eventTypes.tolist(), markers.tolist(), trail.tabCodes.tolist()))
+    for start in range(0, len(entries), 7):
+        for eventType, markerFlags, tabCode in entries[start:start + 7]:
+            pairer.push(eventType, markerFlags, tabCode)
+        assert all(pairer.ends[position] == -1 for position in pairer.pending())
+    assert pairer.ends == pairSpans(trail, eventTypes, markers).tolist()